@@ -3,6 +3,7 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
 from django.http import HttpResponse
+from django.db.models import Prefetch
 import csv
 import json
 from io import StringIO
@@ -13,7 +14,7 @@ class ExportCSVAPI(APIView):
     """Экспорт данных конкретного вопроса в CSV"""
 
     def get(self, request, question_id):
-        question = get_object_or_404(Question, pk=question_id)
+        question = get_object_or_404(Question.objects.with_live_total_votes(), pk=question_id)
 
         # Создаем CSV в памяти
         output = StringIO()
@@ -23,16 +24,16 @@ class ExportCSVAPI(APIView):
         writer.writerow(['Опрос', 'Вопрос', 'Вариант ответа', 'Голоса', 'Процент'])
 
         # Данные
-        choices = question.choice_set.all()
-        total_votes = sum(c.votes for c in choices)
+        choices = question.choice_set.with_live_votes()
+        total_votes = question.live_total_votes
 
         for choice in choices:
-            percentage = (choice.votes / total_votes * 100) if total_votes > 0 else 0
+            percentage = (choice.live_votes / total_votes * 100) if total_votes > 0 else 0
             writer.writerow([
                 question.id,
                 question.question_text,
                 choice.choice_text,
-                choice.votes,
+                choice.live_votes,
                 f'{percentage:.2f}%'
             ])
 
@@ -46,10 +47,10 @@ class ExportJSONAPI(APIView):
     """Экспорт данных конкретного вопроса в JSON"""
 
     def get(self, request, question_id):
-        question = get_object_or_404(Question, pk=question_id)
+        question = get_object_or_404(Question.objects.with_live_total_votes(), pk=question_id)
 
-        choices = question.choice_set.all()
-        total_votes = sum(c.votes for c in choices)
+        choices = question.choice_set.with_live_votes()
+        total_votes = question.live_total_votes
 
         data = {
             'question_id': question.id,
@@ -59,8 +60,8 @@ class ExportJSONAPI(APIView):
             'choices': [
                 {
                     'choice_text': c.choice_text,
-                    'votes': c.votes,
-                    'percentage': (c.votes / total_votes * 100) if total_votes > 0 else 0
+                    'votes': c.live_votes,
+                    'percentage': (c.live_votes / total_votes * 100) if total_votes > 0 else 0
                 }
                 for c in choices
             ]
@@ -78,12 +79,14 @@ class ExportAllJSONAPI(APIView):
     """Экспорт всех вопросов в JSON"""
 
     def get(self, request):
-        questions = Question.objects.all().prefetch_related('choice_set')
+        questions = Question.objects.with_live_total_votes().prefetch_related(
+            Prefetch('choice_set', queryset=Choice.objects.with_live_votes())
+        )
 
         data = []
         for question in questions:
             choices = question.choice_set.all()
-            total_votes = sum(c.votes for c in choices)
+            total_votes = question.live_total_votes
 
             question_data = {
                 'id': question.id,
@@ -93,8 +96,8 @@ class ExportAllJSONAPI(APIView):
                 'choices': [
                     {
                         'choice_text': c.choice_text,
-                        'votes': c.votes,
-                        'percentage': (c.votes / total_votes * 100) if total_votes > 0 else 0
+                        'votes': c.live_votes,
+                        'percentage': (c.live_votes / total_votes * 100) if total_votes > 0 else 0
                     }
                     for c in choices
                 ]
@@ -122,20 +125,22 @@ class ExportAllCSVAPI(APIView):
             'Вариант ответа', 'Голоса', 'Процент', 'Всего голосов'
         ])
 
-        questions = Question.objects.all().prefetch_related('choice_set')
+        questions = Question.objects.with_live_total_votes().prefetch_related(
+            Prefetch('choice_set', queryset=Choice.objects.with_live_votes())
+        )
 
         for question in questions:
             choices = question.choice_set.all()
-            total_votes = sum(c.votes for c in choices)
+            total_votes = question.live_total_votes
 
             for choice in choices:
-                percentage = (choice.votes / total_votes * 100) if total_votes > 0 else 0
+                percentage = (choice.live_votes / total_votes * 100) if total_votes > 0 else 0
                 writer.writerow([
                     question.id,
                     question.question_text,
                     question.pub_date.strftime('%Y-%m-%d %H:%M'),
                     choice.choice_text,
-                    choice.votes,
+                    choice.live_votes,
                     f'{percentage:.2f}%',
                     total_votes
                 ])
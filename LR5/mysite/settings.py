@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/dev/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -28,6 +29,10 @@ DEBUG = True
 
 ALLOWED_HOSTS = []
 
+# `manage.py test`: background flusher threads would write to the test
+# database outside each test's transaction, so they stay off.
+TESTING = sys.argv[1:2] == ['test']
+
 
 # Application definition
 
@@ -49,6 +54,7 @@ INSTALLED_APPS = [
     'corsheaders',
     'stats_service',
     'export_service',
+    'vote_service',
 ]
 
 SITE_ID = 1
@@ -169,4 +175,179 @@ SOCIALACCOUNT_PROVIDERS = {
         },
         'OAUTH_PKCE_ENABLED': True,
     }
-}
\ No newline at end of file
+}
+
+# Polls vote counters
+# Number of counter slots each choice's votes are spread over. 1 writes
+# straight to Choice.votes; with more, run `manage.py rollup_vote_shards`
+# periodically to fold the slots back in.
+POLLS_VOTE_SHARDS = int(os.environ.get('POLLS_VOTE_SHARDS', 1))
+
+# Write-behind vote buffer: votes are collapsed per choice in memory and
+# flushed every FLUSH_INTERVAL_MS or FLUSH_MAX_VOTES votes. Results lag by
+# up to one interval. SPILL_FILE makes pending votes survive a crash: each
+# process takes a free slot (SPILL_FILE, SPILL_FILE-1, ...) and replays the
+# slots of dead ones at startup. FLUSH_ON_SHUTDOWN writes them on a clean
+# exit.
+POLLS_VOTE_BUFFER = {
+    'ENABLED': os.environ.get('POLLS_VOTE_BUFFER') == '1',
+    'FLUSH_INTERVAL_MS': 200,
+    'FLUSH_MAX_VOTES': 500,
+    'FLUSH_ON_SHUTDOWN': True,
+    'SPILL_FILE': os.environ.get('POLLS_VOTE_SPILL_FILE'),
+}
+
+# Serve the polls index/detail/results/vote pages with the native async
+# views (polls.async_views). Enable when running under ASGI.
+POLLS_ASYNC_VIEWS = os.environ.get('POLLS_ASYNC_VIEWS') == '1'
+
+# Largest batch accepted by the batch vote API (/api/polls/votes/batch/).
+POLLS_VOTE_BATCH_MAX = 5000
+
+# Idempotency keys of vote submissions: recently seen keys are kept in a
+# per-process cache of at most MAX_KEYS entries (EVICTION 'lru' or
+# 'fifo'), backed by the IdempotencyKey table. A key only matches a retry
+# by the same user on the same question. Keys expire after TTL_SECONDS;
+# prune the table with `manage.py prune_idempotency_keys`.
+POLLS_IDEMPOTENCY = {
+    'MAX_KEYS': 10000,
+    'TTL_SECONDS': 24 * 60 * 60,
+    'EVICTION': 'lru',
+}
+
+# Append-only binary log of accepted votes (see polls/eventlog.py). A new
+# segment starts every SEGMENT_BYTES; FSYNC is 'always', 'interval' (every
+# FSYNC_INTERVAL_MS) or 'never'. `manage.py snapshot_vote_log` snapshots
+# and compacts, keeping KEEP_SNAPSHOTS snapshots; `manage.py
+# rebuild_votes_from_log [--until ...]` restores the counters.
+POLLS_VOTE_LOG = {
+    'ENABLED': os.environ.get('POLLS_VOTE_LOG') == '1',
+    'DIR': BASE_DIR / 'vote_log',
+    'SEGMENT_BYTES': 64 * 1024 * 1024,
+    'FSYNC': 'interval',
+    'FSYNC_INTERVAL_MS': 1000,
+    'KEEP_SNAPSHOTS': 3,
+}
+
+# Cache of the latest questions on the polls index, dropped on every
+# Question save/delete. With the default per-process local-memory cache,
+# other workers see a change after at most TIMEOUT seconds; point CACHE at
+# a shared backend to make invalidation immediate everywhere.
+POLLS_INDEX_CACHE = {
+    'ENABLED': True,
+    'CACHE': 'default',
+    'TIMEOUT': 300,
+}
+
+# Questions per page of the cursor-paginated listing (polls/archive/ and
+# /api/polls/questions/).
+POLLS_QUESTION_PAGE_SIZE = 20
+
+# Full-text search over question and choice text (SQLite FTS5 table
+# polls_question_search, kept in sync by triggers). LIMIT is the default
+# number of results of polls/search/ and /api/polls/questions/search/;
+# admin search shows the best ADMIN_LIMIT matches. Rebuild the index with
+# `manage.py rebuild_question_search`.
+POLLS_SEARCH = {
+    'LIMIT': 20,
+    'ADMIN_LIMIT': 500,
+}
+
+# Leaderboards of the K most popular questions (by total votes) and the K
+# trending ones (votes decayed with a half-life of
+# TRENDING_HALF_LIFE_SECONDS), kept per process from the votes and written
+# to the LeaderboardEntry table at most every FLUSH_INTERVAL_SECONDS, by
+# the next vote or read and, with FLUSH_IN_BACKGROUND, by a thread.
+# Rebuild them with `manage.py rebuild_leaderboards`.
+POLLS_LEADERBOARD = {
+    'K': 10,
+    'TRENDING_HALF_LIFE_SECONDS': 6 * 60 * 60,
+    'FLUSH_INTERVAL_SECONDS': 5,
+    'FLUSH_IN_BACKGROUND': not TESTING,
+}
+
+# Disk cache of rendered charts (stats_service/chart_cache.py), shared by
+# all processes. Least recently read files are removed once the directory
+# grows past MAX_BYTES.
+STATS_CHART_CACHE = {
+    'ENABLED': True,
+    'DIR': BASE_DIR / 'chart_cache',
+    'MAX_BYTES': 256 * 1024 * 1024,
+}
+
+# Render charts in a pool of long-lived, pre-warmed worker processes
+# (stats_service/render_pool.py) instead of the request thread. At most
+# WORKERS charts render at once and MAX_QUEUE more wait; further requests
+# get 503 with Retry-After, as do jobs that exceed TIMEOUT_SECONDS.
+STATS_RENDER_POOL = {
+    'ENABLED': os.environ.get('STATS_RENDER_POOL') == '1',
+    'WORKERS': 2,
+    'MAX_QUEUE': 8,
+    'TIMEOUT_SECONDS': 30,
+    'RETRY_AFTER_SECONDS': 5,
+}
+
+# Default chart engine of ChartAPI/ChartBase64API, overridable per request
+# with ?engine=: 'plotly' (Plotly + kaleido) or 'native' (SVG built by
+# stats_service/svg.py, no external process).
+STATS_CHART_ENGINE = 'plotly'
+
+# Seconds browsers may reuse a chart served as image bytes
+# (Accept: image/png or image/svg+xml, ?format=png|svg) before
+# revalidating it with its ETag.
+STATS_CHART_MAX_AGE = 60
+
+# Most question ids accepted by one /api/stats/questions/batch/ request.
+STATS_BATCH_MAX_IDS = 1000
+
+# Site-wide vote total (polls/globalstats.py): each vote adds to one of
+# VOTE_SLOTS counter rows at random, so the total is not a single-row
+# write hotspot; the global stats endpoint sums the slots.
+POLLS_GLOBAL_STATS = {
+    'VOTE_SLOTS': 8,
+}
+
+# Cross-question analytics (stats_service/analytics.py) served by
+# /api/stats/analytics/: the report is kept in CACHE for TIMEOUT seconds.
+STATS_ANALYTICS = {
+    'ENABLED': True,
+    'CACHE': 'default',
+    'TIMEOUT': 300,
+}
+
+# Per-choice vote time series (polls/timeseries.py): minute buckets are
+# rolled up into hour and day buckets by `manage.py compact_vote_series`,
+# which also deletes buckets older than their retention (None keeps them
+# forever). MAX_POINTS caps the buckets of one timeseries API response.
+POLLS_VOTE_SERIES = {
+    'MINUTE_RETENTION_SECONDS': 2 * 24 * 60 * 60,
+    'HOUR_RETENTION_SECONDS': 90 * 24 * 60 * 60,
+    'DAY_RETENTION_SECONDS': None,
+    'MAX_POINTS': 2000,
+}
+
+# Live results stream (polls/live.py, /polls/<id>/live/): vote deltas are
+# coalesced and broadcast every TICK_MS; idle streams get a comment every
+# HEARTBEAT_SECONDS; a watcher QUEUE_SIZE messages behind is disconnected.
+# The stream never ends, so it is only ENABLED under ASGI (where the async
+# views run too); under WSGI each open results page would hold a worker.
+POLLS_LIVE_RESULTS = {
+    'ENABLED': POLLS_ASYNC_VIEWS,
+    'TICK_MS': 250,
+    'HEARTBEAT_SECONDS': 15,
+    'QUEUE_SIZE': 64,
+}
+
+# HyperLogLog unique-voter sketches (polls/hll.py): 2 ** PRECISION one-byte
+# registers per sketch, relative error 1.04 / sqrt(2 ** PRECISION) (1.6% at
+# 12). Run `manage.py rebuild_unique_voters` after changing it. Voters are
+# kept in memory per process and merged into the stored sketches at most
+# every FLUSH_INTERVAL_SECONDS, by the next vote or stats read and, with
+# FLUSH_IN_BACKGROUND, by a thread; a merge that keeps losing the
+# compare-and-swap gives up after MAX_RETRIES and is retried next flush.
+POLLS_UNIQUE_VOTERS = {
+    'PRECISION': 12,
+    'FLUSH_INTERVAL_SECONDS': 5,
+    'FLUSH_IN_BACKGROUND': not TESTING,
+    'MAX_RETRIES': 5,
+}
@@ -8,4 +8,5 @@ urlpatterns = [
     path('', include('accounts.urls')),
     path('api/stats/', include('stats_service.urls')),
     path('api/export/', include('export_service.urls')),
+    path('api/polls/', include('vote_service.urls')),
 ]
\ No newline at end of file
@@ -1,11 +1,16 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR
+from django.db.models import Case, IntegerField, When
 
 from .models import Choice, Question
+from .search import search_question_ids, search_settings
 
 
 class ChoiceInline(admin.TabularInline):
     model = Choice
     extra = 3
+    # Maintained by the vote path together with Question.total_votes.
+    readonly_fields = ["votes"]
 
 
 class QuestionAdmin(admin.ModelAdmin):
@@ -18,5 +23,24 @@ class QuestionAdmin(admin.ModelAdmin):
     list_filter = ["pub_date"]
     search_fields = ["question_text"]
 
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Search questions and choices through the full-text index instead of
+        LIKE scans, keeping the best ADMIN_LIMIT matches. Results are listed
+        by relevance unless a column sort is chosen.
+        """
+        if not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        ids = search_question_ids(search_term, limit=search_settings()["ADMIN_LIMIT"])
+        queryset = queryset.filter(pk__in=ids).annotate(
+            search_rank=Case(
+                *[When(pk=pk, then=rank) for rank, pk in enumerate(ids)],
+                output_field=IntegerField(),
+            )
+        )
+        if ORDER_VAR not in request.GET:
+            queryset = queryset.order_by("search_rank", "-pk")
+        return queryset, False
+
 
 admin.site.register(Question, QuestionAdmin)
\ No newline at end of file
@@ -3,3 +3,28 @@ from django.apps import AppConfig
 
 class PollsConfig(AppConfig):
     name = 'polls'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+
+        from . import counters, globalstats, index_cache
+        from .eventlog import log_votes
+        from .hll import record_voters
+        from .leaderboard import track_votes
+        from .live import publish_votes
+        from .models import Choice, Question
+        from .signals import votes_cast
+        from .timeseries import record_votes
+
+        votes_cast.connect(log_votes, dispatch_uid="polls.eventlog.log_votes")
+        votes_cast.connect(track_votes, dispatch_uid="polls.leaderboard.track_votes")
+        votes_cast.connect(record_votes, dispatch_uid="polls.timeseries.record_votes")
+        votes_cast.connect(record_voters, dispatch_uid="polls.hll.record_voters")
+        votes_cast.connect(publish_votes, dispatch_uid="polls.live.publish_votes")
+        post_save.connect(index_cache.invalidate, sender=Question, dispatch_uid="polls.index_cache.save")
+        post_delete.connect(index_cache.invalidate, sender=Question, dispatch_uid="polls.index_cache.delete")
+        pre_save.connect(globalstats.remember_pub_date, sender=Question, dispatch_uid="polls.globalstats.pre_save")
+        post_save.connect(globalstats.question_saved, sender=Question, dispatch_uid="polls.globalstats.save")
+        pre_delete.connect(globalstats.remember_total_votes, sender=Question, dispatch_uid="polls.globalstats.pre_delete")
+        post_delete.connect(globalstats.question_deleted, sender=Question, dispatch_uid="polls.globalstats.delete")
+        pre_delete.connect(counters.choice_deleted, sender=Choice, dispatch_uid="polls.counters.choice_deleted")
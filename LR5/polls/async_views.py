@@ -0,0 +1,160 @@
+"""
+Native async versions of the polls views, served when POLLS_ASYNC_VIEWS is
+enabled (run the project under ASGI: mysite.asgi). Reads use the async ORM;
+anything a template iterates over is loaded up front, since templates
+can't query the database from the event loop.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db.models import Prefetch
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, render
+from django.urls import reverse
+from django.utils import timezone
+from django.views import View
+
+from .models import Choice, Question
+from .idempotency import new_idempotency_key, request_idempotency_key
+from .index_cache import latest_questions
+from .live import get_live_results, live_settings, sse_message
+from .voting import AlreadyVoted, DuplicateSubmission, cast_vote, choice_by_pk
+
+
+class IndexView(View):
+    template_name = "polls/index.html"
+
+    async def get(self, request):
+        """
+        Return the last five published questions (not including those set to be
+        published in the future).
+        """
+        # Cache hits cost no query; the cache API itself is synchronous.
+        latest_question_list = await sync_to_async(latest_questions)(5)
+        return render(
+            request, self.template_name, {"latest_question_list": latest_question_list}
+        )
+
+
+class DetailView(View):
+    template_name = "polls/detail.html"
+
+    async def get(self, request, pk):
+        """
+        Excludes any questions that aren't published yet.
+        """
+        question = await aget_object_or_404(
+            Question.objects.filter(pub_date__lte=timezone.now()).prefetch_related("choice_set"),
+            pk=pk,
+        )
+        return render(
+            request,
+            self.template_name,
+            {"question": question, "idempotency_key": new_idempotency_key()},
+        )
+
+
+class ResultsView(View):
+    template_name = "polls/results.html"
+
+    async def get(self, request, pk):
+        question = await aget_object_or_404(
+            Question.objects.with_live_total_votes().prefetch_related(
+                Prefetch("choice_set", queryset=Choice.objects.with_live_votes(), to_attr="choices")
+            ),
+            pk=pk,
+        )
+        return render(request, self.template_name, {
+            "question": question,
+            "choices": question.choices,
+            "live_results": live_settings()["ENABLED"],
+        })
+
+
+async def vote(request, question_id):
+    question = await aget_object_or_404(
+        Question.objects.prefetch_related("choice_set"), pk=question_id
+    )
+    idempotency_key = request_idempotency_key(request)
+    try:
+        selected_choice = choice_by_pk(question)[request.POST["choice"]]
+    except KeyError:
+        # Redisplay the question voting form.
+        return render(
+            request,
+            "polls/detail.html",
+            {
+                "question": question,
+                "error_message": "You didn't select a choice.",
+                "idempotency_key": idempotency_key or new_idempotency_key(),
+            },
+        )
+    user = await request.auser()
+    try:
+        # The ledger insert and counter updates share one transaction,
+        # which the async ORM can't open, so this part runs in a thread.
+        await sync_to_async(cast_vote)(selected_choice, user, idempotency_key)
+    except DuplicateSubmission:
+        # A retry of a vote that was already counted: answer as the
+        # first submission did.
+        pass
+    except AlreadyVoted:
+        return render(
+            request,
+            "polls/detail.html",
+            {
+                "question": question,
+                "error_message": "You have already voted on this question.",
+                "idempotency_key": new_idempotency_key(),
+            },
+        )
+    return HttpResponseRedirect(reverse("polls:results", args=(question.id,)))
+
+
+async def live_results(request, pk):
+    """
+    Server-sent events with the question's vote counts: a ``snapshot``
+    event on connect, then a ``votes`` event with per-choice deltas each
+    tick that saw votes. 404 unless POLLS_LIVE_RESULTS["ENABLED"], and
+    501 outside ASGI, where the endless stream would hold a worker.
+    """
+    if not live_settings()["ENABLED"]:
+        raise Http404("Live results are disabled.")
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse("Live results need an ASGI server.", status=501, content_type="text/plain")
+    await aget_object_or_404(Question.objects.filter(pub_date__lte=timezone.now()), pk=pk)
+    live = get_live_results()
+    heartbeat = live_settings()["HEARTBEAT_SECONDS"]
+
+    async def stream():
+        # Subscribe before reading the snapshot so no vote falls between,
+        # and mark it so the votes the snapshot holds are not sent again.
+        subscription = live.subscribe(pk)
+        try:
+            live.mark(subscription)
+            choices = {
+                str(choice_id): votes
+                async for choice_id, votes in Choice.objects.filter(question_id=pk)
+                .with_live_votes()
+                .values_list("pk", "live_votes")
+            }
+            yield b"retry: 3000\n\n" + sse_message(
+                "snapshot", {"question_id": pk, "choices": choices, "total": sum(choices.values())}
+            )
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            live.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,304 @@
+import atexit
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, transaction
+
+from .counters import add_votes
+from .models import IdempotencyKey
+
+try:
+    import fcntl
+except ImportError:  # Windows has no flock: every process takes slot 0, so run one per SPILL_FILE.
+    fcntl = None
+
+
+class VoteBuffer:
+    """
+    Write-behind buffer for votes.
+
+    Votes are collapsed per choice in memory and written by a background
+    thread every ``flush_interval_ms`` or as soon as ``flush_max_votes`` are
+    pending, using one ``UPDATE ... CASE`` statement per counter table.
+
+    If ``spill_file`` is set every accepted vote is appended to a spill
+    file before the request returns, so votes pending at a crash are
+    replayed by a later process. Each process claims the first free slot
+    ``spill_file``, ``spill_file``-1, ``spill_file``-2, ... by holding an
+    exclusive lock on its .lock file, so several workers can share one
+    setting. At startup a buffer replays its own slot and every other slot
+    whose lock nobody holds (left by a process that died). Each flush
+    moves the file aside and, in the transaction that writes its votes,
+    stores an IdempotencyKey named after it; a file whose key exists was
+    applied already and is only removed on replay.
+    """
+
+    def __init__(self, flush_interval_ms=200, flush_max_votes=500, spill_file=None):
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_max_votes = flush_max_votes
+        self.spill_file = spill_file
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._pending = Counter()
+        self._depth = 0
+        self._spill = None
+        self._spill_lock = None
+        self._rotated = []
+        self.flushes = 0
+        self.flushed_votes = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+        if spill_file:
+            self._spill_lock, self.spill_file = _claim_spill_slot(spill_file)
+            self._replay_spill(self.spill_file)
+            self._replay_orphans(spill_file)
+            self._spill = open(self.spill_file, "a", encoding="ascii")
+
+    def add(self, choice_id):
+        with self._lock:
+            if self._spill is not None:
+                self._spill.write(f"{choice_id}\n")
+                self._spill.flush()
+            self._pending[choice_id] += 1
+            self._depth += 1
+            full = self._depth >= self.flush_max_votes
+        if full:
+            self._wakeup.set()
+
+    def pending_votes(self, choice_id):
+        """Votes for ``choice_id`` accepted but not yet written."""
+        with self._lock:
+            return self._pending.get(choice_id, 0)
+
+    def flush(self):
+        """Write all pending votes. Returns the number of votes written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, Counter()
+                self._depth = 0
+                if not batch:
+                    return 0
+                self._rotate_spill()
+
+            started = time.perf_counter()
+            try:
+                self._write(batch, self._rotated)
+            except Exception:
+                # Re-queue the votes; the rotated spill files holding them
+                # are kept until a later flush succeeds.
+                with self._lock:
+                    self._pending.update(batch)
+                    self._depth += sum(batch.values())
+                self.failed_flushes += 1
+                raise
+            elapsed = (time.perf_counter() - started) * 1000
+
+            self._remove_applied(self._rotated)
+            self._rotated = []
+            count = sum(batch.values())
+            self.flushes += 1
+            self.flushed_votes += count
+            self.last_flush_ms = elapsed
+            self.max_flush_ms = max(self.max_flush_ms, elapsed)
+            self._total_flush_ms += elapsed
+            return count
+
+    def metrics(self):
+        with self._lock:
+            depth = self._depth
+        return {
+            "buffer_depth": depth,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "flushed_votes": self.flushed_votes,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+        }
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="vote-buffer", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        """Stop the flusher thread and write whatever is still pending."""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        if self._spill_lock is not None:
+            self._spill_lock.close()
+            self._spill_lock = None
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                # Keep the thread alive; the batch was re-queued.
+                time.sleep(self.flush_interval)
+
+    def _write(self, batch, spills=()):
+        """Write ``batch`` and mark the spill files holding it as applied."""
+        with transaction.atomic():
+            add_votes(batch)
+            IdempotencyKey.objects.bulk_create([IdempotencyKey(key=_spill_key(path)) for path in spills])
+
+    def _remove_applied(self, spills):
+        """Drop applied spill files, then their markers (a crash in between leaves only a marker)."""
+        for path in spills:
+            os.remove(path)
+        if spills:
+            IdempotencyKey.objects.filter(key__in=[_spill_key(path) for path in spills]).delete()
+
+    def _rotate_spill(self):
+        """Called under ``_lock``: move the spill file aside for this flush."""
+        if self._spill is None:
+            return
+        self._spill.close()
+        self._rotated.append(self._move_aside())
+        self._spill = open(self.spill_file, "a", encoding="ascii")
+
+    def _move_aside(self, spill_file=None):
+        spill_file = spill_file or self.spill_file
+        rotated = f"{spill_file}.{uuid.uuid4().hex}.flushing"
+        os.replace(spill_file, rotated)
+        return rotated
+
+    def _replay_orphans(self, base):
+        """Replay the slots of ``base`` that no live process holds."""
+        for slot in _spill_slots(base):
+            if slot == self.spill_file:
+                continue
+            try:
+                lock = _lock_spill(slot)
+            except ImproperlyConfigured:
+                continue  # a live process owns it
+            try:
+                self._replay_spill(slot)
+            finally:
+                lock.close()
+
+    def _replay_spill(self, spill_file):
+        """Write the votes a previous process left in the files of ``spill_file``."""
+        directory = os.path.dirname(os.path.abspath(spill_file))
+        prefix = os.path.basename(spill_file) + "."
+        if os.path.exists(spill_file):
+            self._move_aside(spill_file)
+        leftovers = sorted(
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if name.startswith(prefix) and name.endswith(".flushing")
+        )
+        applied = set(IdempotencyKey.objects.filter(
+            key__in=[_spill_key(path) for path in leftovers]
+        ).values_list("key", flat=True))
+        pending = [path for path in leftovers if _spill_key(path) not in applied]
+        replayed = Counter()
+        for path in pending:
+            with open(path, encoding="ascii") as spill:
+                replayed.update(int(line) for line in spill if line.strip())
+        self._write(replayed, pending)
+        self._remove_applied(leftovers)
+
+
+SPILL_KEY_PREFIX = "spill:"
+
+
+def _spill_key(path):
+    """IdempotencyKey marking the spill file ``path`` as applied."""
+    return SPILL_KEY_PREFIX + os.path.basename(path).rsplit(".", 2)[-2]
+
+
+def _claim_spill_slot(base):
+    """Lock the first free slot of ``base``; returns ``(lock, spill_file)``."""
+    slot = 0
+    while True:
+        spill_file = f"{base}-{slot}" if slot else base
+        try:
+            return _lock_spill(spill_file), spill_file
+        except ImproperlyConfigured:
+            slot += 1
+
+
+def _spill_slots(base):
+    """Spill files of every slot of ``base`` that has a lock file."""
+    directory = os.path.dirname(os.path.abspath(base))
+    name = os.path.basename(base)
+    slots = []
+    for entry in sorted(os.listdir(directory)):
+        if not entry.endswith(".lock"):
+            continue
+        slot = entry[:-len(".lock")]
+        if slot == name or (slot.startswith(name + "-") and slot[len(name) + 1:].isdigit()):
+            slots.append(os.path.join(os.path.dirname(base), slot))
+    return slots
+
+
+def _lock_spill(spill_file):
+    """Take the exclusive lock on ``spill_file``; held until the returned file is closed."""
+    lock = open(f"{spill_file}.lock", "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            raise ImproperlyConfigured(f"Spill file {spill_file} is in use by another process.")
+    return lock
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def buffer_settings():
+    options = {
+        "ENABLED": False,
+        "FLUSH_INTERVAL_MS": 200,
+        "FLUSH_MAX_VOTES": 500,
+        "FLUSH_ON_SHUTDOWN": True,
+        "SPILL_FILE": None,
+    }
+    options.update(getattr(settings, "POLLS_VOTE_BUFFER", {}))
+    return options
+
+
+def get_vote_buffer():
+    """
+    Return the process-wide VoteBuffer, starting it on first use, or None
+    when buffering is disabled.
+    """
+    global _buffer
+    options = buffer_settings()
+    if not options["ENABLED"]:
+        return None
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = VoteBuffer(
+                    flush_interval_ms=options["FLUSH_INTERVAL_MS"],
+                    flush_max_votes=options["FLUSH_MAX_VOTES"],
+                    spill_file=options["SPILL_FILE"],
+                )
+                _buffer.start()
+                if options["FLUSH_ON_SHUTDOWN"]:
+                    atexit.register(_buffer.close)
+    return _buffer
@@ -0,0 +1,161 @@
+import random
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from . import globalstats
+from .models import Choice, ChoiceVoteShard, Question
+
+
+def vote_shards():
+    """Number of counter slots votes are spread over (1 = no sharding)."""
+    return max(1, getattr(settings, "POLLS_VOTE_SHARDS", 1))
+
+
+def add_vote(choice_id, question_id, shards=None):
+    """
+    Count one vote for the choice with the given pk.
+
+    With a single shard the vote goes straight to ``Choice.votes`` and
+    ``Question.total_votes``. Otherwise it lands in a random
+    ChoiceVoteShard slot, created on first use, and reaches both counters
+    on the next rollup.
+    """
+    shards = vote_shards() if shards is None else shards
+    if shards <= 1:
+        with transaction.atomic():
+            Choice.objects.filter(pk=choice_id).update(votes=F("votes") + 1)
+            Question.objects.filter(pk=question_id).update(total_votes=F("total_votes") + 1)
+            globalstats.add_votes(1)
+        return
+
+    slot = random.randrange(shards)
+    slot_rows = ChoiceVoteShard.objects.filter(choice_id=choice_id, slot=slot)
+    if slot_rows.update(count=F("count") + 1):
+        return
+    _, created = ChoiceVoteShard.objects.get_or_create(
+        choice_id=choice_id, slot=slot, defaults={"count": 1}
+    )
+    if not created:
+        slot_rows.update(count=F("count") + 1)
+
+
+def add_votes(choice_counts, question_counts=None):
+    """
+    Count many votes at once. ``choice_counts`` maps choice pk to the number
+    of new votes; both counter tables get a single ``UPDATE ... CASE``.
+    ``question_counts`` is looked up from the choices when not given.
+    Shards are bypassed, as the whole batch is one write already.
+    """
+    choice_counts = {pk: count for pk, count in choice_counts.items() if count}
+    if not choice_counts:
+        return
+    if question_counts is None:
+        question_counts = Counter()
+        for choice_id, question_id in Choice.objects.filter(pk__in=choice_counts).values_list("pk", "question_id"):
+            question_counts[question_id] += choice_counts[choice_id]
+    with transaction.atomic():
+        Choice.objects.filter(pk__in=choice_counts).update(
+            votes=F("votes") + _increments(choice_counts)
+        )
+        Question.objects.filter(pk__in=question_counts).update(
+            total_votes=F("total_votes") + _increments(question_counts)
+        )
+        globalstats.add_votes(sum(question_counts.values()))
+
+
+def choice_deleted(sender, instance, origin=None, **kwargs):
+    """
+    pre_delete receiver: take a choice's rolled-up votes out of its
+    question's total, in the deleting transaction. The stored count is
+    read, as votes only move through F() updates and the instance may be
+    stale. Choices deleted along with their question are skipped;
+    globalstats uncounts the whole question then. Votes still in the
+    choice's shards were never added.
+    """
+    if isinstance(origin, Question) or getattr(origin, "model", None) is Question:
+        return
+    votes = Choice.objects.filter(pk=instance.pk).values_list("votes", flat=True).first()
+    if votes:
+        Question.objects.filter(pk=instance.question_id).update(total_votes=F("total_votes") - votes)
+        globalstats.add_votes(-votes)
+
+
+def _increments(counts):
+    return Case(
+        *[When(pk=pk, then=Value(count)) for pk, count in counts.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def rollup_vote_shards():
+    """
+    Move pending shard counts into ``Choice.votes``.
+
+    Each shard is decremented by exactly the amount that was read, so votes
+    arriving during the rollup stay in their slot for the next run.
+    Returns the number of votes moved.
+    """
+    moved = 0
+    with transaction.atomic():
+        pending = ChoiceVoteShard.objects.exclude(count=0).values_list(
+            "pk", "choice_id", "choice__question_id", "count"
+        )
+        per_choice = {}
+        per_question = {}
+        for shard_id, choice_id, question_id, count in pending:
+            ChoiceVoteShard.objects.filter(pk=shard_id).update(count=F("count") - count)
+            per_choice[choice_id] = per_choice.get(choice_id, 0) + count
+            per_question[question_id] = per_question.get(question_id, 0) + count
+        for choice_id, count in per_choice.items():
+            Choice.objects.filter(pk=choice_id).update(votes=F("votes") + count)
+            moved += count
+        for question_id, count in per_question.items():
+            Question.objects.filter(pk=question_id).update(total_votes=F("total_votes") + count)
+        globalstats.add_votes(moved)
+    return moved
+
+
+def _choice_vote_sum():
+    return Coalesce(
+        Subquery(
+            Choice.objects.filter(question=OuterRef("pk"))
+            .values("question")
+            .annotate(total=Sum("votes"))
+            .values("total")
+        ),
+        0,
+    )
+
+
+def total_votes_mismatches():
+    """
+    Return ``(question_id, total_votes, sum of Choice.votes)`` for every
+    question whose denormalized total disagrees with its choices. Pending
+    shard counts are left out on both sides, as a rollup moves them into
+    both columns at once.
+    """
+    return list(
+        Question.objects.annotate(choice_votes=_choice_vote_sum())
+        .filter(~Q(total_votes=F("choice_votes")))
+        .order_by("pk")
+        .values_list("pk", "total_votes", "choice_votes")
+    )
+
+
+def repair_total_votes(question_ids):
+    """
+    Recompute ``Question.total_votes`` from the choices of the given
+    questions, moving the global total along. Returns the number of
+    questions updated.
+    """
+    questions = Question.objects.filter(pk__in=question_ids)
+    with transaction.atomic():
+        before = questions.aggregate(total=Sum("total_votes"))["total"] or 0
+        updated = questions.update(total_votes=_choice_vote_sum())
+        globalstats.add_votes((questions.aggregate(total=Sum("total_votes"))["total"] or 0) - before)
+    return updated
@@ -0,0 +1,301 @@
+"""
+Append-only binary log of accepted votes.
+
+Each vote is a fixed-width 32-byte record (timestamp in microseconds since
+the epoch, question_id, choice_id, user_id or 0) appended to numbered
+segment files in POLLS_VOTE_LOG["DIR"]. A new segment is started once the
+current one reaches SEGMENT_BYTES. Snapshots store the per-choice totals
+at a log position, so ``Choice.votes`` can be rebuilt from the newest
+snapshot plus the records after it, or as of an earlier point in time.
+
+Records are appended in commit order, not timestamp order: a vote's
+timestamp is taken when its process creates it, so a worker can log an
+older vote after another worker's newer one. A point-in-time read
+therefore skips newer records instead of stopping at the first one, and
+a snapshot records the newest timestamp it covers.
+"""
+import datetime
+import json
+import os
+import re
+import struct
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .signals import VoteEvent
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development servers only
+    fcntl = None
+
+RECORD = struct.Struct("<qqqq")
+SEGMENT_NAME = "{:010d}.seg"
+SNAPSHOT_NAME = "snapshot-{:010d}-{:012d}.json"
+SEGMENT_RE = re.compile(r"^(\d{10})\.seg$")
+SNAPSHOT_RE = re.compile(r"^snapshot-(\d{10})-(\d{12})\.json$")
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _to_micros(moment):
+    return (moment - EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def _from_micros(micros):
+    return EPOCH + datetime.timedelta(microseconds=micros)
+
+
+class IncompleteLog(Exception):
+    """The records needed for a replay were removed by compaction."""
+
+
+class VoteLog:
+    """
+    Segment-rotated vote log in ``directory``.
+
+    ``fsync`` is "always" (after every append), "interval" (at most every
+    ``fsync_interval_ms``) or "never" (leave it to the OS). Positions in
+    the log are ``(segment, offset)`` tuples.
+    """
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, fsync="interval", fsync_interval_ms=1000):
+        if fsync not in ("always", "interval", "never"):
+            raise ValueError(f"Unknown fsync policy: {fsync!r}")
+        self.directory = str(directory)
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval_ms / 1000
+        self._lock = threading.Lock()
+        self._last_fsync = 0.0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def append(self, events):
+        data = b"".join(
+            RECORD.pack(_to_micros(e.timestamp), e.question_id, e.choice_id, e.user_id or 0)
+            for e in events
+        )
+        if not data:
+            return
+        with self._lock, self._exclusive():
+            segments = self.segments()
+            segment = segments[-1] if segments else 1
+            size = self._size(segment)
+            if size and size + len(data) > self.segment_bytes:
+                segment += 1
+            fd = os.open(self._segment_path(segment), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+                now = time.monotonic()
+                if self.fsync == "always" or (
+                    self.fsync == "interval" and now - self._last_fsync >= self.fsync_interval
+                ):
+                    os.fsync(fd)
+                    self._last_fsync = now
+            finally:
+                os.close(fd)
+
+    def segments(self):
+        return sorted(
+            int(match.group(1))
+            for match in map(SEGMENT_RE.match, os.listdir(self.directory)) if match
+        )
+
+    def end_position(self):
+        segments = self.segments()
+        if not segments:
+            return (1, 0)
+        last = segments[-1]
+        size = self._size(last)
+        return (last, size - size % RECORD.size)
+
+    def read(self, start=(1, 0), until=None):
+        """
+        Yield ``(position, VoteEvent)`` for every record after ``start``,
+        where position is the end of that record. Records newer than
+        ``until`` are skipped; the scan goes on to the end of the log, as
+        older records may follow them. A torn record at the very end is
+        skipped.
+        """
+        first_segment, offset = start
+        until = _to_micros(until) if until is not None else None
+        for segment in self.segments():
+            if segment < first_segment:
+                continue
+            with open(self._segment_path(segment), "rb") as log:
+                if segment == first_segment:
+                    log.seek(offset)
+                position = log.tell()
+                while True:
+                    record = log.read(RECORD.size)
+                    if len(record) < RECORD.size:
+                        break
+                    position += RECORD.size
+                    micros, question_id, choice_id, user_id = RECORD.unpack(record)
+                    if until is not None and micros > until:
+                        continue
+                    yield (segment, position), VoteEvent(
+                        _from_micros(micros), question_id, choice_id, user_id or None
+                    )
+
+    def snapshots(self):
+        """All snapshots, oldest first, as ``(position, path)``."""
+        found = []
+        for name in os.listdir(self.directory):
+            match = SNAPSHOT_RE.match(name)
+            if match:
+                position = (int(match.group(1)), int(match.group(2)))
+                found.append((position, os.path.join(self.directory, name)))
+        return sorted(found)
+
+    def load_snapshot(self, until=None):
+        """
+        The newest snapshot (holding no vote newer than ``until``, if
+        given) as a dict with ``position``, ``last_timestamp`` (the newest
+        vote it holds) and ``choices``, or None.
+        """
+        for position, path in reversed(self.snapshots()):
+            with open(path, encoding="utf-8") as snapshot_file:
+                snapshot = json.load(snapshot_file)
+            taken = datetime.datetime.fromisoformat(snapshot["last_timestamp"])
+            if until is None or taken <= until:
+                return {
+                    "position": position,
+                    "last_timestamp": taken,
+                    "choices": Counter({int(k): v for k, v in snapshot["choices"].items()}),
+                }
+        return None
+
+    def write_snapshot(self, choices, position, last_timestamp):
+        path = self._snapshot_path(position)
+        with open(path + ".tmp", "w", encoding="utf-8") as snapshot_file:
+            json.dump(
+                {
+                    "last_timestamp": last_timestamp.isoformat(),
+                    "choices": {str(k): v for k, v in choices.items() if v},
+                },
+                snapshot_file,
+            )
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(path + ".tmp", path)
+
+    def replay(self, until=None):
+        """
+        Per-choice vote totals from the newest usable snapshot plus the
+        log after it. Returns ``(totals, position, last_timestamp)``, where
+        ``last_timestamp`` is the newest vote counted.
+        Raises IncompleteLog when the segment the replay has to start from
+        was compacted away (``until`` is older than every kept snapshot).
+        """
+        snapshot = self.load_snapshot(until)
+        if snapshot is None:
+            totals, position, last_timestamp = Counter(), (1, 0), EPOCH
+        else:
+            totals = snapshot["choices"]
+            position, last_timestamp = snapshot["position"], snapshot["last_timestamp"]
+        segments = self.segments()
+        if segments and segments[0] > position[0]:
+            raise IncompleteLog(
+                f"Replay must start at segment {position[0]}, but the log begins at segment "
+                f"{segments[0]}; no kept snapshot is old enough."
+            )
+        for position, event in self.read(position, until):
+            totals[event.choice_id] += 1
+            last_timestamp = max(last_timestamp, event.timestamp)
+        return totals, position, last_timestamp
+
+    def take_snapshot(self):
+        totals, position, last_timestamp = self.replay()
+        self.write_snapshot(totals, position, last_timestamp)
+        return totals, position
+
+    def compact(self, keep_snapshots):
+        """
+        Keep the ``keep_snapshots`` newest snapshots and drop older ones,
+        along with every segment that ends before the oldest kept one.
+        Returns the number of segments removed.
+        """
+        snapshots = self.snapshots()
+        if not snapshots:
+            return 0
+        kept = snapshots[-max(1, keep_snapshots):]
+        for _, path in snapshots[:len(snapshots) - len(kept)]:
+            os.remove(path)
+        oldest_segment = kept[0][0][0]
+        removed = 0
+        with self._lock, self._exclusive():
+            for segment in self.segments():
+                if segment < oldest_segment:
+                    os.remove(self._segment_path(segment))
+                    removed += 1
+        return removed
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, SEGMENT_NAME.format(segment))
+
+    def _snapshot_path(self, position):
+        return os.path.join(self.directory, SNAPSHOT_NAME.format(*position))
+
+    def _size(self, segment):
+        try:
+            return os.path.getsize(self._segment_path(segment))
+        except FileNotFoundError:
+            return 0
+
+    @contextmanager
+    def _exclusive(self):
+        """Serialize rotation and appends across processes."""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def vote_log_settings():
+    options = {
+        "ENABLED": False,
+        "DIR": os.path.join(settings.BASE_DIR, "vote_log"),
+        "SEGMENT_BYTES": 64 * 1024 * 1024,
+        "FSYNC": "interval",
+        "FSYNC_INTERVAL_MS": 1000,
+        "KEEP_SNAPSHOTS": 3,
+    }
+    options.update(getattr(settings, "POLLS_VOTE_LOG", {}))
+    return options
+
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def get_vote_log():
+    """The VoteLog configured by POLLS_VOTE_LOG, or None when disabled."""
+    options = vote_log_settings()
+    if not options["ENABLED"]:
+        return None
+    directory = str(options["DIR"])
+    with _logs_lock:
+        if directory not in _logs:
+            _logs[directory] = VoteLog(
+                directory,
+                segment_bytes=options["SEGMENT_BYTES"],
+                fsync=options["FSYNC"],
+                fsync_interval_ms=options["FSYNC_INTERVAL_MS"],
+            )
+        return _logs[directory]
+
+
+def log_votes(sender, votes, **kwargs):
+    """votes_cast receiver: append the accepted votes to the vote log."""
+    log = get_vote_log()
+    if log is not None:
+        log.append(votes)
@@ -0,0 +1,43 @@
+import logging
+import threading
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicFlusher:
+    """
+    Background thread calling ``flush`` every ``interval`` seconds.
+
+    Buffers that otherwise flush only when the next vote arrives use it,
+    so what they hold reaches the database after a quiet period too.
+    Errors are logged and the thread keeps running; the buffers keep
+    what they failed to write for the next call.
+    """
+
+    def __init__(self, name, interval, flush):
+        self.name = name
+        self.interval = interval
+        self.flush = flush
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Periodic flush %s failed.", self.name)
@@ -0,0 +1,191 @@
+"""
+Materialized site-wide statistics.
+
+GlobalStats row 1 holds the number of questions; the sum of
+Question.total_votes is spread over rows 1 to VOTE_SLOTS. QuestionDayCount
+holds the number of questions per publication day. Question saves and
+deletes keep them current through model signals. The vote counters in
+polls/counters.py add to ``total_votes`` of a random slot row in the same
+transaction as Question.total_votes, so concurrent votes don't all wait
+on one row (the ChoiceVoteShard idea applied to the site total).
+``snapshot()`` reads everything, including the slot sum and the 7-day
+figure summed from the day buckets, in one query.
+
+Writes that bypass signals (bulk_create, queryset update()/delete()) and
+the counter rebuilds are not tracked. ``manage.py reconcile_global_stats``
+recomputes everything from the tables.
+"""
+import datetime
+import random
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Func, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import ChoiceVoteShard, GlobalStats, Question, QuestionDayCount
+
+RECENT_DAYS = 7
+
+
+def _day(moment):
+    return timezone.localdate(moment) if settings.USE_TZ else moment.date()
+
+
+def globalstats_settings():
+    options = {"VOTE_SLOTS": 8}
+    options.update(getattr(settings, "POLLS_GLOBAL_STATS", {}))
+    return options
+
+
+def add_votes(count):
+    """Add ``count`` to a random slot of the global vote total (call inside the counter update)."""
+    if not count:
+        return
+    slot = random.randint(1, max(1, globalstats_settings()["VOTE_SLOTS"]))
+    rows = GlobalStats.objects.filter(pk=slot)
+    if not rows.update(total_votes=F("total_votes") + count):
+        with transaction.atomic():
+            GlobalStats.objects.get_or_create(pk=slot)
+            rows.update(total_votes=F("total_votes") + count)
+
+
+def _bump(total_questions=0, total_votes=0, days=None):
+    with transaction.atomic():
+        updated = GlobalStats.objects.filter(pk=1).update(
+            total_questions=F("total_questions") + total_questions,
+            total_votes=F("total_votes") + total_votes,
+        )
+        if not updated:
+            GlobalStats.objects.get_or_create(pk=1)
+            GlobalStats.objects.filter(pk=1).update(
+                total_questions=F("total_questions") + total_questions,
+                total_votes=F("total_votes") + total_votes,
+            )
+        for day, delta in (days or {}).items():
+            if delta and not QuestionDayCount.objects.filter(day=day).update(questions=F("questions") + delta):
+                QuestionDayCount.objects.get_or_create(day=day)
+                QuestionDayCount.objects.filter(day=day).update(questions=F("questions") + delta)
+
+
+def remember_pub_date(sender, instance, raw=False, **kwargs):
+    """pre_save receiver: keep the stored pub_date to move its day bucket."""
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    instance._stored_pub_date = (
+        Question.objects.filter(pk=instance.pk).values_list("pub_date", flat=True).first()
+    )
+
+
+def question_saved(sender, instance, created, raw=False, **kwargs):
+    """post_save receiver: count new questions and moved publication days."""
+    if raw:
+        return
+    if created:
+        _bump(total_questions=1, days={_day(instance.pub_date): 1})
+        return
+    stored = getattr(instance, "_stored_pub_date", None)
+    if stored is not None and _day(stored) != _day(instance.pub_date):
+        _bump(days={_day(stored): -1, _day(instance.pub_date): 1})
+    instance._stored_pub_date = instance.pub_date
+
+
+def remember_total_votes(sender, instance, **kwargs):
+    """
+    pre_delete receiver: keep the stored total_votes, which the vote
+    counters move with F() updates behind the instance's back.
+    """
+    instance._stored_total_votes = (
+        Question.objects.filter(pk=instance.pk).values_list("total_votes", flat=True).first()
+    )
+
+
+def question_deleted(sender, instance, **kwargs):
+    """post_delete receiver: uncount the question and its votes."""
+    total_votes = getattr(instance, "_stored_total_votes", None)
+    if total_votes is None:
+        total_votes = instance.total_votes
+    _bump(
+        total_questions=-1,
+        total_votes=-(total_votes or 0),
+        days={_day(instance.pub_date): -1},
+    )
+
+
+def snapshot(now=None):
+    """
+    Return ``{"total_questions", "total_votes", "recent_questions"}`` in one
+    query. ``recent_questions`` counts questions published in the last
+    RECENT_DAYS days by calendar day, today included. With sharded counters
+    the votes still in shards are added.
+    """
+    now = now or timezone.now()
+    since = _day(now) - datetime.timedelta(days=RECENT_DAYS - 1)
+    recent = QuestionDayCount.objects.filter(day__gte=since).values(
+        total=Func(F("questions"), function="SUM")
+    )
+    slots = GlobalStats.objects.filter(pk__gt=1).values(total=Func(F("total_votes"), function="SUM"))
+    row = GlobalStats.objects.filter(pk=1).annotate(
+        recent_questions=Coalesce(Subquery(recent), 0),
+        slot_votes=Coalesce(Subquery(slots), 0),
+    )
+    if getattr(settings, "POLLS_VOTE_SHARDS", 1) > 1:
+        pending = ChoiceVoteShard.objects.values(total=Func(F("count"), function="SUM"))
+        row = row.annotate(pending_votes=Coalesce(Subquery(pending), 0))
+    else:
+        row = row.annotate(pending_votes=Value(0))
+    row = row.values("total_questions", "total_votes", "recent_questions", "slot_votes", "pending_votes").first()
+    if row is None:
+        reconcile()
+        return snapshot(now)
+    return {
+        "total_questions": row["total_questions"],
+        "total_votes": row["total_votes"] + row["slot_votes"] + row["pending_votes"],
+        "recent_questions": row["recent_questions"],
+    }
+
+
+def reconcile():
+    """
+    Recompute the counters and day buckets from the questions table.
+    Returns a list of ``(name, stored, actual)`` for every value that had
+    drifted.
+    """
+    with transaction.atomic():
+        GlobalStats.objects.get_or_create(pk=1)
+        stored_totals = GlobalStats.objects.select_for_update().aggregate(
+            total_questions=Sum("total_questions"), total_votes=Sum("total_votes"),
+        )
+        actual_totals = {
+            "total_questions": Question.objects.count(),
+            "total_votes": Question.objects.aggregate(total=Sum("total_votes"))["total"] or 0,
+        }
+        drift = [
+            (name, stored_totals[name], value)
+            for name, value in actual_totals.items()
+            if stored_totals[name] != value
+        ]
+        # The whole total goes back to row 1; the vote slots start over.
+        GlobalStats.objects.filter(pk=1).update(**actual_totals)
+        GlobalStats.objects.filter(pk__gt=1).update(total_questions=0, total_votes=0)
+
+        stored_days = dict(QuestionDayCount.objects.values_list("day", "questions"))
+        actual_days = dict(
+            Question.objects.annotate(day=TruncDate("pub_date"))
+            .values("day")
+            .annotate(questions=Count("pk"))
+            .values_list("day", "questions")
+        )
+        for day in sorted(set(stored_days) | set(actual_days)):
+            stored, actual = stored_days.get(day, 0), actual_days.get(day, 0)
+            if stored != actual:
+                drift.append((f"questions on {day}", stored, actual))
+        QuestionDayCount.objects.exclude(day__in=actual_days).delete()
+        QuestionDayCount.objects.bulk_create(
+            [QuestionDayCount(day=day, questions=count) for day, count in actual_days.items()],
+            update_conflicts=True,
+            unique_fields=["day"],
+            update_fields=["questions"],
+        )
+    return drift
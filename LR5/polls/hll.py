@@ -0,0 +1,303 @@
+"""
+HyperLogLog sketches of the users who voted.
+
+A sketch estimates how many distinct values were added to it with a
+relative standard error of 1.04 / sqrt(2 ** PRECISION), using one byte
+per register (4 KiB at the default precision 12, about 1.6% error).
+Sketches merge by taking the register-wise maximum, so the voters of a
+week are the merge of its day sketches.
+
+``record_voters`` (a votes_cast receiver) adds each voter to three
+sketches: the question's, the vote's local day's and the all-time one.
+It only touches the process's pending sketches in memory. Once
+FLUSH_INTERVAL_SECONDS have passed since the last merge, the next vote
+or stats read merges them into the blobs stored in UniqueVoterSketch,
+and with FLUSH_IN_BACKGROUND a thread does so every interval, so the
+stored estimates lag the votes by at most about one interval. A merge
+rewrites a row only if its registers are still the ones it read
+(compare-and-swap) and retries otherwise, so concurrent processes don't
+overwrite each other's voters, and no row locks are needed. Merging is
+idempotent: a flush that fails puts its sketches back and the next one
+applies them again. The pending voters of a process that exits are lost
+until ``manage.py rebuild_unique_voters``. No (user, question) pairs
+are scanned when the stats are read.
+"""
+import datetime
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .flusher import PeriodicFlusher
+from .models import Question, UniqueVoterSketch, Vote
+
+logger = logging.getLogger(__name__)
+
+QUESTION, DAY, ALL = UniqueVoterSketch.QUESTION, UniqueVoterSketch.DAY, UniqueVoterSketch.ALL
+
+
+def unique_voter_settings():
+    options = {"PRECISION": 12, "FLUSH_INTERVAL_SECONDS": 5, "FLUSH_IN_BACKGROUND": True, "MAX_RETRIES": 5}
+    options.update(getattr(settings, "POLLS_UNIQUE_VOTERS", {}))
+    return options
+
+
+class HyperLogLog:
+    """A HyperLogLog sketch with 2 ** ``precision`` one-byte registers."""
+
+    def __init__(self, precision=12, registers=None):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16")
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(registers if registers is not None else self.m)
+        if len(self.registers) != self.m:
+            raise ValueError("register count does not match the precision")
+
+    @property
+    def error(self):
+        """Relative standard error of the estimate."""
+        return 1.04 / math.sqrt(self.m)
+
+    def add(self, value):
+        """Add ``value``; return True when a register changed."""
+        x = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+        index = x >> (64 - self.precision)
+        rest = x & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, other):
+        """Fold ``other`` (same precision) into this sketch."""
+        if other.precision != self.precision:
+            raise ValueError("cannot merge sketches of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        """Estimated number of distinct values added."""
+        m = self.m
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while many registers are empty.
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def to_bytes(self):
+        return bytes([self.precision]) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = bytes(data)
+        return cls(data[0], data[1:])
+
+
+def _day(moment):
+    return timezone.localdate(moment) if settings.USE_TZ else moment.date()
+
+
+class SketchBuffer:
+    """The voters a process has seen since its last flush, as sketches."""
+
+    def __init__(self, precision, flush_interval, max_retries=5):
+        self.precision = precision
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.pending = {}
+        self._flushed_at = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def add(self, votes):
+        """Add the voters of accepted votes (VoteEvent) to the pending sketches."""
+        with self._lock:
+            for vote in votes:
+                if vote.user_id is None:
+                    continue
+                for key in (
+                    (QUESTION, vote.question_id, None),
+                    (DAY, None, _day(vote.timestamp)),
+                    (ALL, None, None),
+                ):
+                    if key not in self.pending:
+                        self.pending[key] = HyperLogLog(self.precision)
+                    self.pending[key].add(vote.user_id)
+
+    def due(self):
+        with self._lock:
+            return bool(self.pending) and (
+                self._flushed_at is None or time.monotonic() - self._flushed_at >= self.flush_interval
+            )
+
+    def flush_if_due(self):
+        """Flush when voters are pending and the interval has passed; return how many rows were written."""
+        return self.flush() if self.due() else 0
+
+    def flush(self):
+        """Merge the pending sketches into the stored ones; return how many rows were written."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self.pending = self.pending, {}
+                self._flushed_at = time.monotonic()
+            written = 0
+            try:
+                for key in list(pending):
+                    written += self._merge(key, pending[key])
+                    del pending[key]
+            except Exception:
+                # Merging is idempotent, so the next flush can simply retry them.
+                self._restore(pending)
+                raise
+            return written
+
+    def _restore(self, sketches):
+        with self._lock:
+            for key, sketch in sketches.items():
+                if key in self.pending:
+                    sketch.merge(self.pending[key])
+                self.pending[key] = sketch
+
+    def _merge(self, key, sketch):
+        scope, question_id, day = key
+        rows = UniqueVoterSketch.objects.filter(scope=scope, question_id=question_id, day=day)
+        for _ in range(self.max_retries):
+            row = rows.values_list("pk", "registers").first()
+            if row is None:
+                if scope == QUESTION and not Question.objects.filter(pk=question_id).exists():
+                    return 0
+                try:
+                    with transaction.atomic():
+                        UniqueVoterSketch.objects.create(
+                            scope=scope, question_id=question_id, day=day, registers=sketch.to_bytes(),
+                        )
+                    return 1
+                except IntegrityError:
+                    continue
+            pk, stored = row[0], bytes(row[1])
+            if stored[0] != sketch.precision:
+                logger.warning(
+                    "Unique-voter sketch %s has precision %s, not %s; run rebuild_unique_voters.",
+                    key, stored[0], sketch.precision,
+                )
+                return 0
+            merged = HyperLogLog.from_bytes(stored).merge(sketch).to_bytes()
+            if merged == stored:
+                return 0
+            if UniqueVoterSketch.objects.filter(pk=pk, registers=stored).update(registers=merged):
+                return 1
+        raise RuntimeError(f"unique-voter sketch {key} kept changing during {self.max_retries} merges")
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_sketch_buffer():
+    """
+    Return the process-wide SketchBuffer, creating it on first use and
+    starting its flusher thread when FLUSH_IN_BACKGROUND is set.
+    """
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                options = unique_voter_settings()
+                buffer = SketchBuffer(
+                    options["PRECISION"], options["FLUSH_INTERVAL_SECONDS"], options["MAX_RETRIES"],
+                )
+                if options["FLUSH_IN_BACKGROUND"] and options["FLUSH_INTERVAL_SECONDS"] > 0:
+                    PeriodicFlusher(
+                        "unique-voters", options["FLUSH_INTERVAL_SECONDS"], buffer.flush_if_due,
+                    ).start()
+                _buffer = buffer
+    return _buffer
+
+
+def flush_due():
+    """
+    Merge this process's pending voters if a flush is due (call before
+    reading the sketches). A failed flush is logged and the stored
+    sketches are read as they are.
+    """
+    try:
+        return get_sketch_buffer().flush_if_due()
+    except Exception:
+        logger.exception("Could not flush the pending unique-voter sketches.")
+        return 0
+
+
+def record_voters(sender, votes, **kwargs):
+    """votes_cast receiver: note the voters; merge them into the stored sketches when a flush is due."""
+    buffer = get_sketch_buffer()
+    buffer.add(votes)
+    buffer.flush_if_due()
+
+
+def estimate(registers):
+    """``{"estimate", "error"}`` of a stored sketch blob (None: no voters yet)."""
+    if registers is None:
+        precision = unique_voter_settings()["PRECISION"]
+        return {"estimate": 0, "error": round(HyperLogLog(precision).error, 4)}
+    sketch = HyperLogLog.from_bytes(registers)
+    return {"estimate": sketch.count(), "error": round(sketch.error, 4)}
+
+
+def global_unique_voters(now=None, days=7):
+    """
+    Estimated distinct voters of all time, today and the last ``days``
+    local days (merged day sketches), read in one query.
+    """
+    flush_due()
+    today = _day(now or timezone.now())
+    since = today - datetime.timedelta(days=days - 1)
+    rows = UniqueVoterSketch.objects.filter(scope=ALL) | UniqueVoterSketch.objects.filter(
+        scope=DAY, day__gte=since, day__lte=today,
+    )
+    total, recent, today_sketch = None, None, None
+    for scope, day, registers in rows.values_list("scope", "day", "registers"):
+        sketch = HyperLogLog.from_bytes(registers)
+        if scope == ALL:
+            total = sketch
+            continue
+        if day == today:
+            today_sketch = sketch
+        if recent is None:
+            recent = HyperLogLog(sketch.precision, sketch.registers)
+        elif recent.precision == sketch.precision:
+            recent.merge(sketch)
+    error = (total or recent or HyperLogLog(unique_voter_settings()["PRECISION"])).error
+    return {
+        "total": total.count() if total else 0,
+        "today": today_sketch.count() if today_sketch else 0,
+        f"last_{days}_days": recent.count() if recent else 0,
+        "error": round(error, 4),
+    }
+
+
+def rebuild():
+    """Recompute every sketch from the Vote ledger; return how many were written."""
+    precision = unique_voter_settings()["PRECISION"]
+    sketches = defaultdict(lambda: HyperLogLog(precision))
+    votes = Vote.objects.filter(user__isnull=False).values_list("question_id", "user_id", "timestamp")
+    for question_id, user_id, timestamp in votes.iterator():
+        sketches[QUESTION, question_id, None].add(user_id)
+        sketches[DAY, None, _day(timestamp)].add(user_id)
+        sketches[ALL, None, None].add(user_id)
+    with transaction.atomic():
+        UniqueVoterSketch.objects.all().delete()
+        UniqueVoterSketch.objects.bulk_create([
+            UniqueVoterSketch(scope=scope, question_id=question_id, day=day, registers=sketch.to_bytes())
+            for (scope, question_id, day), sketch in sketches.items()
+        ])
+    return len(sketches)
@@ -0,0 +1,134 @@
+import datetime
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+
+
+class IdempotencyCache:
+    """
+    Bounded in-memory record of recently seen idempotency keys.
+
+    Holds at most ``max_keys`` keys. When full, ``eviction="lru"`` drops the
+    key used least recently and ``eviction="fifo"`` the oldest one. Keys
+    older than ``ttl_seconds`` are forgotten (0 keeps them until evicted).
+    A miss here is not authoritative: callers fall back to the
+    IdempotencyKey table, which every process shares.
+    """
+
+    def __init__(self, max_keys=10000, ttl_seconds=86400, eviction="lru"):
+        if eviction not in ("lru", "fifo"):
+            raise ValueError(f"Unknown eviction policy: {eviction!r}")
+        self.max_keys = max_keys
+        self.ttl = ttl_seconds
+        self.eviction = eviction
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def seen(self, key):
+        """Return True if ``key`` is known, counting a hit or a miss."""
+        now = time.monotonic()
+        with self._lock:
+            added = self._keys.get(key)
+            if added is not None and self.ttl and now - added > self.ttl:
+                del self._keys[key]
+                added = None
+            if added is None:
+                self.misses += 1
+                return False
+            if self.eviction == "lru":
+                self._keys.move_to_end(key)
+            self.hits += 1
+            return True
+
+    def add(self, key):
+        with self._lock:
+            self._keys[key] = time.monotonic()
+            self._keys.move_to_end(key)
+            while len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+                self.evictions += 1
+
+    def metrics(self):
+        with self._lock:
+            size = len(self._keys)
+        lookups = self.hits + self.misses
+        return {
+            "keys": size,
+            "max_keys": self.max_keys,
+            "eviction": self.eviction,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+def new_idempotency_key():
+    """Key for a freshly rendered vote form."""
+    return uuid.uuid4().hex
+
+
+def request_idempotency_key(request):
+    """
+    The key a client sent with a vote, from the ``Idempotency-Key`` header
+    or the ``idempotency_key`` form field. Keys longer than the 64
+    characters the table stores are replaced by their SHA-256.
+    """
+    key = request.headers.get("Idempotency-Key") or request.POST.get("idempotency_key")
+    if key and len(key) > 64:
+        key = hashlib.sha256(key.encode()).hexdigest()
+    return key or None
+
+
+def vote_key(user, question_id, key):
+    """
+    The stored form of a vote submission's key: the client's ``key`` scoped
+    to the voter and the question, hashed to the 64 characters the table
+    stores. The same client key from another user or for another question
+    is a different submission.
+    """
+    scoped = f"vote:{getattr(user, 'pk', None)}:{question_id}:{key}"
+    return hashlib.sha256(scoped.encode()).hexdigest()
+
+
+def expired_before():
+    """Keys created before this moment are expired (None: they never expire)."""
+    ttl = idempotency_settings()["TTL_SECONDS"]
+    return timezone.now() - datetime.timedelta(seconds=ttl) if ttl else None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def idempotency_settings():
+    options = {
+        "MAX_KEYS": 10000,
+        "TTL_SECONDS": 86400,
+        "EVICTION": "lru",
+    }
+    options.update(getattr(settings, "POLLS_IDEMPOTENCY", {}))
+    return options
+
+
+def get_idempotency_cache():
+    """Return the process-wide IdempotencyCache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                options = idempotency_settings()
+                _cache = IdempotencyCache(
+                    max_keys=options["MAX_KEYS"],
+                    ttl_seconds=options["TTL_SECONDS"],
+                    eviction=options["EVICTION"],
+                )
+    return _cache
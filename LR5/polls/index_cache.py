@@ -0,0 +1,97 @@
+"""
+Cache of the latest published questions shown by the index page.
+
+The list is stored in the cache framework together with the publication
+date of the next future question. It is dropped whenever a Question is
+saved or deleted, and recomputed once that publication boundary passes,
+so a question scheduled for later appears on time.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .models import Question
+
+CACHE_KEY = "polls:index:latest"
+
+_lock = threading.Lock()
+hits = 0
+misses = 0
+
+
+def index_cache_settings():
+    options = {
+        "ENABLED": True,
+        "CACHE": "default",
+        "TIMEOUT": 300,
+    }
+    options.update(getattr(settings, "POLLS_INDEX_CACHE", {}))
+    return options
+
+
+def _count(hit):
+    global hits, misses
+    with _lock:
+        if hit:
+            hits += 1
+        else:
+            misses += 1
+
+
+def latest_questions(limit=5, now=None):
+    """
+    Return the last ``limit`` published questions (not including those set
+    to be published in the future), from the cache when possible.
+    """
+    now = now or timezone.now()
+    options = index_cache_settings()
+    if not options["ENABLED"]:
+        return _query(limit, now)
+
+    cache = caches[options["CACHE"]]
+    entry = cache.get(CACHE_KEY)
+    if (
+        entry is not None
+        and entry["limit"] >= limit
+        and (entry["refresh_at"] is None or now < entry["refresh_at"])
+    ):
+        _count(hit=True)
+        return entry["questions"][:limit]
+
+    _count(hit=False)
+    questions = _query(limit, now)
+    refresh_at = (
+        Question.objects.filter(pub_date__gt=now)
+        .order_by("pub_date")
+        .values_list("pub_date", flat=True)
+        .first()
+    )
+    cache.set(
+        CACHE_KEY,
+        {"limit": limit, "questions": questions, "refresh_at": refresh_at},
+        options["TIMEOUT"],
+    )
+    return questions
+
+
+def invalidate(**kwargs):
+    """post_save / post_delete receiver for Question."""
+    options = index_cache_settings()
+    if options["ENABLED"]:
+        caches[options["CACHE"]].delete(CACHE_KEY)
+
+
+def metrics():
+    with _lock:
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def _query(limit, now):
+    return list(Question.objects.filter(pub_date__lte=now).order_by("-pub_date")[:limit])
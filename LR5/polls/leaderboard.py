@@ -0,0 +1,389 @@
+"""
+Incrementally maintained top-K leaderboards of questions.
+
+Two boards are kept. "popular" ranks questions by Question.total_votes.
+"trending" ranks them by their votes decayed with a half-life of
+TRENDING_HALF_LIFE_SECONDS. A trending score is stored as log2 of the
+decayed vote sum scaled to a fixed epoch, so it does not change between
+votes and, like a vote total, only grows. The display value (about "votes
+in the last half-life") is derived from it when read.
+
+Each process keeps every board as a min-heap of its K best questions. The
+votes_cast receiver notes which questions got votes. At most every
+FLUSH_INTERVAL_SECONDS a board rescores those questions, its members and
+the rows written by other processes. It offers the scores to the heap and
+writes the K winners to LeaderboardEntry. The flush runs when a vote or
+a read finds the interval elapsed and, with FLUSH_IN_BACKGROUND, from a
+thread every interval, so noted votes reach the rows after a quiet
+period too. Readers (GlobalStatsAPI) read those K rows and never touch
+the vote tables.
+
+The popular board rescores from Question.total_votes by primary key. The
+trending board never reads votes after its startup seed: the receiver
+adds each vote's weight to an in-memory decayed score per question, which
+is all a flush looks at. Because the scores are log2 at a fixed epoch,
+adding a vote is a log-sum with its exponent and nothing has to be
+renormalized as time passes. Scores that decayed below a thousandth of a
+fresh vote are dropped. A process sees only the votes it accepted, so
+trending boards of several processes merge by adopting the higher stored
+score of each question. They may undercount until ``manage.py
+rebuild_leaderboards`` reseeds them, but never count a vote twice.
+
+Questions touched in one flush are rescored once more in the next, so a
+vote still waiting in the write-behind buffer (polls/buffer.py) when it
+was first scored is counted after all.
+"""
+import datetime
+import heapq
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .flusher import PeriodicFlusher
+from .models import LeaderboardEntry, Question, Vote
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Votes older than this many half-lives weigh less than 0.1% of a new one
+# and are left out of trending scores.
+TRENDING_WINDOW_HALF_LIVES = 10
+
+
+def leaderboard_settings():
+    options = {
+        "K": 10,
+        "TRENDING_HALF_LIFE_SECONDS": 6 * 60 * 60,
+        "FLUSH_INTERVAL_SECONDS": 5,
+        "FLUSH_IN_BACKGROUND": True,
+    }
+    options.update(getattr(settings, "POLLS_LEADERBOARD", {}))
+    return options
+
+
+class TopK:
+    """
+    The ``k`` highest-scoring keys. Admission is O(log k): a min-heap holds
+    the members, with outdated entries skipped lazily.
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.scores = {}
+        self._heap = []
+
+    def offer(self, key, score):
+        """Record ``score`` for ``key``; return True when the top changed."""
+        if key in self.scores:
+            if self.scores[key] == score:
+                return False
+            self._push(key, score)
+            return True
+        if len(self.scores) < self.k:
+            self._push(key, score)
+            return True
+        if self.k == 0 or score <= self._lowest()[0]:
+            return False
+        _, lowest = heapq.heappop(self._heap)
+        del self.scores[lowest]
+        self._push(key, score)
+        return True
+
+    def discard(self, key):
+        """Remove ``key``; return True when it was a member."""
+        return self.scores.pop(key, None) is not None
+
+    def items(self):
+        """``[(key, score)]`` best first."""
+        return sorted(self.scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def _push(self, key, score):
+        self.scores[key] = score
+        heapq.heappush(self._heap, (score, key))
+        if len(self._heap) > 4 * max(self.k, 1):
+            self._heap = [(score, key) for key, score in self.scores.items()]
+            heapq.heapify(self._heap)
+
+    def _lowest(self):
+        while self.scores.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0]
+
+
+class Leaderboard:
+    """Base class of a board; subclasses define the score of a question."""
+
+    name = None
+
+    def __init__(self, k, flush_interval):
+        self.k = k
+        self.flush_interval = flush_interval
+        self.top = TopK(k)
+        self._touched = set()
+        self._previous = set()
+        self._flushed_at = None
+        self._lock = threading.Lock()
+
+    def scores(self, question_ids, now):
+        """Current ``{question_id: score}`` of the given questions."""
+        raise NotImplementedError
+
+    def seed(self, now):
+        """Ids of the questions a board rebuilt from scratch should score."""
+        raise NotImplementedError
+
+    def display(self, score, now):
+        return score
+
+    def add(self, votes):
+        """Fold accepted votes (VoteEvent) into the board's own state, if it keeps any."""
+
+    def merge(self, stored):
+        """Take in ``{question_id: score}`` rows written by other processes, if needed."""
+
+    def load(self, now=None):
+        """
+        Start from the rows in LeaderboardEntry, or rebuild the board from
+        the questions and votes when there are none.
+        """
+        now = now or timezone.now()
+        with self._lock:
+            stored = self._stored()
+            if not stored:
+                self._rescore(self.seed(now), now)
+                self._write()
+            else:
+                for question_id, score in stored.items():
+                    self.top.offer(question_id, score)
+            self._flushed_at = time.monotonic()
+
+    def rebuild(self, now=None):
+        """Recompute the board from scratch and replace the stored rows."""
+        now = now or timezone.now()
+        with self._lock:
+            self.top = TopK(self.k)
+            self._touched.clear()
+            self._previous.clear()
+            self._rescore(self.seed(now), now)
+            self._write()
+            self._flushed_at = time.monotonic()
+
+    def touch(self, question_ids, now=None):
+        """Note new votes for ``question_ids``; flush when one is due."""
+        with self._lock:
+            self._touched.update(question_ids)
+            due = self._interval_elapsed()
+        if due:
+            self.flush(now)
+
+    def flush_if_due(self, now=None):
+        """Flush when noted votes wait and the interval has passed. Returns True if it wrote."""
+        with self._lock:
+            due = bool(self._touched or self._previous) and self._interval_elapsed()
+        return self.flush(now) if due else False
+
+    def _interval_elapsed(self):
+        return self._flushed_at is None or time.monotonic() - self._flushed_at >= self.flush_interval
+
+    def flush(self, now=None):
+        """
+        Rescore touched questions, current members and other processes'
+        rows, and write the board when it changed. Returns True if it did.
+        """
+        now = now or timezone.now()
+        with self._lock:
+            stored = self._stored()
+            self.merge(stored)
+            candidates = self._touched | self._previous | set(self.top.scores) | set(stored)
+            self._previous, self._touched = self._touched, set()
+            changed = self._rescore(candidates, now) or set(stored) != set(self.top.scores)
+            if changed:
+                self._write()
+            self._flushed_at = time.monotonic()
+        return changed
+
+    def _rescore(self, question_ids, now):
+        question_ids = set(question_ids)
+        scores = self.scores(question_ids, now) if question_ids else {}
+        changed = False
+        for question_id in question_ids:
+            if question_id in scores:
+                changed |= self.top.offer(question_id, scores[question_id])
+            else:
+                changed |= self.top.discard(question_id)
+        return changed
+
+    def _stored(self):
+        return dict(
+            LeaderboardEntry.objects.filter(board=self.name).values_list("question_id", "score")
+        )
+
+    def _write(self):
+        members = self.top.scores
+        with transaction.atomic():
+            LeaderboardEntry.objects.filter(board=self.name).exclude(question_id__in=members).delete()
+            LeaderboardEntry.objects.bulk_create(
+                [
+                    LeaderboardEntry(board=self.name, question_id=question_id, score=score)
+                    for question_id, score in members.items()
+                ],
+                update_conflicts=True,
+                unique_fields=["board", "question"],
+                update_fields=["score", "updated"],
+            )
+
+
+class PopularBoard(Leaderboard):
+    """Questions with the most votes of all time."""
+
+    name = "popular"
+
+    def scores(self, question_ids, now):
+        return dict(Question.objects.filter(pk__in=question_ids).values_list("pk", "total_votes"))
+
+    def seed(self, now):
+        return Question.objects.order_by("-total_votes", "pk").values_list("pk", flat=True)[:self.k]
+
+    def display(self, score, now):
+        return int(score)
+
+
+class TrendingBoard(Leaderboard):
+    """Questions with the most votes decayed by age."""
+
+    name = "trending"
+
+    def __init__(self, k, flush_interval, half_life):
+        super().__init__(k, flush_interval)
+        self.half_life = half_life
+        self.decayed = {}
+        self._decayed_lock = threading.Lock()
+
+    def exponent(self, moment):
+        """log2 of the weight of a vote cast at ``moment``."""
+        return (moment - EPOCH).total_seconds() / self.half_life
+
+    def add(self, votes):
+        with self._decayed_lock:
+            for vote in votes:
+                exponent = self.exponent(vote.timestamp)
+                current = self.decayed.get(vote.question_id)
+                self.decayed[vote.question_id] = (
+                    exponent if current is None else _log2_sum([current, exponent])
+                )
+
+    def merge(self, stored):
+        # Adopt the higher scores other processes wrote; their votes never reach us.
+        with self._decayed_lock:
+            for question_id, score in stored.items():
+                if score > self.decayed.get(question_id, -math.inf):
+                    self.decayed[question_id] = score
+
+    def scores(self, question_ids, now):
+        floor = self.exponent(now) - TRENDING_WINDOW_HALF_LIVES
+        with self._decayed_lock:
+            self.decayed = {
+                question_id: score for question_id, score in self.decayed.items() if score >= floor
+            }
+            return {
+                question_id: self.decayed[question_id]
+                for question_id in question_ids if question_id in self.decayed
+            }
+
+    def seed(self, now):
+        """Score every question from its recent votes: the only Vote scan."""
+        since = now - datetime.timedelta(seconds=self.half_life * TRENDING_WINDOW_HALF_LIVES)
+        exponents = defaultdict(list)
+        recent = Vote.objects.filter(timestamp__gte=since).values_list("question_id", "timestamp")
+        for question_id, timestamp in recent.iterator():
+            exponents[question_id].append(self.exponent(timestamp))
+        with self._decayed_lock:
+            self.decayed = {question_id: _log2_sum(values) for question_id, values in exponents.items()}
+            return list(self.decayed)
+
+    def load(self, now=None):
+        """Seed the decayed scores from the votes and merge in the stored rows."""
+        now = now or timezone.now()
+        with self._lock:
+            candidates = set(self.seed(now))
+            stored = self._stored()
+            self.merge(stored)
+            if self._rescore(candidates | set(stored), now) or set(stored) != set(self.top.scores):
+                self._write()
+            self._flushed_at = time.monotonic()
+
+    def display(self, score, now):
+        return 2 ** (score - self.exponent(now))
+
+
+def _log2_sum(exponents):
+    """log2(sum(2 ** e for e in exponents)) without overflowing."""
+    highest = max(exponents)
+    return highest + math.log2(sum(2 ** (e - highest) for e in exponents))
+
+
+_boards = {}
+_boards_lock = threading.Lock()
+
+
+def get_leaderboards():
+    """
+    Return the process-wide boards by name, loading them (or rebuilding
+    them, when nothing is stored yet) on first use.
+    """
+    if not _boards:
+        with _boards_lock:
+            if not _boards:
+                options = leaderboard_settings()
+                boards = [
+                    PopularBoard(options["K"], options["FLUSH_INTERVAL_SECONDS"]),
+                    TrendingBoard(
+                        options["K"], options["FLUSH_INTERVAL_SECONDS"],
+                        options["TRENDING_HALF_LIFE_SECONDS"],
+                    ),
+                ]
+                for board in boards:
+                    board.load()
+                if options["FLUSH_IN_BACKGROUND"] and options["FLUSH_INTERVAL_SECONDS"] > 0:
+                    PeriodicFlusher(
+                        "leaderboards", options["FLUSH_INTERVAL_SECONDS"],
+                        lambda: [board.flush_if_due() for board in boards],
+                    ).start()
+                _boards.update((board.name, board) for board in boards)
+    return _boards
+
+
+def top_questions(name, now=None):
+    """
+    ``[(question, score)]`` of the board ``name``, best first, read from the
+    stored rows: one query over at most K rows, after this process's noted
+    votes are flushed if a flush is due.
+    """
+    now = now or timezone.now()
+    board = get_leaderboards()[name]
+    try:
+        board.flush_if_due(now)
+    except Exception:
+        # The stored rows are still a valid, if older, board.
+        logger.exception("Could not flush the %s leaderboard.", name)
+    entries = (
+        LeaderboardEntry.objects.filter(board=name)
+        .select_related("question")
+        .order_by("-score", "question_id")[:board.k]
+    )
+    return [(entry.question, board.display(entry.score, now)) for entry in entries]
+
+
+def track_votes(sender, votes, **kwargs):
+    """votes_cast receiver: feed the questions that got votes to the boards."""
+    question_ids = {vote.question_id for vote in votes}
+    for board in get_leaderboards().values():
+        board.add(votes)
+        board.touch(question_ids)
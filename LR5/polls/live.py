@@ -0,0 +1,244 @@
+"""
+In-process pub/sub of vote deltas for the live results stream (SSE).
+
+The votes_cast receiver adds each committed vote to a pending
+``{question_id: {choice_id: votes}}`` map; it costs no query. Every
+TICK_MS a background thread swaps the map out. For each question with
+watchers it encodes one server-sent event and hands it to the event loop
+of those watchers with one callback, which puts the same bytes in every
+watcher's queue. Thousands of clients on a hot poll therefore cost one
+encode and one loop callback per tick. No client ever queries the
+database after its initial snapshot.
+
+A watcher that falls QUEUE_SIZE messages behind is disconnected. Its
+EventSource reconnects and starts over from a fresh snapshot.
+
+A stream subscribes before it reads its snapshot, so no vote falls
+between the two, and marks the subscription right before the query.
+Votes published before the mark committed before the snapshot read and
+are in it: the watcher skips the ticks broadcast before the mark and
+subtracts the deltas then pending from the next tick. Only a vote that
+commits as the query starts but is published just after it (the gap
+between commit and its on_commit callback) can still be counted twice.
+
+A stream never ends, so it is only served under ASGI and only when
+ENABLED: a WSGI server would tie up one worker per open results page.
+The results page includes the EventSource script only when ENABLED.
+
+Deltas only reach watchers connected to the process that accepted the
+vote. Run one ASGI process, or put a shared broker in front, to fan out
+across processes.
+"""
+import asyncio
+import json
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+
+def live_settings():
+    options = {
+        "ENABLED": False,
+        "TICK_MS": 250,
+        "HEARTBEAT_SECONDS": 15,
+        "QUEUE_SIZE": 64,
+    }
+    options.update(getattr(settings, "POLLS_LIVE_RESULTS", {}))
+    return options
+
+
+def sse_message(event, data):
+    """Encode one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+def votes_message(question_id, deltas):
+    """The ``votes`` event of one tick's per-choice deltas."""
+    return sse_message("votes", {
+        "question_id": question_id,
+        "choices": {str(choice_id): count for choice_id, count in deltas.items()},
+        "total": sum(deltas.values()),
+    })
+
+
+class Subscription:
+    """One watcher: a bounded queue read on the watcher's event loop."""
+
+    def __init__(self, question_id, loop, size):
+        self.question_id = question_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=size)
+        self.dropped = False
+        # Set by LiveResults.mark(): what the watcher's snapshot already holds.
+        self.after_tick = None
+        self.included = Counter()
+
+    def deliver(self, tick, deltas, message):
+        """Called on ``loop``: queue a tick's message, or cut off a lagging watcher."""
+        if self.dropped:
+            return
+        try:
+            self.queue.put_nowait((tick, deltas, message))
+        except asyncio.QueueFull:
+            self.dropped = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self):
+        """Next message, or None once the watcher has been dropped."""
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                return None
+            tick, deltas, message = item
+            if self.after_tick is None or tick > self.after_tick + 1:
+                return message
+            if tick <= self.after_tick:
+                continue
+            # The first tick after the mark: drop what the snapshot holds.
+            deltas = deltas - self.included
+            self.included = Counter()
+            if deltas:
+                return votes_message(self.question_id, deltas)
+
+
+class LiveResults:
+    """Coalescing broadcaster of per-question vote deltas."""
+
+    def __init__(self, tick_ms=250, queue_size=64):
+        self.tick_interval = tick_ms / 1000
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._pending = defaultdict(Counter)
+        self._subscriptions = defaultdict(set)
+        self._ticks = 0
+        self._stopping = threading.Event()
+        self._thread = None
+        self.broadcasts = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, question_id):
+        """Watch ``question_id``; call from the watcher's event loop."""
+        subscription = Subscription(question_id, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscriptions[question_id].add(subscription)
+        return subscription
+
+    def mark(self, subscription):
+        """
+        Call right before reading the watcher's snapshot: the votes
+        published so far are in the snapshot and are not sent again.
+        """
+        with self._lock:
+            subscription.after_tick = self._ticks
+            subscription.included = Counter(self._pending.get(subscription.question_id, ()))
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            watchers = self._subscriptions.get(subscription.question_id)
+            if watchers is not None:
+                watchers.discard(subscription)
+                if not watchers:
+                    del self._subscriptions[subscription.question_id]
+            if subscription.dropped:
+                self.dropped += 1
+
+    def publish(self, votes):
+        """Note committed votes (VoteEvent) for the next tick."""
+        with self._lock:
+            for vote in votes:
+                if vote.question_id in self._subscriptions:
+                    self._pending[vote.question_id][vote.choice_id] += 1
+
+    def tick(self):
+        """Broadcast the deltas gathered since the last tick."""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(Counter)
+            self._ticks += 1
+            tick = self._ticks
+            targets = {
+                question_id: list(self._subscriptions.get(question_id, ()))
+                for question_id in pending
+            }
+        for question_id, deltas in pending.items():
+            watchers = targets[question_id]
+            if not watchers:
+                continue
+            message = votes_message(question_id, deltas)
+            by_loop = defaultdict(list)
+            for subscription in watchers:
+                by_loop[subscription.loop].append(subscription)
+            for loop, subscriptions in by_loop.items():
+                try:
+                    loop.call_soon_threadsafe(_fan_out, subscriptions, tick, deltas, message)
+                except RuntimeError:
+                    # The loop is closed; its watchers are gone.
+                    for subscription in subscriptions:
+                        self.unsubscribe(subscription)
+                    continue
+                self.delivered += len(subscriptions)
+            self.broadcasts += 1
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "questions": len(self._subscriptions),
+                "subscribers": sum(len(watchers) for watchers in self._subscriptions.values()),
+                "pending_questions": len(self._pending),
+                "broadcasts": self.broadcasts,
+                "delivered": self.delivered,
+                "dropped": self.dropped,
+            }
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="live-results", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.wait(self.tick_interval):
+            self.tick()
+
+
+def _fan_out(subscriptions, tick, deltas, message):
+    for subscription in subscriptions:
+        subscription.deliver(tick, deltas, message)
+
+
+_live = None
+_live_lock = threading.Lock()
+
+
+def get_live_results():
+    """Return the process-wide LiveResults, starting its ticker on first use."""
+    global _live
+    if _live is None:
+        with _live_lock:
+            if _live is None:
+                options = live_settings()
+                live = LiveResults(options["TICK_MS"], options["QUEUE_SIZE"])
+                live.start()
+                _live = live
+    return _live
+
+
+def metrics():
+    """Metrics of the process-wide broadcaster, or None before the first stream."""
+    return None if _live is None else _live.metrics()
+
+
+def publish_votes(sender, votes, **kwargs):
+    """
+    votes_cast receiver: pass the votes to the broadcaster. A process that
+    never served a stream has no broadcaster and skips this.
+    """
+    if _live is not None:
+        _live.publish(votes)
@@ -0,0 +1,60 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from polls.models import Question
+from polls.pagination import encode_cursor, question_page
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare first-page and deep-page latency of keyset pagination "
+        "with OFFSET pagination for growing question tables. Rows are "
+        "inserted inside a transaction that is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+        parser.add_argument("--page-size", type=int, default=20)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        page_size, repeat = options["page_size"], options["repeat"]
+        now = timezone.now()
+        self.stdout.write(f"{'rows':>10} {'keyset p1':>10} {'keyset deep':>12} {'offset p1':>10} {'offset deep':>12}  (ms/page)")
+        with transaction.atomic():
+            existing = Question.objects.count()
+            for size in sorted(options["sizes"]):
+                missing = size - Question.objects.count()
+                for start in range(0, max(missing, 0), 5000):
+                    Question.objects.bulk_create([
+                        Question(
+                            question_text="bench_question_pages",
+                            pub_date=now - datetime.timedelta(minutes=existing + start + i),
+                        )
+                        for i in range(min(5000, missing - start))
+                    ])
+                existing = size
+                depth = int(size * 0.9)
+                ordered = Question.objects.filter(pub_date__lte=now).order_by("-pub_date", "-pk")
+                deep_cursor = encode_cursor(ordered[depth - 1])
+
+                timings = [
+                    self._time(repeat, lambda: question_page(None, page_size, now)),
+                    self._time(repeat, lambda: question_page(deep_cursor, page_size, now)),
+                    self._time(repeat, lambda: list(ordered[:page_size])),
+                    self._time(repeat, lambda: list(ordered[depth:depth + page_size])),
+                ]
+                self.stdout.write(
+                    f"{size:>10} {timings[0]:>10.3f} {timings[1]:>12.3f} {timings[2]:>10.3f} {timings[3]:>12.3f}"
+                )
+            transaction.set_rollback(True)
+
+    def _time(self, repeat, run):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            run()
+        return (time.perf_counter() - started) * 1000 / repeat
@@ -0,0 +1,82 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from polls import search
+from polls.models import Choice, Question
+
+SYLLABLES = "ка ло ми ра со ту не ви да зо пе ру го ли ба ше".split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare full-text search with the icontains (LIKE) path on a "
+        "generated set of questions. Rows are inserted inside a "
+        "transaction that is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--questions", type=int, default=50_000)
+        parser.add_argument("--choices", type=int, default=3)
+        parser.add_argument("--repeat", type=int, default=10)
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument(
+            "--terms", nargs="+",
+            help="Queries to time; by default words of decreasing frequency.",
+        )
+
+    def handle(self, *args, **options):
+        if not search.fts_enabled():
+            self.stderr.write("The database has no FTS5 index; nothing to compare.")
+            return
+        rng = random.Random(0)
+        # Word frequencies follow Zipf's law, as in real text.
+        vocabulary = sorted({
+            "".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(20000)
+        })
+        rng.shuffle(vocabulary)
+        weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+
+        def words(count):
+            return " ".join(rng.choices(vocabulary, weights, k=count))
+
+        terms = options["terms"] or [
+            vocabulary[2], vocabulary[50], vocabulary[1000], vocabulary[5000][:3],
+            f"{vocabulary[10]} {vocabulary[200]}",
+        ]
+        now = timezone.now()
+        limit, repeat = options["limit"], options["repeat"]
+        with transaction.atomic():
+            started = time.perf_counter()
+            for start in range(0, options["questions"], 2000):
+                questions = Question.objects.bulk_create([
+                    Question(question_text=words(6) + "?", pub_date=now)
+                    for _ in range(min(2000, options["questions"] - start))
+                ])
+                Choice.objects.bulk_create([
+                    Choice(question=question, choice_text=words(2))
+                    for question in questions
+                    for _ in range(options["choices"])
+                ])
+            self.stdout.write(
+                f"Inserted {options['questions']} questions through the index "
+                f"triggers in {time.perf_counter() - started:.1f}s."
+            )
+            self.stdout.write(f"{'term':>20} {'matches':>8} {'fts ms':>9} {'like ms':>9} {'speedup':>8}")
+            for term in terms:
+                matches = len(search.search_question_ids(term, None, now))
+                fts = self._time(repeat, lambda: search.search_question_ids(term, limit, now))
+                like = self._time(repeat, lambda: list(
+                    search._like_search(term, now).values_list("pk", flat=True)[:limit]
+                ))
+                self.stdout.write(f"{term:>20} {matches:>8} {fts:>9.2f} {like:>9.2f} {like / fts:>7.1f}x")
+            transaction.set_rollback(True)
+
+    def _time(self, repeat, run):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            run()
+        return (time.perf_counter() - started) * 1000 / repeat
@@ -0,0 +1,91 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+
+from polls import globalstats
+from polls.buffer import VoteBuffer
+from polls.models import Choice, Question
+from polls.counters import add_vote, rollup_vote_shards
+
+
+class Command(BaseCommand):
+    help = (
+        "Concurrency benchmark for the vote counter: hammers one hot choice "
+        "from several threads and reports votes/sec for each shard count."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shards", type=int, nargs="+", default=[1, 8])
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--votes", type=int, default=2000, help="Votes per run.")
+        parser.add_argument(
+            "--buffer", action="store_true",
+            help="Also run through the write-behind vote buffer.",
+        )
+
+    def handle(self, *args, **options):
+        question = Question.objects.create(question_text="bench_votes", pub_date=timezone.now())
+        choice = Choice.objects.create(question=question, choice_text="hot")
+        try:
+            runs = [(f"shards={shards}", shards, None) for shards in options["shards"]]
+            if options["buffer"]:
+                runs.append(("buffered", 1, VoteBuffer()))
+            for label, shards, buffer in runs:
+                elapsed, errors = self._run(
+                    choice, shards, buffer, options["threads"], options["votes"]
+                )
+                rollup_vote_shards()
+                counted = Choice.objects.get(pk=choice.pk).votes
+                self._reset(question, choice)
+                self.stdout.write(
+                    f"{label:<10} threads={options['threads']:<3} "
+                    f"votes={counted:<6} {counted / elapsed:10.0f} votes/s  "
+                    f"errors={errors}"
+                )
+        finally:
+            question.delete()
+
+    def _reset(self, question, choice):
+        """Zero the counters and take their votes back out of the global total."""
+        with transaction.atomic():
+            counted = Question.objects.values_list("total_votes", flat=True).get(pk=question.pk)
+            Choice.objects.filter(pk=choice.pk).update(votes=0)
+            Question.objects.filter(pk=question.pk).update(total_votes=0)
+            globalstats.add_votes(-counted)
+
+    def _run(self, choice, shards, buffer, threads, votes):
+        start = threading.Barrier(threads + 1)
+        errors = []
+
+        def worker(count):
+            start.wait()
+            failed = 0
+            try:
+                for _ in range(count):
+                    try:
+                        if buffer is not None:
+                            buffer.add(choice.pk)
+                        else:
+                            add_vote(choice.pk, choice.question_id, shards=shards)
+                    except OperationalError:
+                        # "database is locked" on SQLite under contention
+                        failed += 1
+            finally:
+                connection.close()
+            errors.append(failed)
+
+        if buffer is not None:
+            buffer.start()
+        per_thread = [votes // threads + (i < votes % threads) for i in range(threads)]
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for count in per_thread:
+                pool.submit(worker, count)
+            start.wait()
+            began = time.perf_counter()
+        if buffer is not None:
+            buffer.close()
+        return time.perf_counter() - began, sum(errors)
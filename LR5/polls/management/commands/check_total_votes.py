@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.counters import repair_total_votes, total_votes_mismatches
+
+
+class Command(BaseCommand):
+    help = (
+        "Check that Question.total_votes equals the sum of its choices' votes. "
+        "Exits with an error on mismatches unless --repair is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repair", action="store_true",
+            help="Recompute total_votes of the mismatched questions from their choices.",
+        )
+
+    def handle(self, *args, **options):
+        mismatches = total_votes_mismatches()
+        for question_id, total_votes, choice_votes in mismatches:
+            self.stdout.write(
+                f"Question {question_id}: total_votes={total_votes}, choices sum to {choice_votes}"
+            )
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("All question totals match their choices."))
+            return
+        if not options["repair"]:
+            raise CommandError(f"{len(mismatches)} question total(s) out of sync; rerun with --repair.")
+        repaired = repair_total_votes([question_id for question_id, _, _ in mismatches])
+        self.stdout.write(self.style.SUCCESS(f"Repaired {repaired} question total(s)."))
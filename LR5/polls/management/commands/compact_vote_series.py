@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from polls import timeseries
+
+
+class Command(BaseCommand):
+    help = (
+        "Roll minute vote buckets up into hour and day buckets and delete "
+        "buckets past their POLLS_VOTE_SERIES retention. Run it periodically."
+    )
+
+    def handle(self, *args, **options):
+        report = timeseries.compact()
+        for resolution in timeseries.RESOLUTIONS:
+            written, deleted = report[resolution]
+            self.stdout.write(f"{resolution}: {written} bucket(s) written, {deleted} deleted.")
+        self.stdout.write(self.style.SUCCESS("Vote series compacted."))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from polls import queryplan
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN QUERY PLAN on every query issued by the polls, stats "
+        "and export views and report full table scans. Use -v 2 to print "
+        "every plan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fail-on-scan", action="store_true",
+            help="Exit with an error when an unexpected full scan is found.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("EXPLAIN QUERY PLAN checks are only implemented for SQLite.")
+        results = queryplan.view_queries()
+        if options["verbosity"] >= 2:
+            for name, sql, plan in results:
+                self.stdout.write(f"[{name}] {sql}")
+                for detail in plan:
+                    self.stdout.write(f"    {detail}")
+
+        scans = queryplan.unexpected_scans(results)
+        for name, sql, tables in scans:
+            self.stdout.write(self.style.WARNING(f"[{name}] full scan of {', '.join(tables)}: {sql}"))
+        views = len({name for name, _, _ in results})
+        summary = f"Explained {len(results)} queries from {views} views, {len(scans)} with unexpected full scans."
+        if scans and options["fail_on_scan"]:
+            raise CommandError(summary)
+        self.stdout.write(summary if scans else self.style.SUCCESS(summary))
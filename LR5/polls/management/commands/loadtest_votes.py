@@ -0,0 +1,104 @@
+import http.cookiejar
+import statistics
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.models import Choice, Question
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test of the vote -> results redirect cycle against a running "
+        "server. Run it once against the WSGI app (e.g. `gunicorn "
+        "mysite.wsgi`) and once against the ASGI app with POLLS_ASYNC_VIEWS=1 "
+        "(e.g. `uvicorn mysite.asgi:application`) to compare requests/sec "
+        "and p99 latency. Test users and questions are created in the "
+        "server's database and removed afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000")
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument(
+            "--questions", type=int, default=50,
+            help="Questions each client votes on (one vote cycle per question).",
+        )
+
+    def handle(self, *args, **options):
+        base_url = options["url"].rstrip("/")
+        concurrency = options["concurrency"]
+        password = "loadtest-password"
+        users = [
+            User.objects.create_user(username=f"loadtest{i}", password=password)
+            for i in range(concurrency)
+        ]
+        questions = []
+        for i in range(options["questions"]):
+            question = Question.objects.create(question_text=f"loadtest {i}", pub_date=timezone.now())
+            Choice.objects.bulk_create(
+                [Choice(question=question, choice_text=text) for text in ("A", "B")]
+            )
+            questions.append((question.pk, question.choice_set.values_list("pk", flat=True)[0]))
+
+        try:
+            clients = [self._login(base_url, user.username, password) for user in users]
+            latencies = []
+            failures = []
+            lock = threading.Lock()
+
+            def worker(client):
+                for question_id, choice_id in questions:
+                    url = base_url + reverse("polls:vote", args=(question_id,))
+                    began = time.perf_counter()
+                    try:
+                        response = self._post(client, url, {"choice": choice_id})
+                        ok = response.geturl().endswith(reverse("polls:results", args=(question_id,)))
+                    except OSError:
+                        ok = False
+                    elapsed = time.perf_counter() - began
+                    with lock:
+                        (latencies if ok else failures).append(elapsed)
+
+            began = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(worker, clients))
+            wall = time.perf_counter() - began
+        finally:
+            Question.objects.filter(pk__in=[pk for pk, _ in questions]).delete()
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+        if not latencies:
+            self.stderr.write(self.style.ERROR(f"All {len(failures)} vote cycles failed."))
+            return
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(
+            f"{base_url}: {len(latencies)} cycles, {len(failures)} failed, "
+            f"{len(latencies) / wall:.1f} cycles/s ({2 * len(latencies) / wall:.1f} req/s), "
+            f"p50 {statistics.median(latencies) * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms"
+        )
+
+    def _login(self, base_url, username, password):
+        cookies = http.cookiejar.CookieJar()
+        client = (urllib.request.build_opener(urllib.request.HTTPCookieProcessor(cookies)), cookies)
+        login_url = base_url + reverse("accounts:login")
+        client[0].open(login_url).read()
+        self._post(client, login_url, {"username": username, "password": password})
+        return client
+
+    def _post(self, client, url, data):
+        opener, cookies = client
+        token = next((c.value for c in cookies if c.name == "csrftoken"), "")
+        body = urllib.parse.urlencode({**data, "csrfmiddlewaretoken": token}).encode()
+        request = urllib.request.Request(url, data=body, headers={"Referer": url})
+        with opener.open(request) as response:
+            response.read()
+            return response
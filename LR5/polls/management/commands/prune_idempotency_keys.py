@@ -0,0 +1,27 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from polls.buffer import SPILL_KEY_PREFIX
+from polls.idempotency import idempotency_settings
+from polls.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete idempotency keys older than POLLS_IDEMPOTENCY['TTL_SECONDS'] "
+        "(the vote buffer's spill markers are kept)."
+    )
+
+    def handle(self, *args, **options):
+        ttl = idempotency_settings()["TTL_SECONDS"]
+        if not ttl:
+            self.stdout.write("TTL_SECONDS is 0, keys are kept forever.")
+            return
+        cutoff = timezone.now() - datetime.timedelta(seconds=ttl)
+        # "spill:" rows mark vote buffer spill files as applied; they must
+        # outlive the files, which are removed by the buffer itself.
+        expired = IdempotencyKey.objects.filter(created__lt=cutoff).exclude(key__startswith=SPILL_KEY_PREFIX)
+        deleted, _ = expired.delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} idempotency key(s)."))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from polls.leaderboard import get_leaderboards
+
+
+class Command(BaseCommand):
+    help = "Recompute the popular and trending question leaderboards from the votes."
+
+    def handle(self, *args, **options):
+        for name, board in get_leaderboards().items():
+            board.rebuild()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {name}: {len(board.top.scores)} question(s)."))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from polls import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of questions and choices."
+
+    def handle(self, *args, **options):
+        if not search.fts_enabled():
+            self.stdout.write("The database has no FTS5 index; search uses LIKE lookups.")
+            return
+        with transaction.atomic():
+            count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} question(s)."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from polls import hll
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the unique-voter HyperLogLog sketches from the Vote ledger "
+        "(after changing POLLS_UNIQUE_VOTERS['PRECISION'] or bulk imports)."
+    )
+
+    def handle(self, *args, **options):
+        written = hll.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} unique-voter sketch(es)."))
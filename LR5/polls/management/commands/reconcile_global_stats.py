@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from polls.globalstats import reconcile
+
+
+class Command(BaseCommand):
+    help = "Recompute the global question/vote counters and the per-day question counts."
+
+    def handle(self, *args, **options):
+        drift = reconcile()
+        for name, stored, actual in drift:
+            self.stdout.write(f"{name}: stored {stored}, actual {actual}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Repaired {len(drift)} drifted value(s)." if drift else "Global stats were in sync."
+        ))
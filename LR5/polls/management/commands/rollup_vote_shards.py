@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from polls.counters import rollup_vote_shards
+
+
+class Command(BaseCommand):
+    help = "Fold pending sharded vote counters into Choice.votes."
+
+    def handle(self, *args, **options):
+        moved = rollup_vote_shards()
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {moved} vote(s)."))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from polls.eventlog import get_vote_log, vote_log_settings
+from polls.models import Choice
+
+
+class Command(BaseCommand):
+    help = (
+        "Write a snapshot of per-choice vote totals at the end of the vote "
+        "log, then compact: keep POLLS_VOTE_LOG['KEEP_SNAPSHOTS'] snapshots "
+        "and delete the segments older than all of them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--from-db", action="store_true",
+            help="Take the totals from Choice.votes instead of the log. Use once "
+                 "when enabling the log on a database that already has votes.",
+        )
+
+    def handle(self, *args, **options):
+        log = get_vote_log()
+        if log is None:
+            raise CommandError("The vote log is disabled (POLLS_VOTE_LOG['ENABLED']).")
+        if options["from_db"]:
+            totals = dict(Choice.objects.values_list("pk", "votes"))
+            position = log.end_position()
+            log.write_snapshot(totals, position, timezone.now())
+        else:
+            totals, position = log.take_snapshot()
+        removed = log.compact(vote_log_settings()["KEEP_SNAPSHOTS"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot at segment {position[0]} offset {position[1]}: "
+            f"{sum(totals.values())} vote(s); removed {removed} segment(s)."
+        ))
@@ -0,0 +1,44 @@
+# Generated by Django 6.0b1 on 2026-10-18 12:19
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_total_votes(apps, schema_editor):
+    Question = apps.get_model("polls", "Question")
+    Choice = apps.get_model("polls", "Choice")
+    totals = Choice.objects.values("question").annotate(total=models.Sum("votes"))
+    for row in totals:
+        Question.objects.filter(pk=row["question"]).update(total_votes=row["total"] or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0002_choicevoteshard'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='total_votes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_total_votes, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='Vote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('choice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.choice')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.question')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'question'), name='unique_vote_per_user_question')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0b1 on 2026-10-18 12:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0003_vote_question_total_votes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='client_vote_id',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 6.0b1 on 2026-10-18 12:41
+
+from django.db import migrations
+
+# Full-text index of each question's text and the text of its choices,
+# keyed by question id. Triggers keep it in sync with every write path,
+# including bulk_create() and queryset update()/delete(), which bypass
+# model signals. Only the text columns are watched, so vote counter
+# updates never touch the index.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE polls_question_search USING fts5(
+        question_text, choice_text, tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO polls_question_search (rowid, question_text, choice_text)
+    SELECT q.id, q.question_text, coalesce(group_concat(c.choice_text, ' '), '')
+    FROM polls_question q LEFT JOIN polls_choice c ON c.question_id = q.id
+    GROUP BY q.id
+    """,
+    """
+    CREATE TRIGGER polls_question_search_ai AFTER INSERT ON polls_question BEGIN
+        INSERT INTO polls_question_search (rowid, question_text, choice_text)
+        VALUES (new.id, new.question_text, '');
+    END
+    """,
+    """
+    CREATE TRIGGER polls_question_search_au AFTER UPDATE OF question_text ON polls_question BEGIN
+        UPDATE polls_question_search SET question_text = new.question_text WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER polls_question_search_ad AFTER DELETE ON polls_question BEGIN
+        DELETE FROM polls_question_search WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER polls_choice_search_ai AFTER INSERT ON polls_choice BEGIN
+        UPDATE polls_question_search SET choice_text = (
+            SELECT group_concat(choice_text, ' ') FROM polls_choice WHERE question_id = new.question_id
+        ) WHERE rowid = new.question_id;
+    END
+    """,
+    """
+    CREATE TRIGGER polls_choice_search_au AFTER UPDATE OF choice_text, question_id ON polls_choice BEGIN
+        UPDATE polls_question_search SET choice_text = coalesce((
+            SELECT group_concat(choice_text, ' ') FROM polls_choice WHERE question_id = old.question_id
+        ), '') WHERE rowid = old.question_id;
+        UPDATE polls_question_search SET choice_text = (
+            SELECT group_concat(choice_text, ' ') FROM polls_choice WHERE question_id = new.question_id
+        ) WHERE rowid = new.question_id;
+    END
+    """,
+    """
+    CREATE TRIGGER polls_choice_search_ad AFTER DELETE ON polls_choice BEGIN
+        UPDATE polls_question_search SET choice_text = coalesce((
+            SELECT group_concat(choice_text, ' ') FROM polls_choice WHERE question_id = old.question_id
+        ), '') WHERE rowid = old.question_id;
+    END
+    """,
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS polls_choice_search_ad",
+    "DROP TRIGGER IF EXISTS polls_choice_search_au",
+    "DROP TRIGGER IF EXISTS polls_choice_search_ai",
+    "DROP TRIGGER IF EXISTS polls_question_search_ad",
+    "DROP TRIGGER IF EXISTS polls_question_search_au",
+    "DROP TRIGGER IF EXISTS polls_question_search_ai",
+    "DROP TABLE IF EXISTS polls_question_search",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        # FTS5 is SQLite-only; on other backends polls.search falls back to
+        # LIKE lookups.
+        if schema_editor.connection.vendor == "sqlite":
+            for sql in statements:
+                schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0006_question_pub_date_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE_SQL), run(DROP_SQL)),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0b1 on 2026-10-18 12:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0007_question_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='choice',
+            index=models.Index(fields=['question', 'votes'], name='choice_question_votes'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['total_votes'], name='question_total_votes'),
+        ),
+    ]
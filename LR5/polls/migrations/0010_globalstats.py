@@ -0,0 +1,46 @@
+# Generated by Django 6.0b1 on 2026-10-18 13:32
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_global_stats(apps, schema_editor):
+    Question = apps.get_model("polls", "Question")
+    GlobalStats = apps.get_model("polls", "GlobalStats")
+    QuestionDayCount = apps.get_model("polls", "QuestionDayCount")
+    GlobalStats.objects.create(
+        pk=1,
+        total_questions=Question.objects.count(),
+        total_votes=Question.objects.aggregate(total=Sum("total_votes"))["total"] or 0,
+    )
+    days = Question.objects.annotate(day=TruncDate("pub_date")).values("day").annotate(questions=Count("pk"))
+    QuestionDayCount.objects.bulk_create(
+        [QuestionDayCount(day=row["day"], questions=row["questions"]) for row in days]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0009_leaderboardentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GlobalStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_questions', models.BigIntegerField(default=0)),
+                ('total_votes', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuestionDayCount',
+            fields=[
+                ('day', models.DateField(primary_key=True, serialize=False)),
+                ('questions', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_global_stats, migrations.RunPython.noop),
+    ]
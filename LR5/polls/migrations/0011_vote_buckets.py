@@ -0,0 +1,36 @@
+# Generated by Django 6.0b1 on 2026-10-18 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0010_globalstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteBucketWatermark',
+            fields=[
+                ('resolution', models.CharField(max_length=6, primary_key=True, serialize=False)),
+                ('until', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VoteBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('minute', 'minute'), ('hour', 'hour'), ('day', 'day')], max_length=6)),
+                ('start', models.DateTimeField()),
+                ('count', models.IntegerField(default=0)),
+                ('choice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.choice')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.question')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['question', 'resolution', 'start'], name='vote_bucket_question'), models.Index(fields=['resolution', 'start'], name='vote_bucket_resolution')],
+                'constraints': [models.UniqueConstraint(fields=('choice', 'resolution', 'start'), name='unique_vote_bucket')],
+            },
+        ),
+    ]
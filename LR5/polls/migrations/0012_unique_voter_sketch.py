@@ -0,0 +1,51 @@
+# Generated by Django 6.0b1 on 2026-10-18 14:40
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_unique_voters(apps, schema_editor):
+    from polls.hll import HyperLogLog, unique_voter_settings
+
+    Vote = apps.get_model("polls", "Vote")
+    UniqueVoterSketch = apps.get_model("polls", "UniqueVoterSketch")
+    precision = unique_voter_settings()["PRECISION"]
+    sketches = defaultdict(lambda: HyperLogLog(precision))
+    votes = Vote.objects.filter(user__isnull=False).values_list("question_id", "user_id", "timestamp")
+    for question_id, user_id, timestamp in votes.iterator():
+        day = timezone.localdate(timestamp) if settings.USE_TZ else timestamp.date()
+        sketches["question", question_id, None].add(user_id)
+        sketches["day", None, day].add(user_id)
+        sketches["all", None, None].add(user_id)
+    UniqueVoterSketch.objects.bulk_create([
+        UniqueVoterSketch(scope=scope, question_id=question_id, day=day, registers=sketch.to_bytes())
+        for (scope, question_id, day), sketch in sketches.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0011_vote_buckets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UniqueVoterSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('question', 'question'), ('day', 'day'), ('all', 'all')], max_length=8)),
+                ('day', models.DateField(blank=True, null=True)),
+                ('registers', models.BinaryField()),
+                ('question', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='polls.question')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('scope', 'question')), fields=('question',), name='unique_question_voter_sketch'), models.UniqueConstraint(condition=models.Q(('scope', 'day')), fields=('day',), name='unique_day_voter_sketch'), models.UniqueConstraint(condition=models.Q(('scope', 'all')), fields=('scope',), name='unique_all_voter_sketch')],
+            },
+        ),
+        migrations.RunPython(backfill_unique_voters, migrations.RunPython.noop),
+    ]
@@ -1,15 +1,60 @@
 from django.db import models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 import datetime
+from django.conf import settings
 from django.utils import timezone
 from django.contrib import admin
 
+class QuestionQuerySet(models.QuerySet):
+    def with_live_total_votes(self):
+        """
+        Annotate each question with ``live_total_votes``: the maintained
+        ``total_votes`` plus votes still pending in its choices' shards.
+        """
+        if getattr(settings, "POLLS_VOTE_SHARDS", 1) <= 1:
+            return self.annotate(live_total_votes=F("total_votes"))
+        pending = (
+            ChoiceVoteShard.objects.filter(choice__question=OuterRef("pk"))
+            .values("choice__question")
+            .annotate(pending=Sum("count"))
+            .values("pending")
+        )
+        return self.annotate(
+            live_total_votes=F("total_votes") + Coalesce(Subquery(pending), 0)
+        )
+
+
 class Question(models.Model):
     question_text = models.CharField(max_length=200)
     pub_date = models.DateTimeField("date published")
+    total_votes = models.IntegerField(default=0)
+
+    objects = QuestionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the question listing (polls/pagination.py);
+            # as a prefix it also serves the index page and pub_date ranges.
+            models.Index(fields=["pub_date", "id"], name="question_pub_date_id"),
+            # Most popular questions and the global vote total (covering).
+            models.Index(fields=["total_votes"], name="question_total_votes"),
+        ]
 
     def __str__(self):
         return self.question_text
 
+    def save(self, *args, **kwargs):
+        # total_votes only moves through F() updates by the vote counters;
+        # saving an instance loaded earlier must not write back a stale
+        # total.
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "total_votes"
+            ]
+        super().save(*args, **kwargs)
+
     @admin.display(
         boolean=True,
         ordering="pub_date",
@@ -19,11 +64,220 @@ class Question(models.Model):
         now = timezone.now()
         return now - datetime.timedelta(days=1) <= self.pub_date <= now
 
+
+class ChoiceQuerySet(models.QuerySet):
+    def with_live_votes(self):
+        """
+        Annotate each choice with ``live_votes``: the rolled-up
+        ``Choice.votes`` plus whatever is still pending in its vote shards.
+        Without sharding this is just ``votes`` and adds no join.
+        """
+        if getattr(settings, "POLLS_VOTE_SHARDS", 1) <= 1:
+            return self.annotate(live_votes=F("votes"))
+        return self.annotate(
+            live_votes=F("votes") + Coalesce(Sum("vote_shards__count"), 0)
+        )
+
+
 class Choice(models.Model):
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice_text = models.CharField(max_length=200)
     votes = models.IntegerField(default=0)
 
+    objects = ChoiceQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Choices of a question, and per-question vote sums read from the
+            # index alone.
+            models.Index(fields=["question", "votes"], name="choice_question_votes"),
+        ]
+
     def __str__(self):
         return self.choice_text
 
+
+class ChoiceVoteShard(models.Model):
+    """
+    One of POLLS_VOTE_SHARDS counter slots of a choice. Votes are spread
+    over the slots so concurrent voters don't all update the same row;
+    rollup_vote_shards() folds the slots back into Choice.votes.
+    """
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE, related_name="vote_shards")
+    slot = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["choice", "slot"], name="unique_choice_vote_shard"),
+        ]
+
+    def __str__(self):
+        return f"{self.choice_id}#{self.slot}"
+
+
+class Vote(models.Model):
+    """
+    Ledger entry for one accepted vote. A user votes at most once per
+    question; Choice.votes and Question.total_votes are maintained from
+    the same transaction that inserts the entry.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, on_delete=models.SET_NULL)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    timestamp = models.DateTimeField(default=timezone.now)
+    # Set for votes replayed by offline clients through the batch API.
+    client_vote_id = models.CharField(max_length=64, null=True, blank=True, unique=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "question"], name="unique_vote_per_user_question"),
+        ]
+        indexes = [
+            # Recent votes of a question (trending leaderboard).
+            models.Index(fields=["question", "timestamp"], name="vote_question_timestamp"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.choice_id}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    An idempotency key of an accepted vote submission, shared by all
+    processes, stored scoped to the voter and question and hashed
+    (polls.idempotency.vote_key). Rows older than
+    POLLS_IDEMPOTENCY["TTL_SECONDS"] are ignored and removed by
+    ``manage.py prune_idempotency_keys``.
+    """
+    key = models.CharField(max_length=64, primary_key=True)
+    created = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.key
+
+
+class LeaderboardEntry(models.Model):
+    """
+    One of the top POLLS_LEADERBOARD["K"] questions of a leaderboard
+    ("popular" by total votes, "trending" by time-decayed votes), as last
+    written by any process. See polls/leaderboard.py.
+    """
+    board = models.CharField(max_length=16)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    score = models.FloatField()
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["board", "question"], name="unique_leaderboard_question"),
+        ]
+        indexes = [
+            models.Index(fields=["board", "-score"], name="leaderboard_board_score"),
+        ]
+
+    def __str__(self):
+        return f"{self.board}: {self.question_id} ({self.score})"
+
+
+class GlobalStats(models.Model):
+    """
+    Site-wide counters. Row 1 holds ``total_questions``; ``total_votes``
+    summed over all rows (vote slots 1 to POLLS_GLOBAL_STATS["VOTE_SLOTS"])
+    mirrors the sum of Question.total_votes and moves in the same
+    transaction; see polls/globalstats.py.
+    """
+    total_questions = models.BigIntegerField(default=0)
+    total_votes = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.total_questions} questions, {self.total_votes} votes"
+
+
+class QuestionDayCount(models.Model):
+    """Number of questions with a pub_date on ``day`` (local time)."""
+    day = models.DateField(primary_key=True)
+    questions = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.day}: {self.questions}"
+
+
+class VoteBucket(models.Model):
+    """
+    Votes a choice received during one minute, hour or (local) day
+    starting at ``start``. Votes are counted into minute buckets as they
+    are cast; ``manage.py compact_vote_series`` rolls complete hours and
+    days up and drops buckets past their retention. See polls/timeseries.py.
+    """
+    MINUTE = "minute"
+    HOUR = "hour"
+    DAY = "day"
+    RESOLUTIONS = [(MINUTE, "minute"), (HOUR, "hour"), (DAY, "day")]
+
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    resolution = models.CharField(max_length=6, choices=RESOLUTIONS)
+    start = models.DateTimeField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["choice", "resolution", "start"], name="unique_vote_bucket",
+            ),
+        ]
+        indexes = [
+            # Series of one question at one resolution (timeseries API).
+            models.Index(fields=["question", "resolution", "start"], name="vote_bucket_question"),
+            # Compaction and retention scan one resolution by time.
+            models.Index(fields=["resolution", "start"], name="vote_bucket_resolution"),
+        ]
+
+    def __str__(self):
+        return f"{self.choice_id} {self.resolution} {self.start}: {self.count}"
+
+
+class VoteBucketWatermark(models.Model):
+    """
+    Hour and day buckets are complete for every period that starts before
+    ``until``; later periods are still read from the finer buckets.
+    """
+    resolution = models.CharField(max_length=6, primary_key=True)
+    until = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.resolution} until {self.until}"
+
+
+class UniqueVoterSketch(models.Model):
+    """
+    HyperLogLog registers (polls/hll.py) of the users who voted on one
+    question, on one local day, or ever.
+    """
+    QUESTION = "question"
+    DAY = "day"
+    ALL = "all"
+    SCOPES = [(QUESTION, "question"), (DAY, "day"), (ALL, "all")]
+
+    scope = models.CharField(max_length=8, choices=SCOPES)
+    question = models.ForeignKey(Question, null=True, blank=True, on_delete=models.CASCADE)
+    day = models.DateField(null=True, blank=True)
+    registers = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["question"], condition=models.Q(scope="question"),
+                name="unique_question_voter_sketch",
+            ),
+            models.UniqueConstraint(
+                fields=["day"], condition=models.Q(scope="day"), name="unique_day_voter_sketch",
+            ),
+            models.UniqueConstraint(
+                fields=["scope"], condition=models.Q(scope="all"), name="unique_all_voter_sketch",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.question_id or self.day or ''}".strip()
@@ -0,0 +1,28 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """
+    Query-count regression harness for view tests.
+
+    A TestCase using this mixin returns ``{name: (url, max_queries)}`` from
+    ``query_budgets()``; ``test_query_budgets`` GETs every URL with the
+    test client and fails, listing the SQL, when a view issues more
+    queries than its budget. Budgets include the session and user lookups.
+    """
+
+    def query_budgets(self):
+        raise NotImplementedError
+
+    def test_query_budgets(self):
+        for name, (url, budget) in self.query_budgets().items():
+            with self.subTest(view=name):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertLess(response.status_code, 400, f"{name} returned {response.status_code}")
+                if len(queries) > budget:
+                    self.fail(
+                        f"{name} ran {len(queries)} queries, budget is {budget}:\n"
+                        + "\n".join(query["sql"] for query in queries.captured_queries)
+                    )
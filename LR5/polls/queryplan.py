@@ -0,0 +1,138 @@
+"""
+EXPLAIN QUERY PLAN checks of the SQL issued by the polls, stats and export
+views.
+
+``view_queries()`` drives the views with the test client against a small
+fixture, inside a transaction that is rolled back. It captures every
+statement they run. ``full_scans()`` picks the tables that SQLite reads
+without an index out of a statement's plan. Scans that are inherent to a
+view (exports of every question) are listed in EXPECTED_SCANS. Anything
+else is a missing or unused index.
+"""
+import re
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Choice, Question
+
+SCAN = re.compile(r"^SCAN (?:TABLE )?(\S+)(?: AS (\S+))?(.*)$")
+
+# Tables each view is expected to read in full. The shard table holds at
+# most one row per choice and POLLS_VOTE_SHARDS slot; the vote series
+# watermark table holds one row per rolled-up resolution.
+EXPECTED_SCANS = {
+    "stats:global_stats": {"polls_choicevoteshard"},
+    "stats:question_timeseries": {"polls_votebucketwatermark"},
+    "export:export_all_json": {"polls_question"},
+    "export:export_all_csv": {"polls_question"},
+}
+
+EXPLAINED = ("SELECT", "UPDATE", "DELETE")
+
+
+class Fixture(Exception):
+    """Raised to roll back the fixture transaction."""
+
+
+def explain(sql):
+    """Return the detail lines of the EXPLAIN QUERY PLAN of ``sql``."""
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql)
+        return [row[3] for row in cursor.fetchall()]
+
+
+def full_scans(plan):
+    """Return the tables that ``plan`` reads without using an index."""
+    tables = []
+    for detail in plan:
+        match = SCAN.match(detail)
+        if not match or match.group(1) == "CONSTANT":
+            continue
+        rest = match.group(3)
+        if "USING" in rest or "VIRTUAL TABLE" in rest:
+            continue
+        tables.append(match.group(1))
+    return tables
+
+
+def view_requests(question, choice):
+    """(name, method, url, data) of every request made by view_queries()."""
+    q = (question.id,)
+    return [
+        ("polls:index", "get", reverse("polls:index"), None),
+        ("polls:archive", "get", reverse("polls:archive"), None),
+        ("polls:search", "get", reverse("polls:search"), {"q": "explain"}),
+        ("polls:detail", "get", reverse("polls:detail", args=q), None),
+        ("polls:results", "get", reverse("polls:results", args=q), None),
+        ("polls:vote", "post", reverse("polls:vote", args=q), {"choice": choice.id}),
+        ("votes:questions", "get", reverse("votes:questions"), None),
+        ("votes:search", "get", reverse("votes:search"), {"q": "explain"}),
+        ("votes:batch", "post", reverse("votes:batch"), {"votes": [
+            {"question_id": question.id, "choice_id": choice.id, "client_vote_id": "explain-queries"},
+        ]}),
+        ("stats:question_stats", "get", reverse("stats:question_stats", args=q), None),
+        ("stats:global_stats", "get", reverse("stats:global_stats"), None),
+        ("stats:chart", "get", reverse("stats:chart", args=q), None),
+        ("stats:chart_base64", "get", reverse("stats:chart_base64", args=q), None),
+        ("stats:chart_data", "get", reverse("stats:chart_data", args=q), None),
+        ("stats:question_timeseries", "get", reverse("stats:question_timeseries", args=q), {"resolution": "day"}),
+        ("stats:question_stats_batch", "get", reverse("stats:question_stats_batch"), {"ids": str(question.id)}),
+        ("stats:analytics", "get", reverse("stats:analytics"), None),
+        ("export:export_csv", "get", reverse("export:export_csv", args=q), None),
+        ("export:export_json", "get", reverse("export:export_json", args=q), None),
+        ("export:export_all_json", "get", reverse("export:export_all_json"), None),
+        ("export:export_all_csv", "get", reverse("export:export_all_csv"), None),
+    ]
+
+
+def view_queries():
+    """
+    Return ``[(view name, sql, plan)]`` for the SELECT, UPDATE and DELETE
+    statements run by each view. The fixture and every write made by the
+    views are rolled back.
+    """
+    results = []
+    try:
+        with transaction.atomic(), override_settings(
+            ALLOWED_HOSTS=["testserver"],
+            STATS_CHART_CACHE={"ENABLED": False},
+            STATS_RENDER_POOL={"ENABLED": False},
+            STATS_ANALYTICS={"ENABLED": False},
+        ):
+            user = get_user_model().objects.create_superuser("explain-queries", password=None)
+            question = Question.objects.create(question_text="explain queries", pub_date=timezone.now())
+            choice = Choice.objects.create(question=question, choice_text="explain")
+            client = Client(raise_request_exception=False)
+            client.force_login(user)
+            # Chart rendering needs kaleido and issues no queries.
+            with mock.patch("stats_service.views.pio.to_image", return_value=b"<svg/>"):
+                for name, method, url, data in view_requests(question, choice):
+                    with CaptureQueriesContext(connection) as queries:
+                        if method == "post" and name.startswith("votes:"):
+                            client.post(url, data, content_type="application/json")
+                        else:
+                            getattr(client, method)(url, data)
+                    for query in queries.captured_queries:
+                        sql = query["sql"]
+                        if sql.lstrip().upper().startswith(EXPLAINED):
+                            results.append((name, sql, explain(sql)))
+            raise Fixture
+    except Fixture:
+        pass
+    return results
+
+
+def unexpected_scans(results):
+    """Return ``[(view name, sql, tables)]`` for scans not in EXPECTED_SCANS."""
+    report = []
+    for name, sql, plan in results:
+        tables = set(full_scans(plan)) - EXPECTED_SCANS.get(name, set())
+        if tables:
+            report.append((name, sql, sorted(tables)))
+    return report
@@ -0,0 +1,117 @@
+"""
+Full-text search over questions and the text of their choices.
+
+On SQLite the lookups go through the FTS5 table ``polls_question_search``
+(one row per question, kept in sync by the triggers of migration 0007),
+ranked with bm25 so matches in the question text weigh more than matches
+in a choice. Every word of the query is a prefix term, so "кот" also
+finds "котики". Other backends fall back to icontains lookups.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Choice, Question
+
+TABLE = "polls_question_search"
+
+# bm25() weights of the question_text and choice_text columns.
+WEIGHTS = (2.0, 1.0)
+
+
+def search_settings():
+    options = {
+        "LIMIT": 20,
+        "ADMIN_LIMIT": 500,
+    }
+    options.update(getattr(settings, "POLLS_SEARCH", {}))
+    return options
+
+
+def fts_enabled():
+    return connection.vendor == "sqlite"
+
+
+def match_expression(text):
+    """
+    Turn free text into an FTS5 query: every word becomes a quoted prefix
+    term, so operators and punctuation typed by users are never parsed as
+    query syntax. Returns None when the text has no words.
+    """
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    return " ".join('"{}"*'.format(word.replace('"', '""')) for word in words)
+
+
+def search_question_ids(text, limit=None, published_before=None):
+    """
+    Return the ids of questions matching ``text``, best match first.
+    ``published_before`` restricts the result to questions published at or
+    before that time.
+    """
+    expression = match_expression(text)
+    if expression is None:
+        return []
+    if not fts_enabled():
+        return list(_like_search(text, published_before).values_list("pk", flat=True)[:limit])
+
+    sql = f"SELECT s.rowid FROM {TABLE} s"
+    params = [expression]
+    where = [f"{TABLE} MATCH %s"]
+    if published_before is not None:
+        sql += f" JOIN {Question._meta.db_table} q ON q.id = s.rowid"
+        where.append("q.pub_date <= %s")
+        params.append(connection.ops.adapt_datetimefield_value(published_before))
+    sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY bm25({TABLE}, {WEIGHTS[0]}, {WEIGHTS[1]})"
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_questions(text, limit=None, now=None):
+    """
+    Return published questions matching ``text``, best match first.
+    """
+    ids = search_question_ids(text, limit, published_before=now or timezone.now())
+    questions = Question.objects.in_bulk(ids)
+    return [questions[pk] for pk in ids if pk in questions]
+
+
+def rebuild():
+    """
+    Repopulate the FTS table from the questions and choices tables and
+    merge its segments. Returns the number of indexed questions.
+    """
+    if not fts_enabled():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+        cursor.execute(
+            f"INSERT INTO {TABLE} (rowid, question_text, choice_text) "
+            f"SELECT q.id, q.question_text, coalesce(group_concat(c.choice_text, ' '), '') "
+            f"FROM {Question._meta.db_table} q "
+            f"LEFT JOIN {Choice._meta.db_table} c ON c.question_id = q.id "
+            f"GROUP BY q.id"
+        )
+        count = cursor.rowcount
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+    return count
+
+
+def _like_search(text, published_before=None):
+    queryset = Question.objects.all()
+    for word in re.findall(r"\w+", text):
+        queryset = queryset.filter(
+            Q(question_text__icontains=word) | Q(choice__choice_text__icontains=word)
+        )
+    if published_before is not None:
+        queryset = queryset.filter(pub_date__lte=published_before)
+    return queryset.distinct().order_by("-pub_date", "-pk")
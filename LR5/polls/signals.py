@@ -0,0 +1,10 @@
+from collections import namedtuple
+
+from django.dispatch import Signal
+
+VoteEvent = namedtuple("VoteEvent", "timestamp question_id choice_id user_id")
+
+# Sent once the transaction that accepted the votes has committed, with
+# ``votes``: a list of VoteEvent. Counters may still be pending in the
+# write-behind buffer or in vote shards at that point.
+votes_cast = Signal()
@@ -1,10 +1,42 @@
+import asyncio
+import base64
 import datetime
+import io
+import os
+import random
+import tempfile
+import threading
+from unittest import mock
 
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.urls import reverse
 
-from .models import Question
+from . import async_views
+from . import index_cache
+from .buffer import VoteBuffer
+from .eventlog import RECORD, IncompleteLog, VoteLog
+from .flusher import PeriodicFlusher
+from .idempotency import IdempotencyCache, vote_key
+from .models import (
+    Choice, ChoiceVoteShard, GlobalStats, IdempotencyKey, LeaderboardEntry, Question, UniqueVoterSketch,
+    Vote, VoteBucket,
+)
+from . import globalstats, hll, timeseries
+from .live import LiveResults
+from .leaderboard import PopularBoard, TopK, TrendingBoard, get_leaderboards, top_questions
+from .pagination import InvalidCursor, question_page
+from .search import match_expression, rebuild, search_question_ids
+from .querybudget import QueryBudgetMixin
+from . import queryplan
+from .counters import add_vote, rollup_vote_shards, total_votes_mismatches
+from .signals import VoteEvent, votes_cast
+from .voting import cast_vote
 
 
 class QuestionModelTests(TestCase):
@@ -48,7 +80,16 @@ def create_question(question_text, days):
     return Question.objects.create(question_text=question_text, pub_date=time)
 
 
-class QuestionIndexViewTests(TestCase):
+class LoggedInTestCase(TestCase):
+    """All polls pages sit behind login_required."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="voter", password="secret")
+        self.client.force_login(self.user)
+
+
+class QuestionIndexViewTests(LoggedInTestCase):
     def test_no_questions(self):
         """
         If no questions exist, an appropriate message is displayed.
@@ -106,7 +147,7 @@ class QuestionIndexViewTests(TestCase):
         )
 
 
-class QuestionDetailViewTests(TestCase):
+class QuestionDetailViewTests(LoggedInTestCase):
     def test_future_question(self):
         """
         The detail view of a question with a pub_date in the future
@@ -126,3 +167,1201 @@ class QuestionDetailViewTests(TestCase):
         url = reverse("polls:detail", args=(past_question.id,))
         response = self.client.get(url)
         self.assertContains(response, past_question.question_text)
+
+
+class VoteTests(LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.question = create_question(question_text="Hot question.", days=-1)
+        self.choice = Choice.objects.create(question=self.question, choice_text="Yes")
+        self.idempotency_cache = IdempotencyCache()
+        patcher = mock.patch("polls.voting.get_idempotency_cache", return_value=self.idempotency_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_vote_counts_on_choice(self):
+        """
+        Without sharding a vote increments Choice.votes directly.
+        """
+        url = reverse("polls:vote", args=(self.question.id,))
+        response = self.client.post(url, {"choice": self.choice.id})
+        self.assertRedirects(response, reverse("polls:results", args=(self.question.id,)))
+        self.choice.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual(self.choice.votes, 1)
+        self.assertEqual(self.question.total_votes, 1)
+        self.assertTrue(Vote.objects.filter(user=self.user, choice=self.choice).exists())
+
+    def test_failing_receiver_does_not_fail_committed_vote(self):
+        """
+        A votes_cast receiver that raises is logged; the vote still
+        redirects and the receivers after it still run.
+        """
+        def broken(sender, votes, **kwargs):
+            raise RuntimeError("disk full")
+
+        received = []
+        votes_cast.connect(broken, dispatch_uid="test-broken")
+        votes_cast.connect(lambda sender, votes, **kwargs: received.extend(votes),
+                           dispatch_uid="test-after", weak=False)
+        self.addCleanup(votes_cast.disconnect, dispatch_uid="test-broken")
+        self.addCleanup(votes_cast.disconnect, dispatch_uid="test-after")
+        with self.assertLogs("polls.voting", "ERROR"), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("polls:vote", args=(self.question.id,)), {"choice": self.choice.id}
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual([vote.choice_id for vote in received], [self.choice.id])
+
+    def test_second_vote_is_rejected(self):
+        """
+        A user can vote only once per question; the second vote leaves the
+        counters untouched.
+        """
+        other = Choice.objects.create(question=self.question, choice_text="No")
+        url = reverse("polls:vote", args=(self.question.id,))
+        self.client.post(url, {"choice": self.choice.id})
+        response = self.client.post(url, {"choice": other.id})
+        self.assertContains(response, "You have already voted on this question.")
+        self.question.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.question.total_votes, 1)
+        self.assertEqual(other.votes, 0)
+        self.assertEqual(Vote.objects.count(), 1)
+
+    def test_retry_with_idempotency_key_is_not_counted(self):
+        """
+        Resubmitting with the same idempotency key redirects to the results
+        like the first submission but counts nothing.
+        """
+        url = reverse("polls:vote", args=(self.question.id,))
+        data = {"choice": self.choice.id, "idempotency_key": "retry-1"}
+        first = self.client.post(url, data)
+        second = self.client.post(url, data)
+        self.assertEqual(first.status_code, 302)
+        self.assertEqual(second.status_code, 302)
+        self.choice.refresh_from_db()
+        self.assertEqual(self.choice.votes, 1)
+        self.assertTrue(IdempotencyKey.objects.filter(key=vote_key(self.user, self.question.id, "retry-1")).exists())
+        self.assertEqual(self.idempotency_cache.metrics()["hits"], 1)
+
+    def test_choice_is_picked_from_prefetched_choices(self):
+        """
+        The vote reads the question's choices once and rejects a choice of
+        another question.
+        """
+        other = create_question(question_text="Other question.", days=-1)
+        foreign = Choice.objects.create(question=other, choice_text="Foreign")
+        url = reverse("polls:vote", args=(self.question.id,))
+        response = self.client.post(url, {"choice": foreign.id})
+        self.assertContains(response, "You didn&#x27;t select a choice.")
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(url, {"choice": self.choice.id})
+        choice_reads = [
+            query["sql"] for query in queries.captured_queries
+            if query["sql"].startswith("SELECT") and 'FROM "polls_choice"' in query["sql"]
+        ]
+        self.assertEqual(len(choice_reads), 1, choice_reads)
+
+    def test_idempotency_key_is_checked_in_table(self):
+        """
+        A key accepted by another process is found in the table even when
+        this process's cache has never seen it.
+        """
+        IdempotencyKey.objects.create(key=vote_key(self.user, self.question.id, "other-process"))
+        url = reverse("polls:vote", args=(self.question.id,))
+        response = self.client.post(
+            url, {"choice": self.choice.id}, headers={"Idempotency-Key": "other-process"}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Vote.objects.exists())
+
+    def test_idempotency_key_is_scoped_to_user_and_question(self):
+        """
+        A client key used before by another user, or by the same user on
+        another question, does not swallow the vote.
+        """
+        other = create_question(question_text="Other question.", days=-1)
+        other_choice = Choice.objects.create(question=other, choice_text="Yes")
+        headers = {"Idempotency-Key": "shared"}
+        self.client.post(reverse("polls:vote", args=(other.id,)), {"choice": other_choice.id}, headers=headers)
+        self.client.post(reverse("polls:vote", args=(self.question.id,)), {"choice": self.choice.id}, headers=headers)
+        self.client.force_login(User.objects.create_user(username="second"))
+        self.client.post(reverse("polls:vote", args=(self.question.id,)), {"choice": self.choice.id}, headers=headers)
+        self.choice.refresh_from_db()
+        other_choice.refresh_from_db()
+        self.assertEqual((self.choice.votes, other_choice.votes), (2, 1))
+        self.assertEqual(IdempotencyKey.objects.count(), 3)
+
+    def test_expired_idempotency_key_is_ignored(self):
+        """A key past TTL_SECONDS counts as absent even before it is pruned."""
+        key = vote_key(self.user, self.question.id, "stale")
+        IdempotencyKey.objects.create(key=key, created=timezone.now() - datetime.timedelta(days=2))
+        url = reverse("polls:vote", args=(self.question.id,))
+        self.client.post(url, {"choice": self.choice.id}, headers={"Idempotency-Key": "stale"})
+        self.choice.refresh_from_db()
+        self.assertEqual(self.choice.votes, 1)
+        self.assertGreater(IdempotencyKey.objects.get(key=key).created, timezone.now() - datetime.timedelta(hours=1))
+
+    @override_settings(POLLS_VOTE_SHARDS=4)
+    def test_sharded_votes_are_summed_on_read(self):
+        """
+        With sharding, votes land in shard slots and the results page shows
+        the rolled-up total plus the pending slots.
+        """
+        for _ in range(10):
+            add_vote(self.choice.id, self.question.id)
+        self.choice.refresh_from_db()
+        self.assertEqual(self.choice.votes, 0)
+        self.assertLessEqual(ChoiceVoteShard.objects.count(), 4)
+        response = self.client.get(reverse("polls:results", args=(self.question.id,)))
+        self.assertContains(response, "Yes -- 10 votes")
+
+    @override_settings(POLLS_VOTE_SHARDS=4)
+    def test_rollup_moves_shards_into_choice(self):
+        for _ in range(7):
+            add_vote(self.choice.id, self.question.id)
+        self.assertEqual(
+            Question.objects.with_live_total_votes().get().live_total_votes, 7
+        )
+        self.assertEqual(rollup_vote_shards(), 7)
+        self.choice.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual(self.choice.votes, 7)
+        self.assertEqual(self.question.total_votes, 7)
+        self.assertFalse(ChoiceVoteShard.objects.exclude(count=0).exists())
+        self.assertEqual(Choice.objects.with_live_votes().get().live_votes, 7)
+
+
+class TotalVotesConsistencyTests(TestCase):
+    def setUp(self):
+        self.question = create_question(question_text="Consistent?", days=-1)
+        self.yes = Choice.objects.create(question=self.question, choice_text="Yes")
+        Choice.objects.create(question=self.question, choice_text="No")
+        self.empty = create_question(question_text="No choices.", days=-1)
+        add_vote(self.yes.id, self.question.id, shards=1)
+
+    def test_consistent(self):
+        self.assertEqual(total_votes_mismatches(), [])
+        out = io.StringIO()
+        call_command("check_total_votes", stdout=out)
+        self.assertIn("All question totals match", out.getvalue())
+
+    def test_check_and_repair(self):
+        Choice.objects.filter(pk=self.yes.pk).update(votes=3)
+        Question.objects.filter(pk=self.empty.pk).update(total_votes=2)
+        self.assertEqual(total_votes_mismatches(), [(self.question.id, 1, 3), (self.empty.id, 2, 0)])
+        with self.assertRaises(CommandError):
+            call_command("check_total_votes", stdout=io.StringIO())
+        call_command("check_total_votes", "--repair", stdout=io.StringIO())
+        self.assertEqual(total_votes_mismatches(), [])
+        self.assertEqual(Question.objects.get(pk=self.question.pk).total_votes, 3)
+        self.assertEqual(Question.objects.get(pk=self.empty.pk).total_votes, 0)
+
+    def test_deleting_a_choice_uncounts_its_votes(self):
+        self.yes.delete()
+        self.assertEqual(Question.objects.get(pk=self.question.pk).total_votes, 0)
+        self.assertEqual(total_votes_mismatches(), [])
+        self.assertEqual(globalstats.snapshot()["total_votes"], 0)
+        add_vote(Choice.objects.get(question=self.question).pk, self.question.id, shards=1)
+        self.question.delete()
+        self.assertEqual(globalstats.snapshot()["total_votes"], 0)
+        self.assertEqual(globalstats.reconcile(), [])
+
+
+class TopKTests(TestCase):
+    def test_keeps_the_k_best(self):
+        top = TopK(3)
+        for key, score in [("a", 1), ("b", 5), ("c", 3), ("d", 2), ("e", 0)]:
+            top.offer(key, score)
+        self.assertEqual(top.items(), [("b", 5), ("c", 3), ("d", 2)])
+        self.assertFalse(top.offer("f", 2))
+        self.assertTrue(top.offer("d", 6))
+        self.assertTrue(top.offer("a", 4))
+        self.assertEqual(top.items(), [("d", 6), ("b", 5), ("a", 4)])
+        self.assertTrue(top.discard("b"))
+        self.assertEqual(top.items(), [("d", 6), ("a", 4)])
+
+    def test_matches_sorting_under_churn(self):
+        rng = random.Random(1)
+        top, scores = TopK(5), {}
+        for _ in range(2000):
+            key = rng.randrange(50)
+            scores[key] = scores.get(key, 0) + rng.randrange(1, 4)
+            top.offer(key, scores[key])
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:5]
+        self.assertEqual(sorted(v for _, v in top.items()), sorted(v for _, v in best))
+
+
+@mock.patch.dict("polls.leaderboard._boards", clear=True)
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        self.questions = [create_question(question_text=f"Q{i}.", days=-1) for i in range(4)]
+        self.choices = [Choice.objects.create(question=q, choice_text="Yes") for q in self.questions]
+
+    def vote(self, index, count=1, days_ago=0):
+        for _ in range(count):
+            Vote.objects.create(
+                question=self.questions[index], choice=self.choices[index],
+                timestamp=timezone.now() - datetime.timedelta(days=days_ago),
+            )
+            add_vote(self.choices[index].id, self.questions[index].id, shards=1)
+
+    def test_popular_board_follows_votes(self):
+        board = PopularBoard(k=2, flush_interval=0)
+        board.load()
+        self.vote(2, 3)
+        self.vote(1, 2)
+        board.touch({self.questions[2].id, self.questions[1].id})
+        self.assertEqual(
+            list(LeaderboardEntry.objects.filter(board="popular").order_by("-score").values_list("question_id", "score")),
+            [(self.questions[2].id, 3), (self.questions[1].id, 2)],
+        )
+        self.vote(3, 4)
+        board.touch({self.questions[3].id})
+        self.assertEqual(
+            [question_id for question_id, _ in board.top.items()],
+            [self.questions[3].id, self.questions[2].id],
+        )
+        self.questions[3].delete()
+        board.flush()
+        self.assertEqual(set(board.top.scores), {self.questions[2].id})
+
+    def test_boards_merge_rows_of_other_processes(self):
+        first, second = PopularBoard(k=2, flush_interval=60), PopularBoard(k=2, flush_interval=60)
+        first.load()
+        second.load()
+        self.vote(0, 5)
+        first.touch({self.questions[0].id})
+        self.vote(1, 1)
+        second.touch({self.questions[1].id})
+        self.assertEqual(set(second.top.scores), {self.questions[0].id, self.questions[1].id})
+
+    def test_trending_prefers_recent_votes(self):
+        board = TrendingBoard(k=3, flush_interval=0, half_life=24 * 60 * 60)
+        self.vote(0, 8, days_ago=4)
+        self.vote(1, 2)
+        self.vote(2, 1, days_ago=30)
+        board.load()
+        now = timezone.now()
+        scores = dict(board.top.items())
+        self.assertEqual(list(scores), [self.questions[1].id, self.questions[0].id])
+        self.assertAlmostEqual(board.display(scores[self.questions[0].id], now), 0.5, places=3)
+        self.assertAlmostEqual(board.display(scores[self.questions[1].id], now), 2, places=3)
+
+    def test_trending_flush_scores_from_memory(self):
+        board = TrendingBoard(k=2, flush_interval=0, half_life=24 * 60 * 60)
+        self.vote(0, 1)
+        board.load()
+        now = timezone.now()
+        events = [VoteEvent(now, self.questions[1].id, self.choices[1].id, None)] * 3
+        board.add(events)
+        with CaptureQueriesContext(connection) as queries:
+            board.touch({self.questions[1].id}, now)
+        self.assertFalse([q["sql"] for q in queries.captured_queries if '"polls_vote"' in q["sql"]])
+        scores = dict(board.top.items())
+        self.assertEqual(list(scores), [self.questions[1].id, self.questions[0].id])
+        self.assertAlmostEqual(board.display(scores[self.questions[1].id], now), 3, places=3)
+        # A higher score written by another process is adopted
+        LeaderboardEntry.objects.filter(board="trending", question=self.questions[0]).update(
+            score=board.exponent(now) + 3
+        )
+        board.flush(now)
+        self.assertEqual(board.top.items()[0][0], self.questions[0].id)
+
+    def test_reads_after_a_quiet_period_see_every_vote(self):
+        users = [User.objects.create_user(username=f"fan{i}") for i in range(5)]
+        with mock.patch.dict("polls.leaderboard._boards", clear=True):
+            boards = get_leaderboards().values()
+
+            def wait_out_the_interval():
+                for board in boards:
+                    board._flushed_at -= 6
+
+            wait_out_the_interval()
+            with self.captureOnCommitCallbacks(execute=True):
+                cast_vote(self.choices[0], users[0])
+            with self.captureOnCommitCallbacks(execute=True):
+                for user in users[1:]:
+                    cast_vote(self.choices[1], user)
+            popular = [(question.id, votes) for question, votes in top_questions("popular")]
+            self.assertEqual(popular[:2], [(self.questions[0].id, 1), (self.questions[1].id, 0)])
+            # No vote arrives for longer than the flush interval.
+            wait_out_the_interval()
+            popular = [(question.id, votes) for question, votes in top_questions("popular")]
+            self.assertEqual(popular[:2], [(self.questions[1].id, 4), (self.questions[0].id, 1)])
+            self.assertEqual(top_questions("trending")[0][0], self.questions[1])
+
+    def test_background_flusher_flushes_the_boards(self):
+        with mock.patch.dict("polls.leaderboard._boards", clear=True), \
+                mock.patch("polls.leaderboard.PeriodicFlusher") as flusher_class, \
+                self.settings(POLLS_LEADERBOARD={"FLUSH_IN_BACKGROUND": True}):
+            board = get_leaderboards()["popular"]
+        name, interval, flush = flusher_class.call_args.args
+        self.assertEqual((name, interval), ("leaderboards", 5))
+        flusher_class.return_value.start.assert_called_once_with()
+        self.vote(2, 3)
+        board.touch({self.questions[2].id})
+        self.assertEqual(board.top.scores[self.questions[2].id], 0)
+        board._flushed_at -= 6
+        flush()
+        self.assertEqual(board.top.scores[self.questions[2].id], 3)
+
+    def test_votes_feed_boards_and_stats_read_k_rows(self):
+        user = User.objects.create_user(username="fan")
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_vote(self.choices[3], user)
+        self.assertEqual(top_questions("popular")[0][0], self.questions[3])
+        self.assertEqual(top_questions("trending")[0][0], self.questions[3])
+        LeaderboardEntry.objects.all().delete()
+        call_command("rebuild_leaderboards", stdout=io.StringIO())
+        self.assertEqual(top_questions("popular")[0], (self.questions[3], 1))
+
+
+class GlobalStatsTests(TestCase):
+    def test_counters_follow_questions_and_votes(self):
+        question = create_question(question_text="Counted.", days=-1)
+        create_question(question_text="Old.", days=-30)
+        choice = Choice.objects.create(question=question, choice_text="Yes")
+        add_vote(choice.id, question.id, shards=1)
+        self.assertEqual(
+            globalstats.snapshot(),
+            {"total_questions": 2, "total_votes": 1, "recent_questions": 1},
+        )
+        question.pub_date -= datetime.timedelta(days=20)
+        question.save()
+        self.assertEqual(globalstats.snapshot()["recent_questions"], 0)
+        question.refresh_from_db()
+        self.assertEqual(question.total_votes, 1)
+        question.delete()
+        self.assertEqual(
+            globalstats.snapshot(),
+            {"total_questions": 1, "total_votes": 0, "recent_questions": 0},
+        )
+        self.assertEqual(globalstats.reconcile(), [])
+
+    def test_votes_spread_over_slots(self):
+        question = create_question(question_text="Slotted.", days=-1)
+        choice = Choice.objects.create(question=question, choice_text="Yes")
+        with mock.patch("polls.globalstats.random.randint", side_effect=[3, 5, 1]):
+            for _ in range(3):
+                add_vote(choice.id, question.id, shards=1)
+        self.assertEqual(GlobalStats.objects.filter(total_votes=1).count(), 3)
+        self.assertEqual(globalstats.snapshot()["total_votes"], 3)
+        self.assertEqual(globalstats.reconcile(), [])
+        self.assertEqual(
+            list(GlobalStats.objects.order_by("pk").values_list("pk", "total_votes")),
+            [(1, 3), (3, 0), (5, 0)],
+        )
+
+    def test_snapshot_is_one_query(self):
+        create_question(question_text="Cheap.", days=0)
+        with self.assertNumQueries(1):
+            self.assertEqual(globalstats.snapshot()["recent_questions"], 1)
+
+    @override_settings(POLLS_VOTE_SHARDS=4)
+    def test_pending_shards_are_counted(self):
+        question = create_question(question_text="Sharded.", days=-1)
+        choice = Choice.objects.create(question=question, choice_text="Yes")
+        add_vote(choice.id, question.id)
+        self.assertEqual(globalstats.snapshot()["total_votes"], 1)
+        rollup_vote_shards()
+        self.assertEqual(globalstats.snapshot()["total_votes"], 1)
+
+    def test_reconcile_repairs_untracked_writes(self):
+        Question.objects.bulk_create([
+            Question(question_text=f"Bulk {i}.", pub_date=timezone.now(), total_votes=2) for i in range(3)
+        ])
+        self.assertEqual(globalstats.snapshot()["total_questions"], 0)
+        out = io.StringIO()
+        call_command("reconcile_global_stats", stdout=out)
+        self.assertIn("total_questions: stored 0, actual 3", out.getvalue())
+        self.assertEqual(
+            globalstats.snapshot(),
+            {"total_questions": 3, "total_votes": 6, "recent_questions": 3},
+        )
+
+
+class IdempotencyCacheTests(TestCase):
+    def test_lru_keeps_recently_used_keys(self):
+        cache = IdempotencyCache(max_keys=2, eviction="lru")
+        cache.add("a")
+        cache.add("b")
+        self.assertTrue(cache.seen("a"))
+        cache.add("c")
+        self.assertTrue(cache.seen("a"))
+        self.assertFalse(cache.seen("b"))
+        self.assertEqual(cache.metrics()["evictions"], 1)
+
+    def test_fifo_evicts_oldest_keys(self):
+        cache = IdempotencyCache(max_keys=2, eviction="fifo")
+        cache.add("a")
+        cache.add("b")
+        self.assertTrue(cache.seen("a"))
+        cache.add("c")
+        self.assertFalse(cache.seen("a"))
+
+    def test_ttl_and_hit_rate(self):
+        cache = IdempotencyCache(ttl_seconds=60)
+        with mock.patch("polls.idempotency.time.monotonic", return_value=1000.0):
+            cache.add("a")
+            self.assertTrue(cache.seen("a"))
+        with mock.patch("polls.idempotency.time.monotonic", return_value=1061.0):
+            self.assertFalse(cache.seen("a"))
+        self.assertEqual(cache.metrics()["hit_rate"], 0.5)
+
+
+class VoteBufferTests(TestCase):
+    def setUp(self):
+        question = create_question(question_text="Buffered question.", days=-1)
+        self.yes = Choice.objects.create(question=question, choice_text="Yes")
+        self.no = Choice.objects.create(question=question, choice_text="No")
+
+    def test_flush_collapses_votes_per_choice(self):
+        buffer = VoteBuffer(flush_max_votes=100)
+        for _ in range(3):
+            buffer.add(self.yes.id)
+        buffer.add(self.no.id)
+        self.assertEqual(buffer.metrics()["buffer_depth"], 4)
+        self.assertEqual(buffer.pending_votes(self.yes.id), 3)
+
+        self.assertEqual(buffer.flush(), 4)
+        self.yes.refresh_from_db()
+        self.no.refresh_from_db()
+        self.assertEqual((self.yes.votes, self.no.votes), (3, 1))
+        self.assertEqual(Question.objects.get().total_votes, 4)
+        metrics = buffer.metrics()
+        self.assertEqual(metrics["buffer_depth"], 0)
+        self.assertEqual(metrics["flushes"], 1)
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_spill_file_is_replayed(self):
+        """
+        Votes accepted but never flushed are written by the next buffer
+        opened on the same spill file.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            spill_file = os.path.join(directory, "votes.spill")
+            crashed = VoteBuffer(spill_file=spill_file)
+            crashed.add(self.yes.id)
+            crashed.add(self.yes.id)
+            # A second process sharing the setting takes the next slot
+            worker = VoteBuffer(spill_file=spill_file)
+            self.assertEqual(worker.spill_file, spill_file + "-1")
+            worker.add(self.no.id)
+            # A crashed process leaves its files but releases its lock
+            crashed._spill.close()
+            crashed._spill_lock.close()
+
+            buffer = VoteBuffer(spill_file=spill_file)
+            self.assertEqual(buffer.spill_file, spill_file)
+            self.yes.refresh_from_db()
+            self.assertEqual(self.yes.votes, 2)
+            buffer.add(self.no.id)
+            buffer.close()
+            worker.close()
+            self.no.refresh_from_db()
+            self.assertEqual(self.no.votes, 2)
+            self.assertEqual(
+                sorted(os.listdir(directory)),
+                ["votes.spill", "votes.spill-1", "votes.spill-1.lock", "votes.spill.lock"],
+            )
+            self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_slots_of_dead_processes_are_replayed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            spill_file = os.path.join(directory, "votes.spill")
+            first, second = VoteBuffer(spill_file=spill_file), VoteBuffer(spill_file=spill_file)
+            first.add(self.yes.id)
+            second.add(self.no.id)
+            second.add(self.no.id)
+            for crashed in (first, second):
+                crashed._spill.close()
+                crashed._spill_lock.close()
+
+            # One process comes back: it takes slot 0 and replays slot 1 too
+            VoteBuffer(spill_file=spill_file).close()
+            self.yes.refresh_from_db()
+            self.no.refresh_from_db()
+            self.assertEqual((self.yes.votes, self.no.votes), (1, 2))
+            self.assertEqual(
+                sorted(os.listdir(directory)), ["votes.spill", "votes.spill-1.lock", "votes.spill.lock"],
+            )
+
+    def test_applied_spill_is_not_replayed(self):
+        """A crash after a flush commits but before its file is removed."""
+        with tempfile.TemporaryDirectory() as directory:
+            spill_file = os.path.join(directory, "votes.spill")
+            crashed = VoteBuffer(spill_file=spill_file)
+            crashed.add(self.yes.id)
+            with mock.patch("polls.buffer.os.remove", side_effect=OSError("crash")):
+                with self.assertRaises(OSError):
+                    crashed.flush()
+            crashed._spill.close()
+            crashed._spill_lock.close()
+
+            # A prune before the restart keeps the marker
+            IdempotencyKey.objects.update(created=timezone.now() - datetime.timedelta(days=30))
+            call_command("prune_idempotency_keys", stdout=io.StringIO())
+            self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+            VoteBuffer(spill_file=spill_file).close()
+            self.yes.refresh_from_db()
+            self.assertEqual(self.yes.votes, 1)
+            self.assertEqual(sorted(os.listdir(directory)), ["votes.spill", "votes.spill.lock"])
+
+
+class AsyncViewTests(LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.question = create_question(question_text="Async question.", days=-1)
+        self.choice = Choice.objects.create(question=self.question, choice_text="Yes")
+        self.factory = AsyncRequestFactory()
+
+    def request(self, method, path, data=None):
+        request = getattr(self.factory, method)(path, data)
+        request.user = self.user
+
+        async def auser():
+            return self.user
+
+        request.auser = auser
+        return request
+
+    async def test_index_and_detail(self):
+        response = await async_views.IndexView.as_view()(self.request("get", "/polls/"))
+        self.assertContains(response, "Async question.")
+        response = await async_views.DetailView.as_view()(
+            self.request("get", "/polls/1/"), pk=self.question.id
+        )
+        self.assertContains(response, 'value="%s"' % self.choice.id)
+
+    async def test_vote_then_results(self):
+        response = await async_views.vote(
+            self.request("post", "/vote/", {"choice": self.choice.id}), self.question.id
+        )
+        self.assertEqual(response.status_code, 302)
+        response = await async_views.ResultsView.as_view()(
+            self.request("get", "/results/"), pk=self.question.id
+        )
+        self.assertContains(response, "Yes -- 1 vote")
+        response = await async_views.vote(
+            self.request("post", "/vote/", {"choice": self.choice.id}), self.question.id
+        )
+        self.assertContains(response, "You have already voted on this question.")
+
+
+class VoteLogTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.start = timezone.now()
+
+    def event(self, seconds, choice_id, question_id=1, user_id=None):
+        return VoteEvent(
+            self.start + datetime.timedelta(seconds=seconds), question_id, choice_id, user_id
+        )
+
+    def test_segments_rotate_and_read_back(self):
+        log = VoteLog(self.directory, segment_bytes=RECORD.size * 2, fsync="always")
+        for second in range(5):
+            log.append([self.event(second, choice_id=10 + second % 2, user_id=7)])
+        self.assertEqual(log.segments(), [1, 2, 3])
+        events = [event for _, event in log.read()]
+        self.assertEqual([e.choice_id for e in events], [10, 11, 10, 11, 10])
+        self.assertEqual(events[0].user_id, 7)
+        self.assertEqual(log.end_position(), (3, RECORD.size))
+
+    def test_snapshot_compaction_and_point_in_time_replay(self):
+        log = VoteLog(self.directory, segment_bytes=RECORD.size * 2)
+        log.append([self.event(0, 10), self.event(1, 10)])
+        log.take_snapshot()
+        log.append([self.event(2, 11), self.event(3, 11)])
+        log.take_snapshot()
+        log.append([self.event(4, 10)])
+
+        self.assertEqual(log.compact(keep_snapshots=1), 1)
+        self.assertEqual(len(log.snapshots()), 1)
+        totals, _, _ = log.replay()
+        self.assertEqual(totals, {10: 3, 11: 2})
+        totals, _, _ = log.replay(until=self.start + datetime.timedelta(seconds=3))
+        self.assertEqual(totals, {10: 2, 11: 2})
+        # The segment before the kept snapshot is gone
+        with self.assertRaises(IncompleteLog):
+            log.replay(until=self.start + datetime.timedelta(seconds=1))
+
+    def test_point_in_time_replay_sees_votes_logged_out_of_order(self):
+        """
+        Another worker can log an older vote after a newer one; a replay
+        up to a moment between them still counts the older vote.
+        """
+        log = VoteLog(self.directory)
+        log.append([self.event(1, 10)])
+        log.append([self.event(5, 11)])
+        log.append([self.event(2, 10)])
+        log.take_snapshot()
+        log.append([self.event(3, 11), self.event(6, 10)])
+        until = self.start + datetime.timedelta(seconds=4)
+        self.assertEqual([event.choice_id for _, event in log.read(until=until)], [10, 10, 11])
+        # The snapshot holds a vote newer than ``until``, so it is not used
+        totals, _, last_timestamp = log.replay(until=until)
+        self.assertEqual((totals, last_timestamp), ({10: 2, 11: 1}, self.start + datetime.timedelta(seconds=3)))
+        self.assertEqual(log.load_snapshot()["last_timestamp"], self.start + datetime.timedelta(seconds=5))
+        self.assertEqual(log.replay()[0], {10: 3, 11: 2})
+
+    def test_rebuild_counters_from_log(self):
+        question = create_question(question_text="Logged question.", days=-1)
+        yes = Choice.objects.create(question=question, choice_text="Yes")
+        no = Choice.objects.create(question=question, choice_text="No")
+        options = {"ENABLED": True, "DIR": self.directory, "FSYNC": "never"}
+        with override_settings(POLLS_VOTE_LOG=options):
+            with self.captureOnCommitCallbacks(execute=True):
+                for i, choice in enumerate([yes, yes, no]):
+                    cast_vote(choice, User.objects.create_user(username=f"logged{i}"))
+            Choice.objects.update(votes=100)
+            call_command("rebuild_votes_from_log", stdout=io.StringIO())
+        yes.refresh_from_db()
+        no.refresh_from_db()
+        question.refresh_from_db()
+        self.assertEqual((yes.votes, no.votes, question.total_votes), (2, 1, 3))
+
+    def test_rebuild_refuses_compacted_point_in_time(self):
+        question = create_question(question_text="Compacted question.", days=-1)
+        yes = Choice.objects.create(question=question, choice_text="Yes", votes=5)
+        log = VoteLog(self.directory, segment_bytes=RECORD.size)
+        log.append([self.event(0, yes.id)])
+        log.append([self.event(1, yes.id)])
+        log.take_snapshot()
+        self.assertEqual(log.compact(keep_snapshots=1), 1)
+        options = {"ENABLED": True, "DIR": self.directory, "FSYNC": "never"}
+        with override_settings(POLLS_VOTE_LOG=options), self.assertRaises(CommandError):
+            call_command(
+                "rebuild_votes_from_log", until=self.start.isoformat(), stdout=io.StringIO()
+            )
+        yes.refresh_from_db()
+        self.assertEqual(yes.votes, 5)
+
+
+class IndexCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def lookup(self, now=None):
+        before = index_cache.metrics()
+        questions = index_cache.latest_questions(5, now=now)
+        after = index_cache.metrics()
+        hit = after["hits"] - before["hits"] == 1
+        return questions, hit
+
+    def test_second_lookup_is_a_hit(self):
+        question = create_question(question_text="Cached.", days=-1)
+        self.assertEqual(self.lookup(), ([question], False))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.lookup(), ([question], True))
+
+    def test_saving_a_question_invalidates(self):
+        question = create_question(question_text="Before.", days=-1)
+        self.lookup()
+        question.question_text = "After."
+        question.save()
+        questions, hit = self.lookup()
+        self.assertFalse(hit)
+        self.assertEqual(questions[0].question_text, "After.")
+
+    def test_refresh_at_next_publication(self):
+        """
+        A question scheduled for later shows up once its pub_date passes,
+        without any save in between.
+        """
+        future = create_question(question_text="Scheduled.", days=1)
+        self.assertEqual(self.lookup(), ([], False))
+        self.assertEqual(self.lookup(), ([], True))
+        later = timezone.now() + datetime.timedelta(days=2)
+        self.assertEqual(self.lookup(now=later), ([future], False))
+
+
+class QuestionPaginationTests(LoggedInTestCase):
+    def test_pages_cover_every_question_once(self):
+        """
+        Walking the cursors visits each published question exactly once,
+        newest first, including questions sharing a pub_date.
+        """
+        pub_date = timezone.now() - datetime.timedelta(days=1)
+        tied = [Question.objects.create(question_text=f"Tied {i}.", pub_date=pub_date) for i in range(3)]
+        older = [create_question(question_text=f"Old {i}.", days=-2 - i) for i in range(3)]
+        create_question(question_text="Future.", days=1)
+        seen, cursor = [], None
+        while True:
+            page, cursor = question_page(cursor, size=2)
+            seen.extend(page)
+            if cursor is None:
+                break
+        self.assertEqual(seen, tied[::-1] + older)
+
+    def test_invalid_cursor(self):
+        forged = [
+            # naive timestamp, impossible date, pk beyond 64 bits
+            "2020-01-01T00:00:00|5", "2024-02-30T00:00:00+00:00|5", f"2020-01-01T00:00:00+00:00|{10 ** 23}",
+        ]
+        forged = [base64.urlsafe_b64encode(raw.encode()).decode() for raw in forged]
+        for cursor in ("garbage", "bm90LWEtZGF0ZXwx", "MjAyNC0wMS0wMXxhYmM", *forged):
+            with self.assertRaises(InvalidCursor):
+                question_page(cursor)
+        response = self.client.get(reverse("polls:archive"), {"cursor": forged[0]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_archive_view(self):
+        for i in range(3):
+            create_question(question_text=f"Past {i}.", days=-1 - i)
+        with self.settings(POLLS_QUESTION_PAGE_SIZE=2):
+            response = self.client.get(reverse("polls:archive"))
+            self.assertQuerySetEqual(response.context["question_list"], [
+                Question.objects.get(question_text="Past 0."),
+                Question.objects.get(question_text="Past 1."),
+            ])
+            response = self.client.get(reverse("polls:archive"), {"cursor": response.context["next_cursor"]})
+        self.assertContains(response, "Past 2.")
+        self.assertIsNone(response.context["next_cursor"])
+
+    def test_archive_view_rejects_bad_cursor(self):
+        response = self.client.get(reverse("polls:archive"), {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 400)
+
+
+class QuestionSearchTests(LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tea = create_question(question_text="Любимый чай?", days=-1)
+        Choice.objects.create(question=self.tea, choice_text="Зелёный")
+        self.drinks = create_question(question_text="Что пить утром?", days=-2)
+        Choice.objects.create(question=self.drinks, choice_text="Чай")
+        Choice.objects.create(question=self.drinks, choice_text="Кофе")
+
+    def test_match_expression_quotes_words(self):
+        self.assertEqual(match_expression('чай OR "кофе'), '"чай"* "OR"* "кофе"*')
+        self.assertIsNone(match_expression(" -*- "))
+
+    def test_prefix_search_ranks_question_text_first(self):
+        self.assertEqual(search_question_ids("ча"), [self.tea.id, self.drinks.id])
+        self.assertEqual(search_question_ids("кофе утр"), [self.drinks.id])
+        self.assertEqual(search_question_ids("какао"), [])
+
+    def test_index_follows_writes(self):
+        """
+        Triggers keep the index in sync for saves, queryset updates and
+        deletes of both questions and choices.
+        """
+        Question.objects.filter(pk=self.tea.pk).update(question_text="Любимый сорт?")
+        self.assertEqual(search_question_ids("любим"), [self.tea.id])
+        Choice.objects.filter(question=self.drinks, choice_text="Кофе").delete()
+        self.assertEqual(search_question_ids("кофе"), [])
+        Choice.objects.bulk_create([Choice(question=self.tea, choice_text="Улун")])
+        self.assertEqual(search_question_ids("улун"), [self.tea.id])
+        self.drinks.delete()
+        self.assertEqual(search_question_ids("чай"), [])
+        self.assertEqual(rebuild(), 1)
+        self.assertEqual(search_question_ids("улун зелён"), [self.tea.id])
+
+    def test_search_view(self):
+        create_question(question_text="Чай в будущем?", days=1)
+        response = self.client.get(reverse("polls:search"), {"q": "чай"})
+        self.assertEqual(response.context["question_list"], [self.tea, self.drinks])
+        response = self.client.get(reverse("polls:search"), {"q": "какао"})
+        self.assertContains(response, "No polls match your search.")
+
+    def test_admin_search_is_ranked(self):
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        response = self.client.get(reverse("admin:polls_question_changelist"), {"q": "ча"})
+        self.assertEqual(list(response.context["cl"].result_list), [self.tea, self.drinks])
+
+
+class PollsQueryBudgetTests(QueryBudgetMixin, LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.question = create_question(question_text="Budgeted.", days=-1)
+        for text in ("A", "B", "C", "D"):
+            Choice.objects.create(question=self.question, choice_text=text)
+
+    def query_budgets(self):
+        return {
+            # session, user, latest questions, next publication date
+            "polls:index": (reverse("polls:index"), 4),
+            # session, user, question, choices
+            "polls:detail": (reverse("polls:detail", args=(self.question.id,)), 4),
+            "polls:results": (reverse("polls:results", args=(self.question.id,)), 4),
+            # session, user, questions page
+            "polls:archive": (reverse("polls:archive"), 3),
+        }
+
+    @override_settings(POLLS_VOTE_SHARDS=4)
+    def test_sharded_results_budget(self):
+        url = reverse("polls:results", args=(self.question.id,))
+        with self.assertNumQueries(4):
+            self.client.get(url)
+
+
+class QueryPlanTests(TestCase):
+    def test_full_scans(self):
+        plan = [
+            "SCAN polls_question",
+            "SCAN polls_question USING COVERING INDEX question_total_votes",
+            "SEARCH polls_choice USING INDEX choice_question_votes (question_id=?)",
+            "SCAN polls_question_search VIRTUAL TABLE INDEX 0:M2",
+            "SCAN CONSTANT ROW",
+            "SCAN TABLE polls_vote AS U0",
+        ]
+        self.assertEqual(queryplan.full_scans(plan), ["polls_question", "polls_vote"])
+
+    def test_views_use_indexes(self):
+        """
+        Every query of the polls, stats and export views reads through an
+        index, apart from the scans listed in EXPECTED_SCANS.
+        """
+        results = queryplan.view_queries()
+        self.assertEqual(
+            {name for name, _, _ in results},
+            {name for name, *_ in queryplan.view_requests(Question(id=1), Choice(id=1))},
+        )
+        self.assertEqual(queryplan.unexpected_scans(results), [])
+        self.assertFalse(Question.objects.exists())
+
+
+
+class VoteSeriesTests(TestCase):
+    def setUp(self):
+        self.question = create_question(question_text="Series.", days=-5)
+        self.yes = Choice.objects.create(question=self.question, choice_text="Yes")
+        self.no = Choice.objects.create(question=self.question, choice_text="No")
+        self.now = timezone.make_aware(datetime.datetime(2026, 3, 10, 14, 30))
+
+    def record(self, choice, moment, count=1):
+        timeseries.record_votes(None, [
+            VoteEvent(moment, self.question.id, choice.id, None) for _ in range(count)
+        ])
+
+    def totals(self, resolution, start, end):
+        return {
+            choice_id: dict(counts)
+            for choice_id, counts in timeseries.series(self.question.id, resolution, start, end).items()
+        }
+
+    def test_bucket_count_matches_buckets(self):
+        start = self.now - datetime.timedelta(days=3, minutes=7)
+        for resolution in timeseries.RESOLUTIONS:
+            expected = len(timeseries.buckets(resolution, start, self.now))
+            self.assertAlmostEqual(timeseries.bucket_count(resolution, start, self.now), expected, delta=1)
+        self.assertEqual(timeseries.bucket_count("minute", start, self.now), 3 * 24 * 60 + 7)
+
+    def test_cast_votes_land_in_minute_buckets(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_vote(self.yes, User.objects.create_user(username="a"))
+            cast_vote(self.yes, User.objects.create_user(username="b"))
+        bucket = VoteBucket.objects.get()
+        self.assertEqual((bucket.choice_id, bucket.resolution, bucket.count), (self.yes.id, "minute", 2))
+
+    def test_compaction_rolls_up_and_series_read_across_watermark(self):
+        hour = timezone.make_aware(datetime.datetime(2026, 3, 10, 12))
+        with mock.patch("polls.timeseries.timezone.now", return_value=hour):
+            self.record(self.yes, hour + datetime.timedelta(minutes=5), 2)
+            self.record(self.no, hour + datetime.timedelta(minutes=59))
+            self.record(self.yes, hour + datetime.timedelta(minutes=65))
+        self.record(self.yes, self.now - datetime.timedelta(days=1))
+        before = self.totals("hour", self.now - datetime.timedelta(days=2), self.now)
+
+        written = timeseries.compact(self.now)
+        self.assertEqual(written["hour"][0], 4)
+        self.assertEqual(written["day"][0], 1)
+        self.assertEqual(self.totals("hour", self.now - datetime.timedelta(days=2), self.now), before)
+        self.assertEqual(before[self.yes.id][hour], 2)
+        self.assertEqual(before[self.yes.id][hour + datetime.timedelta(hours=1)], 1)
+        day = timeseries.floor(self.now, "day")
+        self.assertEqual(
+            self.totals("day", day - datetime.timedelta(days=1), self.now),
+            {self.yes.id: {day - datetime.timedelta(days=1): 1, day: 3}, self.no.id: {day: 1}},
+        )
+        # Hourly reads now come from hour buckets only
+        with self.assertNumQueries(2):
+            timeseries.series(self.question.id, "hour", hour, hour + datetime.timedelta(hours=2))
+
+        # A vote replayed late into an already compacted hour still counts
+        self.record(self.no, hour + datetime.timedelta(minutes=10))
+        self.assertEqual(self.totals("hour", hour, hour + datetime.timedelta(hours=1))[self.no.id], {hour: 2})
+
+    def test_hour_buckets_start_on_utc_hours_in_any_offset(self):
+        utc = datetime.timezone.utc
+        self.record(self.yes, datetime.datetime(2026, 3, 10, 5, 10, tzinfo=utc), 3)
+        start = datetime.datetime(2026, 3, 10, 3, 40, tzinfo=utc)
+        india = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+        for moment in (start, start.astimezone(india)):
+            with self.subTest(moment=moment.isoformat()):
+                self.assertEqual(timeseries.floor(moment, "hour"), datetime.datetime(2026, 3, 10, 3, tzinfo=utc))
+                self.assertEqual(
+                    self.totals("hour", moment, moment + datetime.timedelta(hours=3)),
+                    {self.yes.id: {datetime.datetime(2026, 3, 10, 5, tzinfo=utc): 3}},
+                )
+
+    @override_settings(POLLS_VOTE_SERIES={"MINUTE_RETENTION_SECONDS": 3600})
+    def test_retention_keeps_buckets_not_rolled_up(self):
+        self.record(self.yes, self.now - datetime.timedelta(hours=3))
+        self.record(self.yes, self.now - datetime.timedelta(minutes=5))
+        timeseries.compact(self.now)
+        minutes = VoteBucket.objects.filter(resolution="minute")
+        self.assertEqual([bucket.start for bucket in minutes], [self.now - datetime.timedelta(minutes=5)])
+        self.assertEqual(
+            sum(self.totals("minute", self.now - datetime.timedelta(hours=4), self.now)[self.yes.id].values()), 1,
+        )
+        self.assertEqual(
+            sum(self.totals("hour", self.now - datetime.timedelta(hours=4), self.now)[self.yes.id].values()), 2,
+        )
+
+
+class LiveResultsTests(TestCase):
+    async def test_one_broadcast_per_question_per_tick(self):
+        live = LiveResults(queue_size=2)
+        first, second, other = live.subscribe(1), live.subscribe(1), live.subscribe(2)
+        now = timezone.now()
+        live.publish([VoteEvent(now, 1, 10, None), VoteEvent(now, 1, 10, None), VoteEvent(now, 1, 11, None),
+                      VoteEvent(now, 3, 30, None)])
+        live.tick()
+        message = await asyncio.wait_for(first.get(), 1)
+        self.assertIs(await asyncio.wait_for(second.get(), 1), message)
+        self.assertEqual(
+            message,
+            b'event: votes\ndata: {"question_id":1,"choices":{"10":2,"11":1},"total":3}\n\n',
+        )
+        self.assertTrue(other.queue.empty())
+        self.assertEqual(live.metrics()["broadcasts"], 1)
+
+        # A watcher that falls behind is cut off instead of buffering forever
+        for _ in range(3):
+            live.publish([VoteEvent(now, 1, 10, None)])
+            live.tick()
+            await asyncio.sleep(0)
+        self.assertTrue(second.dropped)
+        self.assertEqual([await second.get(), await second.get()][-1], None)
+
+    async def test_votes_in_the_snapshot_are_not_sent_again(self):
+        live = LiveResults()
+        subscription = live.subscribe(1)
+        now = timezone.now()
+        live.publish([VoteEvent(now, 1, 10, None)])
+        live.tick()
+        live.publish([VoteEvent(now, 1, 10, None), VoteEvent(now, 1, 11, None)])
+        # The snapshot read now holds the three votes above
+        live.mark(subscription)
+        live.publish([VoteEvent(now, 1, 11, None)])
+        live.tick()
+        live.publish([VoteEvent(now, 1, 10, None)])
+        live.tick()
+        self.assertEqual(
+            await asyncio.wait_for(subscription.get(), 1),
+            b'event: votes\ndata: {"question_id":1,"choices":{"11":1},"total":1}\n\n',
+        )
+        self.assertEqual(
+            await asyncio.wait_for(subscription.get(), 1),
+            b'event: votes\ndata: {"question_id":1,"choices":{"10":1},"total":1}\n\n',
+        )
+
+    @override_settings(POLLS_LIVE_RESULTS={"ENABLED": True})
+    async def test_vote_between_subscribe_and_snapshot_is_counted_once(self):
+        user = await User.objects.acreate_user(username="racer")
+        question = await Question.objects.acreate(question_text="Race?", pub_date=timezone.now())
+        # The fifth vote commits after the stream subscribes, before its snapshot
+        choice = await Choice.objects.acreate(question=question, choice_text="Yes", votes=5)
+        await self.async_client.aforce_login(user)
+        live = LiveResults()
+        real_mark = live.mark
+
+        def mark(subscription):
+            live.publish([VoteEvent(timezone.now(), question.id, choice.id, None)])
+            real_mark(subscription)
+
+        with mock.patch("polls.async_views.get_live_results", return_value=live), \
+                mock.patch.object(live, "mark", side_effect=mark):
+            response = await self.async_client.get(reverse("polls:live", args=(question.id,)))
+            stream = aiter(response.streaming_content)
+            snapshot = await asyncio.wait_for(anext(stream), 1)
+            self.assertIn(b'"total":5', snapshot)
+            live.tick()
+            live.publish([VoteEvent(timezone.now(), question.id, choice.id, None)] * 2)
+            live.tick()
+            delta = await asyncio.wait_for(anext(stream), 1)
+            self.assertIn(f'"choices":{{"{choice.id}":2}},"total":2'.encode(), delta)
+            await stream.aclose()
+
+    @override_settings(POLLS_LIVE_RESULTS={"ENABLED": True})
+    async def test_stream_sends_snapshot_then_deltas(self):
+        user = await User.objects.acreate_user(username="watcher")
+        question = await Question.objects.acreate(question_text="Live?", pub_date=timezone.now())
+        choice = await Choice.objects.acreate(question=question, choice_text="Yes", votes=4)
+        await self.async_client.aforce_login(user)
+        live = LiveResults()
+        with mock.patch("polls.async_views.get_live_results", return_value=live):
+            response = await self.async_client.get(reverse("polls:live", args=(question.id,)))
+            self.assertEqual(response["Content-Type"], "text/event-stream")
+            chunks = asyncio.Queue()
+
+            async def consume():
+                async for chunk in response.streaming_content:
+                    await chunks.put(chunk)
+
+            # The ASGI handler cancels the streaming task when the client leaves
+            client = asyncio.create_task(consume())
+            snapshot = await asyncio.wait_for(chunks.get(), 1)
+            self.assertIn(f'"choices":{{"{choice.id}":4}},"total":4'.encode(), snapshot)
+            live.publish([VoteEvent(timezone.now(), question.id, choice.id, user.id)])
+            live.tick()
+            self.assertIn(b'"total":1', await asyncio.wait_for(chunks.get(), 1))
+            client.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await client
+        self.assertEqual(live.metrics()["subscribers"], 0)
+        missing = await self.async_client.get(reverse("polls:live", args=(question.id + 1,)))
+        self.assertEqual(missing.status_code, 404)
+
+    def test_stream_needs_asgi_and_the_setting(self):
+        self.client.force_login(User.objects.create_user(username="wsgi"))
+        question = create_question(question_text="Live?", days=-1)
+        url = reverse("polls:live", args=(question.id,))
+        results = reverse("polls:results", args=(question.id,))
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertNotContains(self.client.get(results), "EventSource")
+        with override_settings(POLLS_LIVE_RESULTS={"ENABLED": True}):
+            # The WSGI test client: an endless stream would pin the worker
+            self.assertEqual(self.client.get(url).status_code, 501)
+            self.assertContains(self.client.get(results), "EventSource")
+
+
+class UniqueVoterSketchTests(TestCase):
+    def test_estimate_is_within_a_few_standard_errors(self):
+        sketch = hll.HyperLogLog(12)
+        for value in range(20000):
+            sketch.add(value)
+        self.assertLess(abs(sketch.count() - 20000) / 20000, 4 * sketch.error)
+        small = hll.HyperLogLog(12)
+        for value in range(100):
+            small.add(value)
+        self.assertAlmostEqual(small.count(), 100, delta=2)
+
+    def test_merge_is_the_union_and_bytes_round_trip(self):
+        first, second, both = hll.HyperLogLog(10), hll.HyperLogLog(10), hll.HyperLogLog(10)
+        for value in range(3000):
+            (first if value % 2 else second).add(value)
+            both.add(value)
+        self.assertEqual(first.merge(second).registers, both.registers)
+        restored = hll.HyperLogLog.from_bytes(both.to_bytes())
+        self.assertEqual((restored.precision, restored.count()), (10, both.count()))
+        with self.assertRaises(ValueError):
+            first.merge(hll.HyperLogLog(11))
+
+    def setUp(self):
+        patcher = mock.patch("polls.hll._buffer", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_votes_update_sketches_and_rebuild_matches(self):
+        question = create_question(question_text="Voters.", days=-1)
+        other = create_question(question_text="Others.", days=-1)
+        yes = Choice.objects.create(question=question, choice_text="Yes")
+        maybe = Choice.objects.create(question=other, choice_text="Maybe")
+        users = [User.objects.create_user(username=f"v{i}") for i in range(5)]
+        with self.captureOnCommitCallbacks(execute=True):
+            for user in users:
+                cast_vote(yes, user)
+            for user in users[:2]:
+                cast_vote(maybe, user)
+        hll.get_sketch_buffer().flush()
+        sketches = {
+            (row.scope, row.question_id): bytes(row.registers)
+            for row in UniqueVoterSketch.objects.all()
+        }
+        self.assertEqual(hll.estimate(sketches["question", question.id])["estimate"], 5)
+        self.assertEqual(hll.estimate(sketches["question", other.id])["estimate"], 2)
+        self.assertEqual(
+            hll.global_unique_voters(),
+            {"total": 5, "today": 5, "last_7_days": 5, "error": 0.0163},
+        )
+        self.assertEqual(hll.rebuild(), 4)
+        rebuilt = {
+            (row.scope, row.question_id): bytes(row.registers)
+            for row in UniqueVoterSketch.objects.all()
+        }
+        self.assertEqual(rebuilt, sketches)
+
+    def test_votes_wait_for_the_flush_interval(self):
+        question = create_question(question_text="Later.", days=-1)
+        yes = Choice.objects.create(question=question, choice_text="Yes")
+        users = [User.objects.create_user(username=f"w{i}") for i in range(3)]
+        with self.settings(POLLS_UNIQUE_VOTERS={"PRECISION": 12, "FLUSH_INTERVAL_SECONDS": 3600}):
+            with self.captureOnCommitCallbacks(execute=True):
+                for user in users:
+                    cast_vote(yes, user)
+        # The first vote flushes at once, the others wait in memory.
+        self.assertEqual(hll.global_unique_voters()["total"], 1)
+        self.assertEqual(hll.get_sketch_buffer().flush(), 3)
+        self.assertEqual(hll.global_unique_voters()["total"], 3)
+
+    def test_reads_after_a_quiet_period_see_every_voter(self):
+        first = create_question(question_text="First.", days=-1)
+        second = create_question(question_text="Second.", days=-1)
+        yes = Choice.objects.create(question=first, choice_text="Yes")
+        maybe = Choice.objects.create(question=second, choice_text="Maybe")
+        users = [User.objects.create_user(username=f"q{i}") for i in range(5)]
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_vote(yes, users[0])
+            for user in users[1:]:
+                cast_vote(maybe, user)
+        self.assertEqual(hll.global_unique_voters()["total"], 1)
+        # No vote arrives for longer than the flush interval.
+        hll.get_sketch_buffer()._flushed_at -= 6
+        self.assertEqual(hll.global_unique_voters()["total"], 5)
+
+    def test_background_flusher_runs_when_enabled(self):
+        flushed = threading.Event()
+        flusher = PeriodicFlusher("test-flusher", 0.01, flushed.set)
+        flusher.start()
+        self.addCleanup(flusher.stop)
+        self.assertTrue(flushed.wait(5))
+        with mock.patch("polls.hll.PeriodicFlusher") as flusher_class:
+            with self.settings(POLLS_UNIQUE_VOTERS={"FLUSH_IN_BACKGROUND": True}):
+                buffer = hll.get_sketch_buffer()
+        flusher_class.assert_called_once_with("unique-voters", 5, buffer.flush_if_due)
+        flusher_class.return_value.start.assert_called_once_with()
+
+    def test_concurrent_flushes_keep_both_sets_of_voters(self):
+        question = create_question(question_text="Racy.", days=-1)
+        now = timezone.now()
+        earlier, first, second = hll.SketchBuffer(12, 0), hll.SketchBuffer(12, 0), hll.SketchBuffer(12, 0)
+        earlier.add([VoteEvent(now, question.id, 1, 1)])
+        earlier.flush()
+        first.add([VoteEvent(now, question.id, 1, user_id) for user_id in range(2, 5)])
+        second.add([VoteEvent(now, question.id, 1, user_id) for user_id in range(5, 9)])
+        real_merge = hll.HyperLogLog.merge
+        raced = []
+
+        def merge(sketch, other):
+            # Another process flushes between this one's read and its write.
+            if not raced:
+                raced.append(True)
+                second.flush()
+            return real_merge(sketch, other)
+
+        with mock.patch.object(hll.HyperLogLog, "merge", merge):
+            self.assertEqual(first.flush(), 3)
+        self.assertEqual(hll.global_unique_voters()["total"], 8)
+        row = UniqueVoterSketch.objects.get(scope=UniqueVoterSketch.QUESTION, question=question)
+        self.assertEqual(hll.estimate(row.registers)["estimate"], 8)
+
+    def test_failed_flush_keeps_the_pending_sketches(self):
+        question = create_question(question_text="Retry.", days=-1)
+        buffer = hll.SketchBuffer(12, 0)
+        buffer.add([VoteEvent(timezone.now(), question.id, 1, 1)])
+        with mock.patch.object(UniqueVoterSketch.objects, "create", side_effect=OperationalError("locked")):
+            with self.assertRaises(OperationalError):
+                buffer.flush()
+        self.assertEqual(len(buffer.pending), 3)
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(buffer.pending, {})
+        self.assertEqual(UniqueVoterSketch.objects.count(), 3)
@@ -0,0 +1,219 @@
+"""
+Per-choice vote time series in minute, hour and day buckets.
+
+The votes_cast receiver counts every vote into the minute bucket of its
+choice. ``compact()`` (``manage.py compact_vote_series``, run from cron)
+sums complete hours of minute buckets into hour buckets, and complete
+days of hour buckets into day buckets. It moves each resolution's
+watermark past what it rolled up and deletes buckets older than their
+retention once they have been rolled up. Days are local calendar days.
+
+``series()`` reads a resolution from its own buckets up to its watermark
+and sums only the not yet compacted tail from the next finer resolution,
+so an hourly series costs at most an hour of minute buckets and a daily
+one at most a day of hour buckets (plus an hour of minutes). Raw Vote
+rows are never read.
+"""
+import datetime
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import VoteBucket, VoteBucketWatermark
+
+MINUTE, HOUR, DAY = VoteBucket.MINUTE, VoteBucket.HOUR, VoteBucket.DAY
+RESOLUTIONS = (MINUTE, HOUR, DAY)
+FINER = {HOUR: MINUTE, DAY: HOUR}
+STEPS = {
+    MINUTE: datetime.timedelta(minutes=1),
+    HOUR: datetime.timedelta(hours=1),
+    DAY: datetime.timedelta(days=1),
+}
+
+# Periods that ended less than this long ago are not compacted yet, so
+# votes committed right at a boundary still reach their minute bucket.
+GRACE = datetime.timedelta(minutes=1)
+
+
+def timeseries_settings():
+    options = {
+        "MINUTE_RETENTION_SECONDS": 2 * 24 * 60 * 60,
+        "HOUR_RETENTION_SECONDS": 90 * 24 * 60 * 60,
+        "DAY_RETENTION_SECONDS": None,
+        "MAX_POINTS": 2000,
+    }
+    options.update(getattr(settings, "POLLS_VOTE_SERIES", {}))
+    return options
+
+
+def floor(moment, resolution):
+    """Start of the bucket of ``resolution`` that contains ``moment``."""
+    if resolution in (MINUTE, HOUR) and timezone.is_aware(moment):
+        # Minute and hour buckets start on UTC boundaries; a :00 in a
+        # +05:30 zone is not one.
+        moment = moment.astimezone(datetime.timezone.utc)
+    if resolution == MINUTE:
+        return moment.replace(second=0, microsecond=0)
+    if resolution == HOUR:
+        return moment.replace(minute=0, second=0, microsecond=0)
+    local = timezone.localtime(moment) if settings.USE_TZ else moment
+    midnight = datetime.datetime.combine(local.date(), datetime.time())
+    return timezone.make_aware(midnight) if settings.USE_TZ else midnight
+
+
+def following(start, resolution):
+    """Start of the bucket after the one starting at ``start``."""
+    if resolution == MINUTE:
+        return start + datetime.timedelta(minutes=1)
+    if resolution == HOUR:
+        return start + datetime.timedelta(hours=1)
+    # A local day is not always 24 hours long.
+    return floor(start + datetime.timedelta(hours=36), DAY)
+
+
+def record_votes(sender, votes, **kwargs):
+    """votes_cast receiver: count the votes into their minute buckets."""
+    counts = Counter(
+        (vote.question_id, vote.choice_id, floor(vote.timestamp, MINUTE)) for vote in votes
+    )
+    # Votes older than the current hour may belong to periods that were
+    # already rolled up (votes replayed from the buffer or offline clients).
+    late = [key for key in counts if key[2] < floor(timezone.now(), HOUR)]
+    watermarks = _watermarks() if late else {}
+    with transaction.atomic():
+        for (question_id, choice_id, minute), count in counts.items():
+            _add(question_id, choice_id, MINUTE, minute, count)
+            for resolution in (HOUR, DAY):
+                start = floor(minute, resolution)
+                if resolution in watermarks and start < watermarks[resolution]:
+                    _add(question_id, choice_id, resolution, start, count)
+
+
+def _add(question_id, choice_id, resolution, start, count):
+    bucket = VoteBucket.objects.filter(choice_id=choice_id, resolution=resolution, start=start)
+    if not bucket.update(count=F("count") + count):
+        VoteBucket.objects.get_or_create(
+            choice_id=choice_id, resolution=resolution, start=start,
+            defaults={"question_id": question_id},
+        )
+        bucket.update(count=F("count") + count)
+
+
+def _watermarks():
+    return dict(VoteBucketWatermark.objects.values_list("resolution", "until"))
+
+
+def compact(now=None):
+    """
+    Roll complete periods up into hour and day buckets and apply the
+    retention. Returns ``{resolution: (buckets written, buckets deleted)}``.
+    """
+    now = now or timezone.now()
+    options = timeseries_settings()
+    report = {}
+    with transaction.atomic():
+        watermarks = _watermarks()
+        complete = now - GRACE
+        for resolution in (HOUR, DAY):
+            finer = FINER[resolution]
+            # A day is complete only once all its hours have been rolled up.
+            if finer in watermarks:
+                complete = min(complete, watermarks[finer])
+            end = floor(complete, resolution)
+            written = _roll_up(finer, resolution, watermarks.get(resolution), end)
+            if watermarks.get(resolution) is None or end > watermarks[resolution]:
+                VoteBucketWatermark.objects.update_or_create(
+                    resolution=resolution, defaults={"until": end},
+                )
+                watermarks[resolution] = end
+            report[resolution] = [written, 0]
+        report[MINUTE] = [0, 0]
+        for resolution in RESOLUTIONS:
+            retention = options[f"{resolution.upper()}_RETENTION_SECONDS"]
+            if retention is None:
+                continue
+            cutoff = now - datetime.timedelta(seconds=retention)
+            coarser = {MINUTE: HOUR, HOUR: DAY}.get(resolution)
+            if coarser is not None:
+                # Never drop buckets that have not been rolled up yet.
+                cutoff = min(cutoff, watermarks[coarser])
+            report[resolution][1], _ = VoteBucket.objects.filter(
+                resolution=resolution, start__lt=cutoff,
+            ).delete()
+    return {resolution: tuple(counts) for resolution, counts in report.items()}
+
+
+def _roll_up(source, target, since, end):
+    """Write ``target`` buckets summed from ``source`` ones in [since, end)."""
+    rows = VoteBucket.objects.filter(resolution=source, start__lt=end)
+    if since is not None:
+        rows = rows.filter(start__gte=since)
+    sums = Counter()
+    for question_id, choice_id, start, count in rows.values_list(
+        "question_id", "choice_id", "start", "count"
+    ).iterator():
+        sums[question_id, choice_id, floor(start, target)] += count
+    VoteBucket.objects.bulk_create(
+        [
+            VoteBucket(question_id=question_id, choice_id=choice_id,
+                       resolution=target, start=start, count=count)
+            for (question_id, choice_id, start), count in sums.items()
+        ],
+        update_conflicts=True,
+        unique_fields=["choice", "resolution", "start"],
+        update_fields=["count"],
+    )
+    return len(sums)
+
+
+def bucket_count(resolution, start, end):
+    """
+    About how many ``resolution`` buckets overlap [start, end), without
+    building them: exact for minutes and hours, within one for local days
+    (which are not always 24 hours long).
+    """
+    step = STEPS[resolution]
+    return max(0, -(-(end - floor(start, resolution)) // step))
+
+
+def buckets(resolution, start, end):
+    """Starts of the ``resolution`` buckets that overlap [start, end)."""
+    starts = []
+    current = floor(start, resolution)
+    while current < end:
+        starts.append(current)
+        current = following(current, resolution)
+    return starts
+
+
+def series(question_id, resolution, start, end):
+    """
+    ``{choice_id: {bucket start: votes}}`` for the question's votes in the
+    ``resolution`` buckets overlapping [start, end). Buckets without votes
+    are absent.
+    """
+    start = floor(start, resolution)
+    return _read(question_id, resolution, start, end, _watermarks())
+
+
+def _read(question_id, resolution, start, end, watermarks):
+    result = defaultdict(Counter)
+    compacted_until = end if resolution == MINUTE else min(
+        end, max(watermarks.get(resolution, start), start)
+    )
+    if compacted_until > start:
+        rows = VoteBucket.objects.filter(
+            question_id=question_id, resolution=resolution,
+            start__gte=start, start__lt=compacted_until,
+        ).values_list("choice_id", "start", "count")
+        for choice_id, bucket, count in rows:
+            result[choice_id][bucket] += count
+    if compacted_until < end:
+        tail = _read(question_id, FINER[resolution], compacted_until, end, watermarks)
+        for choice_id, counts in tail.items():
+            for bucket, count in counts.items():
+                result[choice_id][floor(bucket, resolution)] += count
+    return result
@@ -1,16 +1,24 @@
+from django.conf import settings
 from django.urls import path, include
 from django.contrib.auth.decorators import login_required
 from django.contrib import admin
 
-from . import views
+from . import async_views, views
 
 from django.contrib.auth.decorators import login_required
 
+# login_required wraps coroutine views natively, so the async views keep
+# running on the event loop under ASGI.
+poll_views = async_views if settings.POLLS_ASYNC_VIEWS else views
+
 app_name = "polls"
 urlpatterns = [
-    path("", login_required(views.IndexView.as_view()), name="index"),
-    path("<int:pk>/", login_required(views.DetailView.as_view()), name="detail"),
-    path("<int:pk>/results/", login_required(views.ResultsView.as_view()), name="results"),
-    path("<int:question_id>/vote/", login_required(views.vote), name="vote"),
+    path("", login_required(poll_views.IndexView.as_view()), name="index"),
+    path("archive/", login_required(views.ArchiveView.as_view()), name="archive"),
+    path("search/", login_required(views.SearchView.as_view()), name="search"),
+    path("<int:pk>/", login_required(poll_views.DetailView.as_view()), name="detail"),
+    path("<int:pk>/results/", login_required(poll_views.ResultsView.as_view()), name="results"),
+    path("<int:pk>/live/", login_required(async_views.live_results), name="live"),
+    path("<int:question_id>/vote/", login_required(poll_views.vote), name="vote"),
     path("new_poll/", login_required(views.NewPollView.as_view()), name="new_poll"),
-]
\ No newline at end of file
+]
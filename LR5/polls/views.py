@@ -1,4 +1,6 @@
-from django.db.models import F
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.db.models import Prefetch
 from django.http import HttpResponseRedirect
 from django.shortcuts import get_object_or_404, render, redirect
 from django.urls import reverse
@@ -11,6 +13,12 @@ from django.contrib.auth.decorators import login_required
 from .models import Choice, Question
 
 from .forms import NewPollForm
+from .idempotency import new_idempotency_key, request_idempotency_key
+from .index_cache import latest_questions
+from .live import live_settings
+from .pagination import InvalidCursor, question_page
+from .search import search_questions, search_settings
+from .voting import AlreadyVoted, DuplicateSubmission, cast_vote, choice_by_pk
 
 
 class IndexView(generic.ListView):
@@ -22,9 +30,44 @@ class IndexView(generic.ListView):
         Return the last five published questions (not including those set to be
         published in the future).
         """
-        return Question.objects.filter(pub_date__lte=timezone.now()).order_by("-pub_date")[
-               :5
-               ]
+        return latest_questions(5)
+
+class ArchiveView(generic.TemplateView):
+    template_name = "polls/archive.html"
+
+    def get_context_data(self, **kwargs):
+        """
+        One page of all published questions, newest first, continuing after
+        the ``cursor`` query parameter.
+        """
+        context = super().get_context_data(**kwargs)
+        try:
+            questions, next_cursor = question_page(
+                self.request.GET.get("cursor"), size=settings.POLLS_QUESTION_PAGE_SIZE
+            )
+        except InvalidCursor:
+            raise BadRequest("Invalid cursor.")
+        context["question_list"] = questions
+        context["next_cursor"] = next_cursor
+        return context
+
+
+class SearchView(generic.TemplateView):
+    template_name = "polls/search.html"
+
+    def get_context_data(self, **kwargs):
+        """
+        Published questions whose text or choices match the ``q`` query
+        parameter, best match first.
+        """
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.get("q", "").strip()
+        context["query"] = query
+        context["question_list"] = (
+            search_questions(query, limit=search_settings()["LIMIT"]) if query else []
+        )
+        return context
+
 
 class DetailView(generic.DetailView):
     model = Question
@@ -34,20 +77,42 @@ class DetailView(generic.DetailView):
         """
         Excludes any questions that aren't published yet.
         """
-        return Question.objects.filter(pub_date__lte=timezone.now())
+        return Question.objects.filter(pub_date__lte=timezone.now()).prefetch_related("choice_set")
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["idempotency_key"] = new_idempotency_key()
+        return context
 
 
 class ResultsView(generic.DetailView):
     model = Question
     template_name = "polls/results.html"
 
+    def get_queryset(self):
+        """
+        The question with its live total and its choices, each with live
+        votes, in one prefetched query.
+        """
+        return Question.objects.with_live_total_votes().prefetch_related(
+            Prefetch("choice_set", queryset=Choice.objects.with_live_votes(), to_attr="choices")
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["choices"] = self.object.choices
+        context["live_results"] = live_settings()["ENABLED"]
+        return context
+
 
 @login_required(login_url='accounts:login')
 def vote(request, question_id):
-    question = get_object_or_404(Question, pk=question_id)
+    question = get_object_or_404(Question.objects.prefetch_related("choice_set"), pk=question_id)
+    idempotency_key = request_idempotency_key(request)
     try:
-        selected_choice = question.choice_set.get(pk=request.POST["choice"])
-    except (KeyError, Choice.DoesNotExist):
+        # Picked from the prefetched choices: no second query.
+        selected_choice = choice_by_pk(question)[request.POST["choice"]]
+    except KeyError:
         # Redisplay the question voting form.
         return render(
             request,
@@ -55,15 +120,29 @@ def vote(request, question_id):
             {
                 "question": question,
                 "error_message": "You didn't select a choice.",
+                "idempotency_key": idempotency_key or new_idempotency_key(),
+            },
+        )
+    try:
+        cast_vote(selected_choice, request.user, idempotency_key)
+    except DuplicateSubmission:
+        # A retry of a vote that was already counted: answer as the
+        # first submission did.
+        pass
+    except AlreadyVoted:
+        return render(
+            request,
+            "polls/detail.html",
+            {
+                "question": question,
+                "error_message": "You have already voted on this question.",
+                "idempotency_key": new_idempotency_key(),
             },
         )
-    else:
-        selected_choice.votes = F("votes") + 1
-        selected_choice.save()
-        # Always return an HttpResponseRedirect after successfully dealing
-        # with POST data. This prevents data from being posted twice if a
-        # user hits the Back button.
-        return HttpResponseRedirect(reverse("polls:results", args=(question.id,)))
+    # Always return an HttpResponseRedirect after successfully dealing
+    # with POST data. This prevents data from being posted twice if a
+    # user hits the Back button.
+    return HttpResponseRedirect(reverse("polls:results", args=(question.id,)))
 
 
 
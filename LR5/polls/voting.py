@@ -0,0 +1,206 @@
+import logging
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .buffer import get_vote_buffer
+from .counters import add_vote, add_votes
+from .idempotency import expired_before, get_idempotency_cache, vote_key
+from .models import Choice, IdempotencyKey, Question, Vote
+from .signals import VoteEvent, votes_cast
+
+logger = logging.getLogger(__name__)
+
+# Primary keys are signed 64-bit integers; larger ids cannot be queried.
+MAX_ID = 2 ** 63 - 1
+
+
+class AlreadyVoted(Exception):
+    """The user has already voted on this question."""
+
+
+class DuplicateSubmission(Exception):
+    """A vote with this idempotency key has already been accepted."""
+
+
+def choice_by_pk(question):
+    """
+    The question's choices keyed by pk as submitted in form data. Uses the
+    prefetched ``choice_set`` when there is one.
+    """
+    return {str(choice.pk): choice for choice in question.choice_set.all()}
+
+
+def cast_vote(choice, user, idempotency_key=None):
+    """
+    Record ``user``'s vote for ``choice`` in the Vote ledger and count it,
+    all in one transaction. Raises AlreadyVoted on a second vote for the
+    same question.
+
+    With an ``idempotency_key`` a retried submission raises
+    DuplicateSubmission before anything is written: the key, scoped to the
+    user and the question (``vote_key``), is looked up in the process
+    cache, then in the IdempotencyKey table, and stored with the vote.
+    Table rows older than POLLS_IDEMPOTENCY["TTL_SECONDS"] count as absent
+    whether or not they have been pruned yet.
+
+    When POLLS_VOTE_BUFFER is enabled only the ledger entry is written
+    here; the counters follow with the next buffer flush.
+    """
+    cache = get_idempotency_cache()
+    if idempotency_key:
+        key = vote_key(user, choice.question_id, idempotency_key)
+        cache_key = ("vote", key)
+        cutoff = expired_before()
+        stored = IdempotencyKey.objects.filter(key=key)
+        if cutoff is not None:
+            stored = stored.filter(created__gte=cutoff)
+        if cache.seen(cache_key) or stored.exists():
+            cache.add(cache_key)
+            raise DuplicateSubmission
+
+    buffer = get_vote_buffer()
+    with transaction.atomic():
+        if idempotency_key:
+            try:
+                with transaction.atomic():
+                    IdempotencyKey.objects.create(key=key)
+            except IntegrityError:
+                # An expired row not pruned yet is taken over; a live one
+                # means a concurrent submission with the same key won.
+                expired = IdempotencyKey.objects.filter(key=key, created__lt=cutoff) if cutoff else None
+                if expired is None or not expired.update(created=timezone.now()):
+                    raise DuplicateSubmission
+        try:
+            with transaction.atomic():
+                vote = Vote.objects.create(user=user, question_id=choice.question_id, choice=choice)
+        except IntegrityError:
+            raise AlreadyVoted
+        if buffer is None:
+            add_vote(choice.pk, choice.question_id)
+        _send_on_commit([vote])
+    if idempotency_key:
+        cache.add(cache_key)
+    if buffer is not None:
+        buffer.add(choice.pk)
+
+
+def cast_votes(entries, retry=True):
+    """
+    Apply a batch of votes replayed by an offline client. Each entry is a
+    mapping with ``question_id``, ``choice_id`` and ``client_vote_id``.
+
+    Entries are validated with one query per table, ledger rows are
+    bulk-inserted and the counters get grouped increments, all in one
+    transaction. client_vote_ids this process applied recently are
+    answered from the idempotency cache without a query. Returns one ``{"client_vote_id", "status"[, "error"]}``
+    dict per entry, in order; status is "applied", "duplicate" (the
+    client_vote_id was already applied) or "invalid".
+    """
+    results = []
+    parsed = []
+    for entry in entries:
+        try:
+            question_id = int(entry["question_id"])
+            choice_id = int(entry["choice_id"])
+            client_vote_id = entry["client_vote_id"]
+        except (TypeError, KeyError, ValueError):
+            client_vote_id = entry.get("client_vote_id") if isinstance(entry, dict) else None
+            results.append(_invalid(client_vote_id, "question_id, choice_id and client_vote_id are required"))
+            continue
+        if not isinstance(client_vote_id, str) or not client_vote_id or len(client_vote_id) > 64:
+            results.append(_invalid(client_vote_id, "client_vote_id must be a string of 1-64 characters"))
+            continue
+        if not (-MAX_ID <= question_id <= MAX_ID and -MAX_ID <= choice_id <= MAX_ID):
+            results.append(_invalid(client_vote_id, "question_id or choice_id is out of range"))
+            continue
+        results.append({"client_vote_id": client_vote_id})
+        parsed.append((results[-1], question_id, choice_id, client_vote_id))
+
+    # Keys this process has already applied are settled without a query.
+    cache = get_idempotency_cache()
+    unseen = []
+    for entry in parsed:
+        if cache.seen(("batch", entry[3])):
+            entry[0]["status"] = "duplicate"
+        else:
+            unseen.append(entry)
+    parsed = unseen
+
+    now = timezone.now()
+    open_questions = set(
+        Question.objects.filter(
+            pk__in={question_id for _, question_id, _, _ in parsed}, pub_date__lte=now
+        ).values_list("pk", flat=True)
+    )
+    choice_questions = dict(
+        Choice.objects.filter(pk__in={choice_id for _, _, choice_id, _ in parsed})
+        .values_list("pk", "question_id")
+    )
+    seen = set(
+        Vote.objects.filter(client_vote_id__in=[key for _, _, _, key in parsed])
+        .values_list("client_vote_id", flat=True)
+    )
+
+    ledger = []
+    choice_counts = Counter()
+    question_counts = Counter()
+    for result, question_id, choice_id, client_vote_id in parsed:
+        if client_vote_id in seen:
+            result["status"] = "duplicate"
+        elif question_id not in open_questions:
+            result.update(status="invalid", error="unknown question")
+        elif choice_questions.get(choice_id) != question_id:
+            result.update(status="invalid", error="choice does not belong to question")
+        else:
+            seen.add(client_vote_id)
+            result["status"] = "applied"
+            ledger.append(Vote(
+                question_id=question_id, choice_id=choice_id,
+                client_vote_id=client_vote_id, timestamp=now,
+            ))
+            choice_counts[choice_id] += 1
+            question_counts[question_id] += 1
+
+    try:
+        with transaction.atomic():
+            Vote.objects.bulk_create(ledger, batch_size=500)
+            add_votes(choice_counts, question_counts)
+            _send_on_commit(ledger)
+    except IntegrityError:
+        # A concurrent batch applied some of the same client_vote_ids
+        # after they were checked; validate again against the ledger.
+        if not retry:
+            raise
+        return cast_votes(entries, retry=False)
+    for vote in ledger:
+        cache.add(("batch", vote.client_vote_id))
+    return results
+
+
+def _invalid(client_vote_id, error):
+    return {"client_vote_id": client_vote_id, "status": "invalid", "error": error}
+
+
+def _send_on_commit(votes):
+    events = [
+        VoteEvent(vote.timestamp, vote.question_id, vote.choice_id, vote.user_id)
+        for vote in votes
+    ]
+    if events:
+        transaction.on_commit(lambda: _send(events))
+
+
+def _send(events):
+    """
+    Notify the votes_cast receivers. The votes are committed by now, so a
+    failing receiver is logged instead of failing the request or skipping
+    the receivers after it.
+    """
+    for receiver, result in votes_cast.send_robust(sender=Vote, votes=events):
+        if isinstance(result, Exception):
+            logger.error(
+                "votes_cast receiver %r failed for %d vote(s)", receiver, len(events),
+                exc_info=(type(result), result, result.__traceback__),
+            )
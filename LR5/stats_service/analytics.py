@@ -0,0 +1,149 @@
+"""
+Аналитика распределения голосов по всем опросам сразу (NumPy).
+
+Пары (вопрос, голоса варианта) читаются одним запросом в два непрерывных
+массива, упорядоченных по вопросу, так что варианты каждого вопроса
+лежат подряд. Все метрики считаются сегментными редукциями
+(np.add.reduceat и т.п.) по границам вопросов, без цикла по вопросам:
+
+- entropy — энтропия Шеннона долей голосов, в битах;
+- consensus — 1 - entropy / log2(число вариантов): 1, когда все голоса
+  у одного варианта, 0 — когда поровну;
+- leader_margin — отрыв лидера от второго места в долях голосов;
+- chi_square — статистика хи-квадрат против равномерного распределения
+  (степеней свободы — число вариантов минус один).
+
+Для вопросов без голосов метрики не определены (None), consensus — и для
+вопросов с одним вариантом. Готовый отчёт кладётся в кэш Django на
+STATS_ANALYTICS['TIMEOUT'] секунд: голоса меняют его лишь со временем.
+"""
+import itertools
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from polls.models import Choice
+
+CACHE_KEY = 'stats:analytics'
+METRICS = ('entropy', 'consensus', 'leader_margin', 'chi_square')
+
+
+def analytics_settings():
+    options = {
+        'ENABLED': True,
+        'CACHE': 'default',
+        'TIMEOUT': 300,
+    }
+    options.update(getattr(settings, 'STATS_ANALYTICS', {}))
+    return options
+
+
+def load():
+    """(question_ids, votes) — непрерывные массивы int64, упорядоченные по вопросу"""
+    rows = (
+        Choice.objects.with_live_votes()
+        .order_by('question_id')
+        .values_list('question_id', 'live_votes')
+    )
+    flat = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.int64)
+    pairs = flat.reshape(-1, 2)
+    return np.ascontiguousarray(pairs[:, 0]), np.ascontiguousarray(pairs[:, 1])
+
+
+def compute(question_ids, votes):
+    """
+    Метрики по вопросам: словарь массивов question_id, choices,
+    total_votes и METRICS (NaN там, где метрика не определена).
+    """
+    if not len(votes):
+        empty = np.empty(0)
+        return {
+            'question_id': np.empty(0, dtype=np.int64),
+            'choices': np.empty(0, dtype=np.int64),
+            'total_votes': np.empty(0, dtype=np.int64),
+            **{name: empty for name in METRICS},
+        }
+    # Начало сегмента каждого вопроса и число его вариантов
+    starts = np.flatnonzero(np.r_[True, question_ids[1:] != question_ids[:-1]])
+    choices = np.diff(np.r_[starts, len(votes)])
+    totals = np.add.reduceat(votes, starts)
+    # Номер сегмента для каждого варианта
+    segment = np.repeat(np.arange(len(starts)), choices)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shares = votes / totals[segment]
+        entropy = np.add.reduceat(
+            np.where(votes > 0, -shares * np.log2(shares), 0.0), starts
+        )
+        entropy[totals == 0] = np.nan
+        consensus = 1 - entropy / np.log2(choices)
+        consensus[choices < 2] = np.nan
+
+        # Второе место — максимум сегмента без одного вхождения лидера
+        # (без сортировки: ещё одна редукция вместо lexsort)
+        leader = np.maximum.reduceat(votes, starts)
+        tops = np.flatnonzero(votes == leader[segment])
+        first_top = tops[np.r_[True, segment[tops][1:] != segment[tops][:-1]]]
+        others = votes.copy()
+        others[first_top] = -1
+        runner_up = np.maximum(np.maximum.reduceat(others, starts), 0)
+        leader_margin = (leader - runner_up) / totals
+
+        # sum((o - e)^2 / e) при e = n / k равна k * sum(o^2) / n - n
+        squares = np.add.reduceat(votes * votes, starts)
+        chi_square = np.maximum(choices * squares / totals - totals, 0.0)
+
+    return {
+        'question_id': question_ids[starts],
+        'choices': choices,
+        'total_votes': totals,
+        'entropy': entropy,
+        'consensus': consensus,
+        'leader_margin': leader_margin,
+        'chi_square': chi_square,
+    }
+
+
+def _mean(values):
+    values = values[~np.isnan(values)]
+    return round(float(values.mean()), 4) if len(values) else None
+
+
+def report(now=None):
+    """Отчёт для /api/stats/analytics/: метрики каждого вопроса и сводка"""
+    metrics = compute(*load())
+    columns = [metrics['question_id'].tolist(), metrics['choices'].tolist(),
+               metrics['total_votes'].tolist()]
+    for name in METRICS:
+        # NaN -> None, чтобы отчёт оставался корректным JSON
+        rounded = np.round(metrics[name], 4)
+        columns.append(np.where(np.isnan(rounded), None, rounded).tolist())
+    voted = metrics['total_votes'] > 0
+    return {
+        'computed_at': now or timezone.now(),
+        'summary': {
+            'questions': len(metrics['question_id']),
+            'questions_with_votes': int(voted.sum()),
+            'total_votes': int(metrics['total_votes'].sum()),
+            **{f'mean_{name}': _mean(metrics[name]) for name in METRICS},
+        },
+        'questions': [
+            dict(zip(('question_id', 'choices', 'total_votes', *METRICS), row))
+            for row in zip(*columns)
+        ],
+    }
+
+
+def cached_report():
+    """Отчёт из кэша; пересчитывается не чаще раза в TIMEOUT секунд"""
+    options = analytics_settings()
+    if not options['ENABLED']:
+        return report()
+    cache = caches[options['CACHE']]
+    data = cache.get(CACHE_KEY)
+    if data is None:
+        data = report()
+        cache.set(CACHE_KEY, data, options['TIMEOUT'])
+    return data
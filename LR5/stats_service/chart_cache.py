@@ -0,0 +1,155 @@
+"""
+Дисковый кэш отрисованных графиков (ChartAPI, ChartBase64API).
+
+Ключ — (вопрос, тип графика, формат, размер, версия данных). Версия —
+хэш того, что показывает график: текста вопроса, вариантов и числа
+голосов. Поэтому она меняется с каждым голосом (прямым, через шарды или
+буфер) и с правкой вариантов, без отдельной инвалидации. Старые версии
+графика удаляются при записи новой.
+
+Файлы лежат в STATS_CHART_CACHE['DIR'], общем для всех процессов. Когда
+суммарный размер превышает MAX_BYTES, удаляются давно не читанные файлы
+(LRU по времени изменения, которое обновляется при каждом чтении).
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+
+
+def chart_cache_settings():
+    options = {
+        'ENABLED': True,
+        'DIR': os.path.join(settings.BASE_DIR, 'chart_cache'),
+        'MAX_BYTES': 256 * 1024 * 1024,
+    }
+    options.update(getattr(settings, 'STATS_CHART_CACHE', {}))
+    return options
+
+
+def data_version(*parts):
+    """Версия данных графика: короткий хэш от всего, что на нём видно."""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+class ChartCache:
+    """Файловое хранилище графиков с вытеснением по LRU."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in self._entries())
+
+    @staticmethod
+    def _prefix(question_id, chart, size):
+        return f'{question_id}-{chart}-{size}-'
+
+    def _path(self, question_id, chart, fmt, size, version):
+        return os.path.join(
+            self.directory, f'{self._prefix(question_id, chart, size)}{version}.{fmt}'
+        )
+
+    def _entries(self):
+        with os.scandir(self.directory) as entries:
+            return [entry for entry in entries if entry.is_file() and not entry.name.startswith('.')]
+
+    def get(self, question_id, chart, fmt, size, version):
+        """Байты графика или None, если такой версии в кэше нет."""
+        path = self._path(question_id, chart, fmt, size, version)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, question_id, chart, fmt, size, version, data):
+        """Сохранить график, удалив прежние версии того же графика."""
+        path = self._path(question_id, chart, fmt, size, version)
+        prefix = self._prefix(question_id, chart, size)
+        suffix = f'.{fmt}'
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._size += len(data)
+            for entry in self._entries():
+                if entry.name.startswith(prefix) and entry.name.endswith(suffix) and entry.path != path:
+                    self._remove(entry)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _remove(self, entry):
+        try:
+            size = entry.stat().st_size
+            os.remove(entry.path)
+        except FileNotFoundError:
+            return
+        self._size -= size
+
+    def _evict(self):
+        # Пересчитываем по диску: каталог общий с другими процессами
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+        self._size = sum(entry.stat().st_size for entry in entries)
+        target = self.max_bytes * 0.9
+        for entry in entries:
+            if self._size <= target:
+                break
+            self._remove(entry)
+            self.evictions += 1
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'directory': self.directory,
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_chart_cache():
+    """ChartCache из STATS_CHART_CACHE или None, если кэш выключен."""
+    options = chart_cache_settings()
+    if not options['ENABLED']:
+        return None
+    directory = str(options['DIR'])
+    with _caches_lock:
+        if directory not in _caches:
+            _caches[directory] = ChartCache(directory, options['MAX_BYTES'])
+        return _caches[directory]
+
+
+def cached_chart(question_id, chart, fmt, size, version, render):
+    """Байты графика из кэша; при промахе — render() и запись в кэш."""
+    cache = get_chart_cache()
+    if cache is None:
+        return render()
+    data = cache.get(question_id, chart, fmt, size, version)
+    if data is None:
+        data = render()
+        cache.put(question_id, chart, fmt, size, version, data)
+    return data
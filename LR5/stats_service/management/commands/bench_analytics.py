@@ -0,0 +1,64 @@
+import math
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from stats_service import analytics
+
+
+def per_question(question_ids, votes):
+    """The same metrics with a Python loop over the questions."""
+    groups = {}
+    for question_id, count in zip(question_ids.tolist(), votes.tolist()):
+        groups.setdefault(question_id, []).append(count)
+    results = {}
+    for question_id, counts in groups.items():
+        total, k = sum(counts), len(counts)
+        if not total:
+            results[question_id] = (None, None, None, None)
+            continue
+        entropy = -sum(c / total * math.log2(c / total) for c in counts if c)
+        ranked = sorted(counts, reverse=True) + [0]
+        expected = total / k
+        results[question_id] = (
+            entropy,
+            1 - entropy / math.log2(k) if k > 1 else None,
+            (ranked[0] - ranked[1]) / total,
+            sum((c - expected) ** 2 / expected for c in counts),
+        )
+    return results
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the vectorized analytics (stats_service/analytics.py) against a "
+        "per-question Python loop on synthetic vote counts, and time loading "
+        "the real (question, votes) arrays from the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--questions", type=int, nargs="+", default=[1000, 10000, 100000])
+        parser.add_argument("--choices", type=int, default=5)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        self.stdout.write(f"{'questions':>10} {'numpy ms':>10} {'loop ms':>10} {'speedup':>8}")
+        for size in options["questions"]:
+            question_ids = np.repeat(np.arange(size, dtype=np.int64), options["choices"])
+            votes = rng.integers(0, 1000, len(question_ids), dtype=np.int64)
+            numpy_ms = self._time(options["repeat"], lambda: analytics.compute(question_ids, votes))
+            loop_ms = self._time(options["repeat"], lambda: per_question(question_ids, votes))
+            self.stdout.write(f"{size:>10} {numpy_ms:>10.2f} {loop_ms:>10.2f} {loop_ms / numpy_ms:>7.1f}x")
+
+        started = time.perf_counter()
+        question_ids, votes = analytics.load()
+        load_ms = (time.perf_counter() - started) * 1000
+        self.stdout.write(f"Loaded {len(votes)} choice(s) from the database in {load_ms:.2f} ms.")
+
+    def _time(self, repeat, run):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            run()
+        return (time.perf_counter() - started) * 1000 / repeat
@@ -0,0 +1,76 @@
+import gc
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from stats_service.views import bar_figure, native_bar, native_donut, pie_figure, to_image
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the built-in SVG chart renderer with the Plotly path on "
+        "generated vote arrays: mean latency and peak Python memory per chart."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--choices", type=int, default=5)
+        parser.add_argument("--repeat", type=int, default=200)
+        parser.add_argument(
+            "--skip-kaleido", action="store_true",
+            help="Time only building the Plotly figure, not exporting it.",
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        labels = [f"Вариант {i + 1}" for i in range(options["choices"])]
+        votes = [rng.randint(0, 500) for _ in labels]
+        total = sum(votes) or 1
+        percentages = [v / total * 100 for v in votes]
+        title = "Результаты: тестовый вопрос..."
+
+        export = not options["skip_kaleido"]
+        if export:
+            try:
+                to_image(bar_figure(title, labels, votes), "svg")
+            except Exception as exc:
+                reason = str(exc).strip().splitlines()[0]
+                self.stderr.write(f"Plotly export unavailable ({reason}); timing figure building only.")
+                export = False
+
+        def plotly_bar():
+            fig = bar_figure(title, labels, votes)
+            return to_image(fig, "svg") if export else fig.to_json()
+
+        def plotly_pie():
+            fig = pie_figure(title, labels, percentages)
+            return to_image(fig, "png") if export else fig.to_json()
+
+        cases = [
+            ("bar", "native", lambda: native_bar(title, labels, votes)),
+            ("bar", "plotly", plotly_bar),
+            ("donut", "native", lambda: native_donut(title, labels, votes)),
+            ("donut", "plotly", plotly_pie),
+        ]
+        self.stdout.write(f"{'chart':>6} {'engine':>7} {'mean ms':>9} {'peak KiB':>9} {'bytes':>8}")
+        for chart, engine, run in cases:
+            output = run()  # прогрев импортов и кэшей Plotly
+            repeat = options["repeat"] if engine == "native" else max(options["repeat"] // 10, 1)
+            gc.collect()
+            started = time.perf_counter()
+            for _ in range(repeat):
+                run()
+            mean = (time.perf_counter() - started) * 1000 / repeat
+            tracemalloc.start()
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.stdout.write(
+                f"{chart:>6} {engine:>7} {mean:>9.3f} {peak / 1024:>9.1f} {len(output):>8}"
+            )
+        if not export:
+            self.stdout.write(
+                "Plotly rows exclude the kaleido export, which adds a Chromium "
+                "round trip (and its process memory) per uncached chart."
+            )
@@ -0,0 +1,78 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from polls.models import Choice, Question
+from stats_service.views import QuestionStatsAPI, QuestionStatsBatchAPI
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare /api/stats/questions/batch/ with one /api/stats/question/<id>/ "
+        "call per question for batch sizes from 1 to 1000. Rows are inserted "
+        "inside a transaction that is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000])
+        parser.add_argument("--choices", type=int, default=4)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        single_view = QuestionStatsAPI.as_view()
+        batch_view = QuestionStatsBatchAPI.as_view()
+        now = timezone.now()
+        with transaction.atomic():
+            user = get_user_model()(username="bench-stats-batch", is_staff=True)
+            questions = Question.objects.bulk_create([
+                Question(question_text=f"Вопрос {i}", pub_date=now, total_votes=10 * options["choices"])
+                for i in range(max(options["sizes"]))
+            ])
+            Choice.objects.bulk_create([
+                Choice(question=question, choice_text=f"Вариант {j}", votes=10)
+                for question in questions
+                for j in range(options["choices"])
+            ])
+            ids = [question.pk for question in questions]
+
+            def batch(size):
+                request = factory.post(
+                    "/api/stats/questions/batch/", {"ids": ids[:size]}, format="json"
+                )
+                force_authenticate(request, user)
+                response = batch_view(request)
+                assert response.status_code == 200, response.data
+
+            def singles(size):
+                for question_id in ids[:size]:
+                    request = factory.get(f"/api/stats/question/{question_id}/")
+                    force_authenticate(request, user)
+                    response = single_view(request, question_id=question_id)
+                    assert response.status_code == 200, response.data
+
+            self.stdout.write(
+                f"{'size':>6} {'batch ms':>10} {'queries':>8} {'single ms':>10} {'queries':>8} {'speedup':>8}"
+            )
+            for size in options["sizes"]:
+                batch_ms, batch_queries = self._time(options["repeat"], lambda: batch(size))
+                single_ms, single_queries = self._time(options["repeat"], lambda: singles(size))
+                self.stdout.write(
+                    f"{size:>6} {batch_ms:>10.2f} {batch_queries:>8} "
+                    f"{single_ms:>10.2f} {single_queries:>8} {single_ms / batch_ms:>7.1f}x"
+                )
+            transaction.set_rollback(True)
+
+    def _time(self, repeat, run):
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            run()
+        return (time.perf_counter() - started) * 1000 / repeat, len(queries)
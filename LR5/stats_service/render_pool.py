@@ -0,0 +1,265 @@
+"""
+Пул отдельных процессов для отрисовки графиков (pio.to_image / kaleido).
+
+Отрисовка не занимает поток запроса дольше, чем нужно на ожидание:
+каждый рабочий процесс живёт долго, при старте один раз прогревает
+kaleido и дальше принимает задания по своему каналу. Одновременно в пуле
+не больше WORKERS заданий и ещё не больше MAX_QUEUE ждут свободного
+процесса. Остальные сразу получают PoolFull, а API отвечает 503 с
+Retry-After. Задание, не уложившееся в TIMEOUT_SECONDS вместе с
+ожиданием, получает RenderTimeout. Зависший процесс при этом убивается и
+заменяется новым.
+
+Рабочие процессы запускаются методом spawn и не импортируют Django.
+"""
+import atexit
+import importlib
+import multiprocessing
+import queue
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+
+class PoolFull(Exception):
+    """Очередь заданий заполнена."""
+
+
+class RenderTimeout(Exception):
+    """Задание не выполнено за отведённое время."""
+
+
+class RenderError(Exception):
+    """Ошибка в рабочем процессе."""
+
+
+def render_pool_settings():
+    options = {
+        'ENABLED': False,
+        'WORKERS': 2,
+        'MAX_QUEUE': 8,
+        'TIMEOUT_SECONDS': 30,
+        'RETRY_AFTER_SECONDS': 5,
+    }
+    options.update(getattr(settings, 'STATS_RENDER_POOL', {}))
+    return options
+
+
+def render_figure(figure_json, fmt):
+    """Отрисовать фигуру Plotly, переданную как JSON, в байты формата fmt."""
+    import plotly.io as pio
+    return pio.to_image(pio.from_json(figure_json), format=fmt)
+
+
+def _warm_up():
+    import plotly.graph_objects as go
+    import plotly.io as pio
+    try:
+        pio.to_image(go.Figure(data=[go.Bar(y=[1])]), format='png')
+    except Exception:
+        # Без kaleido прогреть нечего; ошибка вернётся с первым заданием
+        pass
+
+
+def _call(target, args):
+    module, name = target.rsplit('.', 1)
+    return getattr(importlib.import_module(module), name)(*args)
+
+
+def _worker_main(conn, warm_up):
+    if warm_up:
+        _warm_up()
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        target, args = job
+        try:
+            conn.send(('ok', _call(target, args)))
+        except Exception as exc:
+            conn.send(('error', f'{type(exc).__name__}: {exc}'))
+
+
+class _Worker:
+    def __init__(self, context, warm_up):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child, warm_up), daemon=True)
+        self.process.start()
+        child.close()
+
+    def run(self, target, args, timeout):
+        try:
+            self.conn.send((target, args))
+            if not self.conn.poll(timeout):
+                raise RenderTimeout(f'{target} не завершился за {timeout:.1f} с')
+            status, value = self.conn.recv()
+        except (EOFError, OSError):
+            raise RenderError('Рабочий процесс завершился')
+        if status == 'error':
+            raise RenderError(value)
+        return value
+
+    def stop(self, kill=False):
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class RenderPool:
+    """Пул из workers процессов с очередью не длиннее max_queue заданий."""
+
+    def __init__(self, workers=2, max_queue=8, timeout=30.0, warm_up=True):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._warm_up = warm_up
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._errors = 0
+        self._restarts = 0
+        self._wait_ms = deque(maxlen=1000)
+        self._render_ms = deque(maxlen=1000)
+        self._closed = False
+        for _ in range(workers):
+            self._idle.put(_Worker(self._context, warm_up))
+
+    def call(self, target, *args, timeout=None):
+        """
+        Выполнить ``target(*args)`` (путь к функции строкой) в рабочем
+        процессе и вернуть результат.
+        """
+        if self._closed:
+            raise RenderError('Пул остановлен')
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise PoolFull()
+        try:
+            return self._call(target, args, self.timeout if timeout is None else timeout)
+        finally:
+            self._slots.release()
+
+    def _call(self, target, args, timeout):
+        started = time.monotonic()
+        with self._lock:
+            self._waiting += 1
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            with self._lock:
+                self._timeouts += 1
+            raise RenderTimeout('Нет свободного процесса')
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        picked = time.monotonic()
+        with self._lock:
+            self._running += 1
+            self._wait_ms.append((picked - started) * 1000)
+        try:
+            result = worker.run(target, args, max(timeout - (picked - started), 0.001))
+        except RenderTimeout:
+            with self._lock:
+                self._timeouts += 1
+            # Процесс занят зависшим заданием: убиваем его, а не ждём
+            worker.process.kill()
+            worker.process.join()
+            raise
+        except RenderError:
+            with self._lock:
+                self._errors += 1
+            raise
+        finally:
+            with self._lock:
+                self._running -= 1
+            if not worker.process.is_alive():
+                worker.stop(kill=True)
+                worker = _Worker(self._context, self._warm_up)
+                with self._lock:
+                    self._restarts += 1
+            self._idle.put(worker)
+        with self._lock:
+            self._completed += 1
+            self._render_ms.append((time.monotonic() - picked) * 1000)
+        return result
+
+    def render(self, figure, fmt):
+        """Отрисовать фигуру Plotly в рабочем процессе."""
+        return self.call('stats_service.render_pool.render_figure', figure.to_json(), fmt)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'queue_depth': self._waiting,
+                'running': self._running,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'timeouts': self._timeouts,
+                'errors': self._errors,
+                'restarts': self._restarts,
+                'wait_ms': _percentiles(self._wait_ms),
+                'render_ms': _percentiles(self._render_ms),
+            }
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            worker.stop()
+
+
+def _percentiles(samples):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+
+    def pick(fraction):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 2)
+
+    return {'p50': pick(0.5), 'p95': pick(0.95), 'max': round(ordered[-1], 2)}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    """Общий для процесса RenderPool или None, если пул выключен."""
+    global _pool
+    options = render_pool_settings()
+    if not options['ENABLED']:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = RenderPool(
+                    workers=options['WORKERS'],
+                    max_queue=options['MAX_QUEUE'],
+                    timeout=options['TIMEOUT_SECONDS'],
+                )
+                atexit.register(_pool.close)
+    return _pool
+
@@ -0,0 +1,31 @@
+"""
+Рендереры DRF для графиков, отдаваемых байтами (PNG и SVG).
+
+Формат выбирается обычным согласованием DRF: по заголовку Accept или по
+параметру ``?format=png|svg``. Представление кладёт в Response готовые
+байты картинки; ответы с ошибками (словари) отдаются как JSON.
+"""
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class ImageRenderer(BaseRenderer):
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        response = (renderer_context or {}).get('response')
+        if response is not None and data is not None:
+            response['Content-Type'] = JSONRenderer.media_type
+        return JSONRenderer().render(data)
+
+
+class PNGRenderer(ImageRenderer):
+    media_type = 'image/png'
+    format = 'png'
+
+
+class SVGRenderer(ImageRenderer):
+    media_type = 'image/svg+xml'
+    format = 'svg'
@@ -0,0 +1,134 @@
+"""
+Встроенная отрисовка графиков в SVG без Plotly и kaleido.
+
+Графики статистики — простые столбцы и кольцо, поэтому SVG собирается
+из строк напрямую по массивам голосов: без Chromium, процессов и JSON
+фигуры, за доли миллисекунды. Размеры, отступы и цвета те же, что у
+фигур Plotly в stats_service.views, так что графики взаимозаменяемы.
+"""
+import math
+from html import escape
+
+WIDTH = 700
+FONT = 'font-family="Open Sans, verdana, arial, sans-serif"'
+GRID_COLOR = '#e5ecf6'
+TEXT_COLOR = '#2a3f5f'
+
+
+def _nice_ticks(highest, count=5):
+    """Деления оси от 0: шаг 1, 2 или 5 на степень десяти."""
+    if highest <= 0:
+        return [0, 1]
+    raw = highest / count
+    magnitude = 10 ** math.floor(math.log10(raw))
+    step = next(m * magnitude for m in (1, 2, 5, 10) if m * magnitude >= raw)
+    if step < 1:
+        step = 1
+    top = math.ceil(highest / step) * step
+    return [i * step for i in range(int(top / step) + 1)]
+
+
+def _document(width, height, title, body):
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}" {FONT}>'
+        f'<rect width="{width}" height="{height}" fill="#fff"/>'
+        f'<text x="{width / 2:.1f}" y="28" font-size="17" fill="{TEXT_COLOR}" '
+        f'text-anchor="middle">{escape(title)}</text>'
+        f'{body}</svg>'
+    ).encode('utf-8')
+
+
+def bar_chart(title, labels, values, colors, height=400, width=WIDTH,
+              x_title='', y_title='', value_suffix=''):
+    """Столбчатая диаграмма: SVG в байтах."""
+    left, right, top, bottom = 70, 20, 50, 60
+    plot_w = width - left - right
+    plot_h = height - top - bottom
+    ticks = _nice_ticks(max(values, default=0))
+    scale = plot_h / ticks[-1]
+    parts = []
+    for tick in ticks:
+        y = top + plot_h - tick * scale
+        parts.append(
+            f'<line x1="{left}" x2="{left + plot_w}" y1="{y:.1f}" y2="{y:.1f}" stroke="{GRID_COLOR}"/>'
+            f'<text x="{left - 6}" y="{y + 4:.1f}" font-size="12" fill="{TEXT_COLOR}" '
+            f'text-anchor="end">{tick:g}</text>'
+        )
+    slot = plot_w / max(len(values), 1)
+    bar_w = slot * 0.8
+    for i, (label, value) in enumerate(zip(labels, values)):
+        x = left + i * slot + (slot - bar_w) / 2
+        bar_h = value * scale
+        y = top + plot_h - bar_h
+        center = x + bar_w / 2
+        parts.append(
+            f'<rect x="{x:.1f}" y="{y:.1f}" width="{bar_w:.1f}" height="{bar_h:.1f}" '
+            f'fill="{colors[i % len(colors)]}"><title>{escape(str(label))}: {value}</title></rect>'
+            f'<text x="{center:.1f}" y="{(y - 6 if bar_h < 20 else y + 16):.1f}" font-size="12" '
+            f'fill="{TEXT_COLOR if bar_h < 20 else "#fff"}" text-anchor="middle">'
+            f'{value}{escape(value_suffix)}</text>'
+            f'<text x="{center:.1f}" y="{top + plot_h + 18:.1f}" font-size="12" fill="{TEXT_COLOR}" '
+            f'text-anchor="middle">{escape(str(label))}</text>'
+        )
+    if x_title:
+        parts.append(
+            f'<text x="{left + plot_w / 2:.1f}" y="{height - 12}" font-size="14" '
+            f'fill="{TEXT_COLOR}" text-anchor="middle">{escape(x_title)}</text>'
+        )
+    if y_title:
+        y = top + plot_h / 2
+        parts.append(
+            f'<text x="18" y="{y:.1f}" font-size="14" fill="{TEXT_COLOR}" text-anchor="middle" '
+            f'transform="rotate(-90 18 {y:.1f})">{escape(y_title)}</text>'
+        )
+    return _document(width, height, title, ''.join(parts))
+
+
+def donut_chart(title, labels, values, colors, height=500, width=WIDTH, hole=0.3):
+    """Кольцевая диаграмма с подписями долей: SVG в байтах."""
+    cx, cy = width / 2, 40 + (height - 60) / 2
+    outer = (height - 60) / 2
+    inner = outer * hole
+    total = sum(values)
+    parts = []
+    if total <= 0:
+        parts.append(
+            f'<circle cx="{cx:.1f}" cy="{cy:.1f}" r="{(outer + inner) / 2:.1f}" fill="none" '
+            f'stroke="{GRID_COLOR}" stroke-width="{outer - inner:.1f}"/>'
+        )
+        return _document(width, height, title, ''.join(parts))
+    angle = -math.pi / 2
+    for i, (label, value) in enumerate(zip(labels, values)):
+        if value <= 0:
+            continue
+        share = value / total
+        color = colors[i % len(colors)]
+        tooltip = f'<title>{escape(str(label))}: {share * 100:.1f}%</title>'
+        if share >= 0.9999:
+            parts.append(
+                f'<circle cx="{cx:.1f}" cy="{cy:.1f}" r="{(outer + inner) / 2:.1f}" fill="none" '
+                f'stroke="{color}" stroke-width="{outer - inner:.1f}">{tooltip}</circle>'
+            )
+        else:
+            end = angle + share * 2 * math.pi
+            large = 1 if share > 0.5 else 0
+            x0, y0 = cx + outer * math.cos(angle), cy + outer * math.sin(angle)
+            x1, y1 = cx + outer * math.cos(end), cy + outer * math.sin(end)
+            x2, y2 = cx + inner * math.cos(end), cy + inner * math.sin(end)
+            x3, y3 = cx + inner * math.cos(angle), cy + inner * math.sin(angle)
+            parts.append(
+                f'<path d="M{x0:.2f},{y0:.2f}A{outer:.1f},{outer:.1f} 0 {large} 1 {x1:.2f},{y1:.2f}'
+                f'L{x2:.2f},{y2:.2f}A{inner:.1f},{inner:.1f} 0 {large} 0 {x3:.2f},{y3:.2f}Z" '
+                f'fill="{color}" stroke="#fff" stroke-width="1">{tooltip}</path>'
+            )
+        middle = angle + share * math.pi
+        radius = (outer + inner) / 2
+        parts.append(
+            f'<text x="{cx + radius * math.cos(middle):.1f}" y="{cy + radius * math.sin(middle) + 4:.1f}" '
+            f'font-size="12" fill="{TEXT_COLOR}" text-anchor="middle">'
+            f'{escape(str(label))}<tspan x="{cx + radius * math.cos(middle):.1f}" dy="14">'
+            f'{share * 100:.1f}%</tspan></text>'
+        )
+        angle += share * 2 * math.pi
+    return _document(width, height, title, ''.join(parts))
@@ -1,3 +1,417 @@
+import datetime
+import os
+import tempfile
+import threading
+import time
+from xml.etree import ElementTree
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from polls import hll
+from polls.models import Choice, Question
+from polls.querybudget import QueryBudgetMixin
+from polls.voting import cast_vote
+
+from . import analytics
+from .chart_cache import ChartCache
+from .svg import bar_chart, donut_chart
+from .render_pool import PoolFull, RenderError, RenderPool, RenderTimeout
+
+
+class StatsAPITests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        chart_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(chart_dir.cleanup)
+        chart_settings = self.settings(STATS_CHART_CACHE={'DIR': chart_dir.name})
+        chart_settings.enable()
+        self.addCleanup(chart_settings.disable)
+        # Отчёт аналитики кэшируется — каждый тест начинает с пустого кэша
+        cache.clear()
+        self.user = User.objects.create_user(username='analyst', password='secret')
+        self.client.force_login(self.user)
+        self.question = Question.objects.create(
+            question_text='Любимый язык?', pub_date=timezone.now()
+        )
+        self.python = Choice.objects.create(question=self.question, choice_text='Python')
+        self.rust = Choice.objects.create(question=self.question, choice_text='Rust')
+        # Таблицы лидеров — свои для каждого теста и заполняются голосами
+        patcher = mock.patch.dict('polls.leaderboard._boards', clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Как и скетчи уникальных голосующих: их сбрасываем сразу после голосов
+        patcher = mock.patch('polls.hll._buffer', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                voter = User.objects.create_user(username=f'voter{i}')
+                cast_vote(self.python if i else self.rust, voter)
+        hll.get_sketch_buffer().flush()
+
+    def query_budgets(self):
+        question_id = self.question.id
+        return {
+            # сессия, пользователь, вопрос, варианты
+            'stats:question_stats': (reverse('stats:question_stats', args=(question_id,)), 4),
+            # сессия, пользователь, строка счётчиков, две таблицы лидеров
+            # и скетчи уникальных голосующих
+            'stats:global_stats': (reverse('stats:global_stats'), 6),
+            'stats:chart': (reverse('stats:chart', args=(question_id,)), 4),
+            'stats:chart_base64': (reverse('stats:chart_base64', args=(question_id,)), 4),
+            # сессия, пользователь, вопросы, варианты — при любом числе id
+            'stats:question_stats_batch': (
+                reverse('stats:question_stats_batch') + f'?ids={question_id},{question_id + 1}', 4
+            ),
+            # сессия, пользователь, вопрос, варианты, отметки свёртки, корзины
+            'stats:question_timeseries': (reverse('stats:question_timeseries', args=(question_id,)), 6),
+            # сессия, пользователь, варианты вместе с текстом вопроса
+            'stats:chart_data': (reverse('stats:chart_data', args=(question_id,)), 3),
+            # сессия, пользователь, пары (вопрос, голоса) всех вариантов
+            'stats:analytics': (reverse('stats:analytics'), 3),
+            'export:export_csv': (reverse('export:export_csv', args=(question_id,)), 4),
+            'export:export_json': (reverse('export:export_json', args=(question_id,)), 4),
+            'export:export_all_json': (reverse('export:export_all_json'), 4),
+            'export:export_all_csv': (reverse('export:export_all_csv'), 4),
+        }
+
+    def test_query_budgets(self):
+        # Рендеринг графиков (kaleido) в бюджет запросов не входит
+        with mock.patch('stats_service.views.pio.to_image', return_value=b'<svg/>'):
+            super().test_query_budgets()
+
+    def test_question_stats(self):
+        response = self.client.get(
+            reverse('stats:question_stats', args=(self.question.id,))
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_votes'], 3)
+        self.assertEqual(response.data['unique_voters'], {'estimate': 3, 'error': 0.0163})
+        self.assertEqual(
+            [(c['choice_text'], c['votes_count'], c['percentage']) for c in response.data['choices']],
+            [('Python', 2, 66.67), ('Rust', 1, 33.33)],
+        )
+
+    def test_global_stats(self):
+        Question.objects.create(question_text='Пустой опрос', pub_date=timezone.now())
+        response = self.client.get(reverse('stats:global_stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_questions'], 2)
+        self.assertEqual(response.data['total_votes'], 3)
+        self.assertEqual(response.data['popular_questions'][0]['id'], self.question.id)
+        self.assertEqual(response.data['popular_questions'][0]['votes'], 3)
+        self.assertEqual(len(response.data['popular_questions']), 1)
+        self.assertEqual(response.data['trending_questions'][0]['id'], self.question.id)
+        self.assertAlmostEqual(response.data['trending_questions'][0]['score'], 3, places=1)
+        self.assertEqual(
+            response.data['unique_voters'],
+            {'total': 3, 'today': 3, 'last_7_days': 3, 'error': 0.0163},
+        )
+
+    @mock.patch('stats_service.views.pio.to_image', return_value=b'<svg/>')
+    def test_chart_is_rendered_once_per_data_version(self, to_image):
+        url = reverse('stats:chart', args=(self.question.id,))
+        for _ in range(2):
+            self.assertEqual(self.client.get(url).data, {'svg': '<svg/>'})
+        self.assertEqual(to_image.call_count, 1)
+        cast_vote(self.rust, User.objects.create_user(username='late'))
+        self.client.get(url)
+        self.assertEqual(to_image.call_count, 2)
+        self.client.get(reverse('stats:chart_base64', args=(self.question.id,)))
+        self.assertEqual(to_image.call_count, 3)
+
+        self.user.is_staff = True
+        self.user.save()
+        metrics = self.client.get(reverse('stats:chart_cache')).data
+        self.assertEqual((metrics['hits'], metrics['misses']), (1, 3))
+
+    def test_chart_returns_503_when_render_pool_is_full(self):
+        pool = mock.Mock()
+        pool.render.side_effect = PoolFull()
+        with mock.patch('stats_service.views.get_render_pool', return_value=pool):
+            response = self.client.get(reverse('stats:chart', args=[self.question.pk]))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+
+    def test_chart_base64_returns_503_when_render_times_out(self):
+        pool = mock.Mock()
+        pool.render.side_effect = RenderTimeout()
+        with mock.patch('stats_service.views.get_render_pool', return_value=pool):
+            response = self.client.get(reverse('stats:chart_base64', args=[self.question.pk]))
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+    def test_native_engine_renders_without_plotly(self):
+        cast_vote(self.python, self.user)
+        with mock.patch('stats_service.views.pio.to_image') as to_image:
+            chart = self.client.get(reverse('stats:chart', args=[self.question.pk]), {'engine': 'native'})
+            donut = self.client.get(reverse('stats:chart_base64', args=[self.question.pk]), {'engine': 'native'})
+        to_image.assert_not_called()
+        self.assertTrue(chart.json()['svg'].startswith('<svg'))
+        self.assertIn('Python', chart.json()['svg'])
+        self.assertTrue(donut.json()['image'].startswith('data:image/svg+xml;base64,'))
+
+    def test_unknown_engine_is_rejected(self):
+        response = self.client.get(reverse('stats:chart', args=[self.question.pk]), {'engine': 'gnuplot'})
+        self.assertEqual(response.status_code, 400)
+
+    @mock.patch('stats_service.views.pio.to_image', return_value=b'<svg/>')
+    def test_chart_as_image_bytes_with_etag(self, to_image):
+        url = reverse('stats:chart', args=(self.question.id,))
+        response = self.client.get(url, HTTP_ACCEPT='image/svg+xml')
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertEqual(response.content, b'<svg/>')
+        self.assertEqual(response['Cache-Control'], 'private, max-age=60')
+        self.assertEqual(to_image.call_args.kwargs['format'], 'svg')
+
+        cached = self.client.get(url, HTTP_ACCEPT='image/svg+xml', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b'')
+        # JSON-обёртка для прежних клиентов осталась ответом по умолчанию
+        self.assertEqual(self.client.get(url).data, {'svg': '<svg/>'})
+
+    @mock.patch('stats_service.views.pio.to_image', return_value=b'\x89PNG')
+    def test_chart_format_parameter(self, to_image):
+        url = reverse('stats:chart_base64', args=(self.question.id,))
+        png = self.client.get(url, {'format': 'png'})
+        self.assertEqual((png['Content-Type'], png.content), ('image/png', b'\x89PNG'))
+        svg = self.client.get(url, {'format': 'svg', 'engine': 'native'})
+        self.assertEqual(svg['Content-Type'], 'image/svg+xml')
+        self.assertTrue(svg.content.startswith(b'<svg'))
+        self.assertNotEqual(png['ETag'], svg['ETag'])
+        self.assertEqual(self.client.get(url, {'format': 'png', 'engine': 'native'}).status_code, 406)
+
+        missing = self.client.get(reverse('stats:chart', args=(0,)), HTTP_ACCEPT='image/png')
+        self.assertEqual((missing.status_code, missing['Content-Type']), (404, 'application/json'))
+
+    def test_chart_data_columns(self):
+        response = self.client.get(reverse('stats:chart_data', args=(self.question.id,)))
+        self.assertEqual(response.data, {
+            'question_id': self.question.id,
+            'question_text': 'Любимый язык?',
+            'total_votes': 3,
+            'labels': ['Python', 'Rust'],
+            'votes': [2, 1],
+            'percentages': [66.67, 33.33],
+            'colors': ['#FF6B6B', '#4ECDC4'],
+        })
+        empty = Question.objects.create(question_text='Без вариантов', pub_date=timezone.now())
+        response = self.client.get(reverse('stats:chart_data', args=(empty.id,)))
+        self.assertEqual((response.data['question_text'], response.data['labels']), ('Без вариантов', []))
+        self.assertEqual(self.client.get(reverse('stats:chart_data', args=(0,))).status_code, 404)
+
+    def test_question_stats_batch(self):
+        other = Question.objects.create(question_text='Пустой опрос', pub_date=timezone.now())
+        url = reverse('stats:question_stats_batch')
+        single = self.client.get(reverse('stats:question_stats', args=(self.question.id,))).data
+        with self.assertNumQueries(4):
+            response = self.client.post(
+                url, {'ids': [self.question.id, 'x', 0, other.id, self.question.id, 10 ** 23]},
+                content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [
+            single,
+            {'question_id': 'x', 'error': 'Некорректный id'},
+            {'question_id': 0, 'error': 'Вопрос не найден'},
+            {
+                'question_id': other.id,
+                'question_text': 'Пустой опрос',
+                'pub_date': other.pub_date,
+                'total_votes': 0,
+                'unique_voters': {'estimate': 0, 'error': 0.0163},
+                'choices': [],
+            },
+            {'question_id': str(10 ** 23), 'error': 'Некорректный id'},
+        ])
+        response = self.client.get(url, {'ids': f'{other.id}, {self.question.id}'})
+        self.assertEqual([r['question_id'] for r in response.data['results']], [other.id, self.question.id])
+
+    def test_analytics(self):
+        Question.objects.create(question_text='Пустой опрос', pub_date=timezone.now())
+        url = reverse('stats:analytics')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {k: response.data['summary'][k] for k in ('questions', 'questions_with_votes', 'total_votes')},
+            {'questions': 1, 'questions_with_votes': 1, 'total_votes': 3},
+        )
+        self.assertEqual(response.data['questions'], [{
+            'question_id': self.question.id,
+            'choices': 2,
+            'total_votes': 3,
+            'entropy': 0.9183,
+            'consensus': 0.0817,
+            'leader_margin': 0.3333,
+            'chi_square': 0.3333,
+        }])
+        # Повторный запрос читает отчёт из кэша, не из базы
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_vote(self.rust, User.objects.create_user(username='late'))
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(url).data['summary']['total_votes'], 3)
+        with self.settings(STATS_ANALYTICS={'ENABLED': False}):
+            self.assertEqual(self.client.get(url).data['summary']['total_votes'], 4)
+
+    def test_question_stats_batch_limits(self):
+        url = reverse('stats:question_stats_batch')
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.post(url, {'ids': 1}, content_type='application/json').status_code, 400)
+        with self.settings(STATS_BATCH_MAX_IDS=2):
+            self.assertEqual(self.client.get(url, {'ids': '1,2,3'}).status_code, 400)
+
+    def test_question_timeseries(self):
+        url = reverse('stats:question_timeseries', args=(self.question.id,))
+        response = self.client.get(url, {'resolution': 'minute', 'range': '10m'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['buckets']), 11)
+        self.assertEqual(
+            [(s['choice_text'], sum(s['counts'])) for s in response.data['series']],
+            [('Python', 2), ('Rust', 1)],
+        )
+        response = self.client.get(url, {'resolution': 'day'})
+        self.assertEqual(sum(response.data['series'][0]['counts']), 2)
+        # Смещение не в целый час: корзины всё равно совпадают с часами UTC
+        india = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+        start = (timezone.now() - datetime.timedelta(hours=2)).astimezone(india)
+        response = self.client.get(url, {
+            'resolution': 'hour',
+            'start': start.isoformat(),
+            'end': (start + datetime.timedelta(hours=3)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([sum(s['counts']) for s in response.data['series']], [2, 1])
+
+        for params in ({'resolution': 'week'}, {'range': 'soon'}, {'start': '2026-01-02', 'end': '2026-01-01'},
+                       {'resolution': 'minute', 'range': '30d'}, {'end': '2024-13-45T00:00:00'},
+                       {'start': '2024-02-30T00:00:00'}, {'range': '99999999999d'}, {'range': '999999d'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+        # Огромный интервал отклоняется до построения корзин
+        with mock.patch('stats_service.views.timeseries.buckets') as buckets:
+            response = self.client.get(url, {'resolution': 'minute', 'range': '3650d'})
+        self.assertEqual(response.status_code, 400)
+        buckets.assert_not_called()
+
+
+class NativeSVGTests(TestCase):
+    def test_bar_chart_is_valid_svg_with_escaped_labels(self):
+        svg = bar_chart('<Опрос>', ['A & B', 'C'], [3, 7], ['#111'], value_suffix=' голосов')
+        root = ElementTree.fromstring(svg)
+        self.assertEqual(len(root.findall('{http://www.w3.org/2000/svg}rect')), 3)
+        self.assertIn('A &amp; B', svg.decode())
+        self.assertIn('7 голосов', svg.decode())
+
+    def test_donut_chart_handles_single_and_empty_data(self):
+        for values in ([5, 0], [0, 0], [1, 2, 3]):
+            ElementTree.fromstring(donut_chart('Опрос', ['a', 'b', 'c'][:len(values)], values, ['#111']))
+        self.assertIn('100.0%', donut_chart('Опрос', ['a', 'b'], [5, 0], ['#111']).decode())
+
+
+class ChartCacheTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = ChartCache(directory.name, max_bytes=25)
+
+    def age(self, question_id, seconds):
+        path = self.cache._path(question_id, 'bar', 'svg', 400, 'v1')
+        moment = os.stat(path).st_mtime - seconds
+        os.utime(path, (moment, moment))
+
+    def test_new_version_replaces_old(self):
+        self.cache.put(1, 'bar', 'svg', 400, 'v1', b'old')
+        self.cache.put(1, 'bar', 'svg', 400, 'v2', b'new')
+        self.assertIsNone(self.cache.get(1, 'bar', 'svg', 400, 'v1'))
+        self.assertEqual(self.cache.get(1, 'bar', 'svg', 400, 'v2'), b'new')
+        self.assertEqual(self.cache.metrics()['bytes'], 3)
+
+    def test_least_recently_read_is_evicted(self):
+        self.cache.put(1, 'bar', 'svg', 400, 'v1', b'x' * 10)
+        self.cache.put(2, 'bar', 'svg', 400, 'v1', b'x' * 10)
+        self.age(1, 20)
+        self.age(2, 10)
+        self.cache.get(1, 'bar', 'svg', 400, 'v1')
+        self.cache.put(3, 'bar', 'svg', 400, 'v1', b'x' * 10)
+        self.assertIsNotNone(self.cache.get(1, 'bar', 'svg', 400, 'v1'))
+        self.assertIsNone(self.cache.get(2, 'bar', 'svg', 400, 'v1'))
+        self.assertEqual(self.cache.metrics()['evictions'], 1)
+
+
+class RenderPoolTests(TestCase):
+    def setUp(self):
+        self.pool = RenderPool(workers=1, max_queue=0, timeout=10, warm_up=False)
+        self.addCleanup(self.pool.close)
+
+    def test_job_runs_in_worker_process(self):
+        self.assertEqual(self.pool.call('base64.b64decode', 'aGk='), b'hi')
+        self.assertEqual(self.pool.call('os.getppid'), os.getpid())
+        metrics = self.pool.metrics()
+        self.assertEqual(metrics['completed'], 2)
+        self.assertIsNotNone(metrics['render_ms'])
+
+    def test_worker_error_is_raised(self):
+        with self.assertRaises(RenderError):
+            self.pool.call('base64.b64decode', 'a')
+        self.assertEqual(self.pool.call('base64.b64decode', 'aGk='), b'hi')
+
+    def test_stuck_job_times_out_and_worker_is_replaced(self):
+        with self.assertRaises(RenderTimeout):
+            self.pool.call('time.sleep', 30, timeout=0.5)
+        self.assertEqual(self.pool.call('base64.b64decode', 'aGk='), b'hi')
+        metrics = self.pool.metrics()
+        self.assertEqual((metrics['timeouts'], metrics['restarts']), (1, 1))
+
+    def test_full_pool_rejects_new_jobs(self):
+        self.pool.call('os.getpid')  # дождаться запуска процесса
+        busy = threading.Thread(target=self.pool.call, args=('time.sleep', 1))
+        busy.start()
+        self.addCleanup(busy.join)
+        while not self.pool.metrics()['running']:
+            time.sleep(0.01)
+        with self.assertRaises(PoolFull):
+            self.pool.call('os.getpid')
+        self.assertEqual(self.pool.metrics()['rejected'], 1)
+
+
+class AnalyticsTests(TestCase):
+    def reference(self, votes):
+        """Те же метрики для одного вопроса — обычным циклом"""
+        total, k = sum(votes), len(votes)
+        if not total:
+            return [None] * 4
+        shares = [v / total for v in votes]
+        entropy = -sum(p * np.log2(p) for p in shares if p)
+        ranked = sorted(votes, reverse=True) + [0]
+        expected = total / k
+        return [
+            entropy,
+            1 - entropy / np.log2(k) if k > 1 else None,
+            (ranked[0] - ranked[1]) / total,
+            sum((v - expected) ** 2 / expected for v in votes),
+        ]
+
+    def test_segment_reductions_match_per_question_loop(self):
+        rng = np.random.default_rng(7)
+        questions = [list(rng.integers(0, 50, rng.integers(1, 6))) for _ in range(200)]
+        questions += [[0, 0, 0], [9], [5, 5]]
+        question_ids = np.repeat(np.arange(len(questions)) * 3 + 1, [len(q) for q in questions])
+        metrics = analytics.compute(question_ids, np.concatenate(questions).astype(np.int64))
+        self.assertEqual(metrics['question_id'].tolist(), sorted(set(question_ids.tolist())))
+        for i, votes in enumerate(questions):
+            self.assertEqual(metrics['total_votes'][i], sum(votes))
+            for name, expected in zip(analytics.METRICS, self.reference(votes)):
+                if expected is None:
+                    self.assertTrue(np.isnan(metrics[name][i]), (name, votes))
+                else:
+                    self.assertAlmostEqual(metrics[name][i], expected, places=6, msg=(name, votes))
 
-# Create your tests here.
+    def test_empty_report(self):
+        report = analytics.report()
+        self.assertEqual(report['questions'], [])
+        self.assertEqual(report['summary']['mean_consensus'], None)
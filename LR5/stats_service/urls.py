@@ -6,8 +6,18 @@ app_name = 'stats'
 
 urlpatterns = [
     path('question/<int:question_id>/', views.QuestionStatsAPI.as_view(), name='question_stats'),
+    path('question/<int:question_id>/timeseries/', views.QuestionTimeSeriesAPI.as_view(), name='question_timeseries'),
+    path('questions/batch/', views.QuestionStatsBatchAPI.as_view(), name='question_stats_batch'),
     path('global/', views.GlobalStatsAPI.as_view(), name='global_stats'),
     path('chart/<int:question_id>/', views.ChartAPI.as_view(), name='chart'),
     path('chart/base64/<int:question_id>/', views.ChartBase64API.as_view(), name='chart_base64'),
+    path('chart-data/<int:question_id>/', views.ChartDataAPI.as_view(), name='chart_data'),
+    path('analytics/', views.AnalyticsAPI.as_view(), name='analytics'),
+    path('vote-buffer/', views.VoteBufferStatsAPI.as_view(), name='vote_buffer'),
+    path('idempotency/', views.IdempotencyStatsAPI.as_view(), name='idempotency'),
+    path('index-cache/', views.IndexCacheStatsAPI.as_view(), name='index_cache'),
+    path('chart-cache/', views.ChartCacheStatsAPI.as_view(), name='chart_cache'),
+    path('live-results/', views.LiveResultsStatsAPI.as_view(), name='live_results'),
+    path('render-pool/', views.RenderPoolStatsAPI.as_view(), name='render_pool'),
     path('dashboard/', TemplateView.as_view(template_name='stats/dashboard.html'), name='dashboard'),
 ]
\ No newline at end of file
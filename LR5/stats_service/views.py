@@ -1,140 +1,476 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.settings import api_settings
+from django.conf import settings
 from django.shortcuts import get_object_or_404
-from django.db.models import Count, Sum, F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_duration
+from django.utils.http import parse_etags, quote_etag
+from django.db.models import F, OuterRef, Subquery
 import plotly.graph_objects as go
 import plotly.io as pio
 import base64
+import datetime
+import re
 import io
-from polls.models import Question, Choice
+from polls.models import Question, Choice, UniqueVoterSketch
+from polls.buffer import get_vote_buffer
+from polls.idempotency import get_idempotency_cache
+from polls import globalstats, hll, index_cache, timeseries
+from polls.leaderboard import top_questions
+from polls.voting import MAX_ID
+from polls import live
+from . import analytics, svg
+from .chart_cache import cached_chart, data_version, get_chart_cache
+from .renderers import PNGRenderer, SVGRenderer
+from .render_pool import PoolFull, RenderTimeout, get_render_pool, render_pool_settings
 import json
 
 
+BAR_COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd']
+PIE_COLORS = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FECA57']
+CHART_ENGINES = ('native', 'plotly')
+
+
+def chart_engine(request):
+    """Движок отрисовки из ?engine=, по умолчанию STATS_CHART_ENGINE"""
+    return request.query_params.get('engine', getattr(settings, 'STATS_CHART_ENGINE', 'plotly'))
+
+
+def unknown_engine(engine):
+    return Response(
+        {'error': f"Неизвестный движок '{engine}', допустимы: {', '.join(CHART_ENGINES)}"},
+        status=status.HTTP_400_BAD_REQUEST,
+    )
+
+
+def bar_figure(title, labels, votes):
+    """Столбчатая диаграмма Plotly"""
+    fig = go.Figure(
+        data=[go.Bar(
+            x=labels,
+            y=votes,
+            text=[f'{v} голосов' for v in votes],
+            textposition='auto',
+            marker_color=BAR_COLORS[:len(votes)]
+        )]
+    )
+
+    fig.update_layout(
+        title=title,
+        xaxis_title='Варианты ответа',
+        yaxis_title='Количество голосов',
+        showlegend=False,
+        height=400,
+        margin=dict(l=20, r=20, t=40, b=20)
+    )
+    return fig
+
+
+def pie_figure(title, labels, percentages):
+    """Круговая диаграмма Plotly с отверстием в центре"""
+    fig = go.Figure(
+        data=[go.Pie(
+            labels=labels,
+            values=percentages,
+            hole=.3,
+            textinfo='label+percent',
+            marker=dict(colors=PIE_COLORS[:len(percentages)])
+        )]
+    )
+
+    fig.update_layout(
+        title=title,
+        showlegend=False,
+        height=500,
+        margin=dict(l=20, r=20, t=40, b=20)
+    )
+    return fig
+
+
+def native_bar(title, labels, votes):
+    """Та же столбчатая диаграмма во встроенном SVG"""
+    return svg.bar_chart(
+        title, labels, votes, BAR_COLORS, height=400,
+        x_title='Варианты ответа', y_title='Количество голосов',
+        value_suffix=' голосов',
+    )
+
+
+def native_donut(title, labels, votes):
+    """Та же кольцевая диаграмма во встроенном SVG"""
+    return svg.donut_chart(title, labels, votes, PIE_COLORS, height=500)
+
+
+def to_image(fig, fmt):
+    """Отрисовать график в пуле процессов, а если пул выключен — здесь же"""
+    pool = get_render_pool()
+    if pool is None:
+        return pio.to_image(fig, format=fmt)
+    return pool.render(fig, fmt)
+
+
+def render_unavailable(exc):
+    """Ответ 503, когда пул отрисовки переполнен или не успел"""
+    if isinstance(exc, PoolFull):
+        error = 'Очередь отрисовки графиков заполнена'
+    else:
+        error = 'График не отрисован вовремя'
+    return Response(
+        {'error': error},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={'Retry-After': str(render_pool_settings()['RETRY_AFTER_SECONDS'])},
+    )
+
+
+def image_response(request, question_id, chart, size, engine, version, native, figure):
+    """
+    Байты графика в формате, выбранном по Accept или ?format=, с ETag и
+    Cache-Control. Если у клиента та же версия, ответ 304 без отрисовки.
+    """
+    fmt = request.accepted_renderer.format
+    etag = quote_etag(f'{chart}-{size}-{engine}-{version}.{fmt}')
+    max_age = getattr(settings, 'STATS_CHART_MAX_AGE', 60)
+    # Графики доступны только вошедшим пользователям, поэтому не public
+    headers = {'ETag': etag, 'Cache-Control': f'private, max-age={max_age}'}
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if engine == 'native':
+        if fmt != 'svg':
+            return Response(
+                {'error': 'Встроенный движок рисует только SVG'},
+                status=status.HTTP_406_NOT_ACCEPTABLE,
+            )
+        return Response(native(), headers=headers)
+    try:
+        data = cached_chart(question_id, chart, fmt, size, version, lambda: to_image(figure(), fmt))
+    except (PoolFull, RenderTimeout) as exc:
+        return render_unavailable(exc)
+    return Response(data, headers=headers)
+
+
+def with_voter_sketch(questions):
+    """Вопросы с HyperLogLog-скетчем своих проголосовавших (voter_sketch)"""
+    # Голосующие, которые ждут сброса в этом процессе, сначала попадают в скетчи
+    hll.flush_due()
+    sketch = UniqueVoterSketch.objects.filter(
+        scope=UniqueVoterSketch.QUESTION, question=OuterRef('pk')
+    ).values('registers')[:1]
+    return questions.annotate(voter_sketch=Subquery(sketch))
+
+
 class QuestionStatsAPI(APIView):
     """API для статистики по конкретному вопросу"""
 
     def get(self, request, question_id):
-        question = get_object_or_404(Question, pk=question_id)
+        question = get_object_or_404(
+            with_voter_sketch(Question.objects.with_live_total_votes()), pk=question_id
+        )
 
         # Получаем варианты ответов с количеством голосов
-        choices = question.choice_set.annotate(
-            votes_count=Count('votes')
+        choices = question.choice_set.with_live_votes().annotate(
+            votes_count=F('live_votes')
         ).values('choice_text', 'votes_count')
 
-        # Считаем общее количество голосов
-        total_votes = sum(choice['votes_count'] for choice in choices)
-
-        # Добавляем проценты
-        for choice in choices:
-            if total_votes > 0:
-                choice['percentage'] = round((choice['votes_count'] / total_votes) * 100, 2)
-            else:
-                choice['percentage'] = 0.0
+        # Общее количество голосов поддерживается при голосовании
+        total_votes = question.live_total_votes
 
         data = {
             'question_id': question.id,
             'question_text': question.question_text,
             'pub_date': question.pub_date,
             'total_votes': total_votes,
-            'choices': list(choices),
+            # Оценка числа разных проголосовавших и её относительная погрешность
+            'unique_voters': hll.estimate(question.voter_sketch),
+            'choices': with_percentages(choices, total_votes),
         }
 
         return Response(data)
 
 
+def with_percentages(choices, total_votes):
+    """Варианты со своей долей голосов в процентах"""
+    choices = list(choices)
+    for choice in choices:
+        if total_votes > 0:
+            choice['percentage'] = round((choice['votes_count'] / total_votes) * 100, 2)
+        else:
+            choice['percentage'] = 0.0
+    return choices
+
+
+class QuestionStatsBatchAPI(APIView):
+    """
+    API для статистики сразу по многим вопросам: ?ids=1,2,3 или POST
+    {"ids": [...]}. Два запроса на любое число вопросов; ошибки по
+    отдельным id возвращаются в списке результатов.
+    """
+
+    def get(self, request):
+        ids = request.query_params.get('ids', '')
+        return self.stats([part for part in ids.split(',') if part.strip()])
+
+    def post(self, request):
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        if not isinstance(ids, list):
+            return Response({'error': 'Ожидается {"ids": [...]}'}, status=status.HTTP_400_BAD_REQUEST)
+        return self.stats(ids)
+
+    def stats(self, raw_ids):
+        limit = getattr(settings, 'STATS_BATCH_MAX_IDS', 1000)
+        if not raw_ids:
+            return Response({'error': 'Не указаны id вопросов'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(raw_ids) > limit:
+            return Response(
+                {'error': f'Не больше {limit} id за запрос'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        requested = []
+        for raw in dict.fromkeys(str(raw_id).strip() for raw_id in raw_ids):
+            try:
+                question_id = int(raw)
+            except ValueError:
+                question_id = None
+            # За пределами 64 бит id не найти — SQLite отказывается от запроса
+            if question_id is not None and not -MAX_ID <= question_id <= MAX_ID:
+                question_id = None
+            requested.append((raw, question_id))
+        ids = {question_id for _, question_id in requested if question_id is not None}
+
+        questions = {
+            q['id']: q
+            for q in with_voter_sketch(Question.objects.with_live_total_votes()).filter(pk__in=ids)
+            .values('id', 'question_text', 'pub_date', 'live_total_votes', 'voter_sketch')
+        }
+        # Варианты всех вопросов — один запрос (с шардами — с группировкой)
+        choices = {question_id: [] for question_id in questions}
+        for choice in (
+            Choice.objects.filter(question_id__in=questions).with_live_votes()
+            .annotate(votes_count=F('live_votes'))
+            .order_by('question_id', 'pk')
+            .values('question_id', 'choice_text', 'votes_count')
+        ):
+            choices[choice.pop('question_id')].append(choice)
+
+        results = []
+        for raw, question_id in requested:
+            if question_id is None:
+                results.append({'question_id': raw, 'error': 'Некорректный id'})
+            elif question_id not in questions:
+                results.append({'question_id': question_id, 'error': 'Вопрос не найден'})
+            else:
+                question = questions[question_id]
+                total_votes = question['live_total_votes']
+                results.append({
+                    'question_id': question_id,
+                    'question_text': question['question_text'],
+                    'pub_date': question['pub_date'],
+                    'total_votes': total_votes,
+                    'unique_voters': hll.estimate(question['voter_sketch']),
+                    'choices': with_percentages(choices[question_id], total_votes),
+                })
+        return Response({'results': results})
+
+
 class GlobalStatsAPI(APIView):
     """API для глобальной статистики"""
 
     def get(self, request):
-        # Статистика по всем опросам
-        total_questions = Question.objects.count()
-
-        # Самые популярные вопросы
-        popular_questions = Question.objects.annotate(
-            total_votes=Sum('choice__votes')
-        ).order_by('-total_votes')[:10]
-
-        # Активные опросы (за последние 7 дней)
-        from django.utils import timezone
-        from datetime import timedelta
-        week_ago = timezone.now() - timedelta(days=7)
-        recent_questions = Question.objects.filter(
-            pub_date__gte=week_ago
-        ).count()
-
-        # Статистика по голосам
-        total_votes = Choice.objects.aggregate(
-            total=Sum('votes')
-        )['total'] or 0
+        # Счётчики по всем опросам и голосам — одна строка, которую ведут
+        # сигналы и учёт голосов (polls/globalstats.py)
+        stats = globalstats.snapshot()
+
+        # Самые популярные и набирающие популярность вопросы: K строк
+        # таблицы лидеров, которую ведут сами голоса
+        popular_questions = top_questions('popular')
+        trending_questions = top_questions('trending')
 
         data = {
-            'total_questions': total_questions,
-            'total_votes': total_votes,
-            'recent_questions': recent_questions,
+            'total_questions': stats['total_questions'],
+            'total_votes': stats['total_votes'],
+            'recent_questions': stats['recent_questions'],
+            # Оценки HyperLogLog: за всё время, сегодня и за 7 дней
+            'unique_voters': hll.global_unique_voters(),
             'popular_questions': [
                 {
                     'id': q.id,
                     'text': q.question_text,
                     'votes': q.total_votes or 0
                 }
-                for q in popular_questions
+                for q, _ in popular_questions
+            ],
+            'trending_questions': [
+                {
+                    'id': q.id,
+                    'text': q.question_text,
+                    'score': round(score, 2)
+                }
+                for q, score in trending_questions
             ]
         }
 
         return Response(data)
 
 
+# Окно ряда по умолчанию для каждого разрешения
+DEFAULT_SPANS = {
+    'minute': datetime.timedelta(hours=1),
+    'hour': datetime.timedelta(days=2),
+    'day': datetime.timedelta(days=30),
+}
+SPAN_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days'}
+
+
+def parse_moment(value):
+    """Момент из ISO 8601 или None; несуществующие даты (30 февраля) — тоже None"""
+    try:
+        moment = parse_datetime(value)
+    except ValueError:
+        return None
+    if moment is not None and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_span(value):
+    """Длина окна: '90m', '24h', '7d' или ISO 8601 / '1 00:00:00'"""
+    match = re.fullmatch(r'(\d+)([mhd])', value)
+    if match:
+        try:
+            return datetime.timedelta(**{SPAN_UNITS[match[2]]: int(match[1])})
+        except OverflowError:
+            return None
+    return parse_duration(value)
+
+
+class QuestionTimeSeriesAPI(APIView):
+    """
+    API для временного ряда голосов по вариантам вопроса.
+
+    Параметры: resolution (minute, hour, day; по умолчанию hour), end
+    (ISO 8601, по умолчанию сейчас) и start либо range ('24h', '7d'...).
+    Читаются только корзины нужного разрешения и ещё не свёрнутый хвост.
+    """
+
+    def get(self, request, question_id):
+        params = request.query_params
+        resolution = params.get('resolution', 'hour')
+        if resolution not in timeseries.RESOLUTIONS:
+            return Response(
+                {'error': f"Разрешение должно быть одним из: {', '.join(timeseries.RESOLUTIONS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        end = parse_moment(params['end']) if 'end' in params else timezone.now()
+        if 'start' in params:
+            start = parse_moment(params['start'])
+        else:
+            span = parse_span(params['range']) if 'range' in params else DEFAULT_SPANS[resolution]
+            try:
+                start = end - span if span is not None and end is not None else None
+            except OverflowError:
+                start = None
+        if start is None or end is None or start >= end:
+            return Response(
+                {'error': 'Некорректный интервал: нужны start < end или положительный range'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        max_points = timeseries.timeseries_settings()['MAX_POINTS']
+        # Число точек оценивается до построения корзин: иначе огромный
+        # интервал сначала строит миллионы меток времени и только потом
+        # получает отказ. Оценка для дней может ошибаться на одну.
+        points = timeseries.bucket_count(resolution, start, end)
+        buckets = timeseries.buckets(resolution, start, end) if points <= max_points + 1 else None
+        if buckets is None or len(buckets) > max_points:
+            return Response(
+                {'error': f'Слишком много точек ({points if buckets is None else len(buckets)}), '
+                          f'не больше {max_points}: сузьте интервал или укрупните разрешение'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        question = get_object_or_404(Question, pk=question_id)
+        choices = question.choice_set.order_by('pk').values_list('pk', 'choice_text')
+        counts = timeseries.series(question_id, resolution, start, end)
+        return Response({
+            'question_id': question.id,
+            'question_text': question.question_text,
+            'resolution': resolution,
+            'start': buckets[0],
+            'end': end,
+            'buckets': buckets,
+            'series': [
+                {
+                    'choice_id': choice_id,
+                    'choice_text': choice_text,
+                    'counts': [counts[choice_id][bucket] for bucket in buckets],
+                }
+                for choice_id, choice_text in choices
+            ],
+        })
+
+
 class ChartAPI(APIView):
-    """API для получения графика в формате SVG"""
+    """API для получения графика в формате SVG (JSON, SVG или PNG байтами)"""
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, SVGRenderer, PNGRenderer]
 
     def get(self, request, question_id):
+        engine = chart_engine(request)
+        if engine not in CHART_ENGINES:
+            return unknown_engine(engine)
         question = get_object_or_404(Question, pk=question_id)
 
         # Получаем данные
-        choices = question.choice_set.all()
+        choices = question.choice_set.with_live_votes()
         choice_texts = [c.choice_text for c in choices]
-        votes = [c.votes for c in choices]
-
-        # Создаем столбчатую диаграмму
-        fig = go.Figure(
-            data=[go.Bar(
-                x=choice_texts,
-                y=votes,
-                text=[f'{v} голосов' for v in votes],
-                textposition='auto',
-                marker_color=['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd'][:len(choices)]
-            )]
-        )
-
-        fig.update_layout(
-            title=f'Результаты: {question.question_text[:50]}...',
-            xaxis_title='Варианты ответа',
-            yaxis_title='Количество голосов',
-            showlegend=False,
-            height=400,
-            margin=dict(l=20, r=20, t=40, b=20)
-        )
-
-        # Конвертируем в SVG
-        svg_string = pio.to_image(fig, format='svg')
+        votes = [c.live_votes for c in choices]
+        title = f'Результаты: {question.question_text[:50]}...'
+        version = data_version(question.question_text, choice_texts, votes)
+
+        if request.accepted_renderer.format in ('svg', 'png'):
+            return image_response(
+                request, question_id, 'bar', 400, engine, version,
+                native=lambda: native_bar(title, choice_texts, votes),
+                figure=lambda: bar_figure(title, choice_texts, votes),
+            )
+
+        if engine == 'native':
+            # Встроенный SVG строится быстрее чтения кэша
+            svg_string = native_bar(title, choice_texts, votes)
+            return Response({'svg': svg_string.decode('utf-8')})
+
+        def render():
+            return to_image(bar_figure(title, choice_texts, votes), 'svg')
+
+        # Повторные запросы с теми же данными отдаются из кэша
+        try:
+            svg_string = cached_chart(question_id, 'bar', 'svg', 400, version, render)
+        except (PoolFull, RenderTimeout) as exc:
+            return render_unavailable(exc)
 
         return Response({'svg': svg_string.decode('utf-8')})
 
 
 class ChartBase64API(APIView):
-    """API для получения графика в формате PNG base64"""
+    """API для получения графика в формате PNG base64 (или PNG/SVG байтами)"""
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, PNGRenderer, SVGRenderer]
 
     def get(self, request, question_id):
-        question = get_object_or_404(Question, pk=question_id)
+        engine = chart_engine(request)
+        if engine not in CHART_ENGINES:
+            return unknown_engine(engine)
+        question = get_object_or_404(Question.objects.with_live_total_votes(), pk=question_id)
 
         # Получаем данные
-        choices = question.choice_set.all()
+        choices = question.choice_set.with_live_votes()
         choice_texts = [c.choice_text for c in choices]
-        votes = [c.votes for c in choices]
+        votes = [c.live_votes for c in choices]
 
         # Создаем круговую диаграмму для процентов
-        total_votes = sum(votes)
+        total_votes = question.live_total_votes
         if total_votes > 0:
             percentages = [(v / total_votes * 100) for v in votes]
             labels = [f'{text} ({perc:.1f}%)'
@@ -142,26 +478,34 @@ class ChartBase64API(APIView):
         else:
             percentages = [0] * len(votes)
             labels = choice_texts
-
-        fig = go.Figure(
-            data=[go.Pie(
-                labels=labels,
-                values=percentages,
-                hole=.3,
-                textinfo='label+percent',
-                marker=dict(colors=['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FECA57'][:len(choices)])
-            )]
-        )
-
-        fig.update_layout(
-            title=f'Распределение голосов: {question.question_text[:40]}...',
-            showlegend=False,
-            height=500,
-            margin=dict(l=20, r=20, t=40, b=20)
-        )
-
-        # Конвертируем в PNG и затем в base64
-        img_bytes = pio.to_image(fig, format='png')
+        title = f'Распределение голосов: {question.question_text[:40]}...'
+        version = data_version(question.question_text, choice_texts, votes)
+
+        if request.accepted_renderer.format in ('svg', 'png'):
+            return image_response(
+                request, question_id, 'pie', 500, engine, version,
+                native=lambda: native_donut(title, choice_texts, votes),
+                figure=lambda: pie_figure(title, labels, percentages),
+            )
+
+        if engine == 'native':
+            # Подписи долей рисует сам график, проценты в них не нужны
+            img_bytes = native_donut(title, choice_texts, votes)
+            return Response({
+                'image': f'data:image/svg+xml;base64,{base64.b64encode(img_bytes).decode("utf-8")}',
+                'question_id': question_id,
+                'question_text': question.question_text,
+                'total_votes': total_votes
+            })
+
+        def render():
+            return to_image(pie_figure(title, labels, percentages), 'png')
+
+        try:
+            img_bytes = cached_chart(question_id, 'pie', 'png', 500, version, render)
+        except (PoolFull, RenderTimeout) as exc:
+            return render_unavailable(exc)
+        # ...и затем в base64
         img_base64 = base64.b64encode(img_bytes).decode('utf-8')
 
         return Response({
@@ -169,4 +513,107 @@ class ChartBase64API(APIView):
             'question_id': question_id,
             'question_text': question.question_text,
             'total_votes': total_votes
-        })
\ No newline at end of file
+        })
+
+
+class ChartDataAPI(APIView):
+    """API для данных графика по столбцам: отрисовка на стороне браузера"""
+
+    def get(self, request, question_id):
+        # Варианты вместе с текстом вопроса — один запрос
+        rows = list(
+            Choice.objects.filter(question_id=question_id)
+            .with_live_votes()
+            .order_by('pk')
+            .values_list('choice_text', 'live_votes', 'question__question_text')
+        )
+        if rows:
+            question_text = rows[0][2]
+        else:
+            # Вопрос без вариантов (или несуществующий) — редкий случай
+            question_text = get_object_or_404(Question, pk=question_id).question_text
+
+        votes = [row[1] for row in rows]
+        total_votes = sum(votes)
+        return Response({
+            'question_id': question_id,
+            'question_text': question_text,
+            'total_votes': total_votes,
+            'labels': [row[0] for row in rows],
+            'votes': votes,
+            'percentages': [
+                round(v / total_votes * 100, 2) if total_votes else 0.0 for v in votes
+            ],
+            'colors': [PIE_COLORS[i % len(PIE_COLORS)] for i in range(len(rows))],
+        })
+
+
+class AnalyticsAPI(APIView):
+    """API для аналитики распределения голосов по всем опросам"""
+
+    def get(self, request):
+        # Все метрики считаются векторно по всем вопросам и кэшируются
+        # (stats_service/analytics.py)
+        return Response(analytics.cached_report())
+
+
+class VoteBufferStatsAPI(APIView):
+    """API для метрик буфера голосов: глубина очереди и время сброса"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        buffer = get_vote_buffer()
+        if buffer is None:
+            return Response({'enabled': False})
+        return Response({'enabled': True, **buffer.metrics()})
+
+
+class IdempotencyStatsAPI(APIView):
+    """API для метрик кэша ключей идемпотентности: размер и доля попаданий"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(get_idempotency_cache().metrics())
+
+
+class IndexCacheStatsAPI(APIView):
+    """API для метрик кэша главной страницы опросов: попадания и промахи"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(index_cache.metrics())
+
+
+class ChartCacheStatsAPI(APIView):
+    """API для метрик дискового кэша графиков: объём, попадания, вытеснения"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        cache = get_chart_cache()
+        if cache is None:
+            return Response({'enabled': False})
+        return Response({'enabled': True, **cache.metrics()})
+
+
+
+class RenderPoolStatsAPI(APIView):
+    """API для метрик пула отрисовки графиков: очередь, отказы, задержки"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        pool = get_render_pool()
+        if pool is None:
+            return Response({'enabled': False})
+        return Response({'enabled': True, **pool.metrics()})
+
+
+class LiveResultsStatsAPI(APIView):
+    """API для метрик потока живых результатов: подписчики и рассылки"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        # Поток ещё не открывали в этом процессе — рассыльщика нет
+        metrics = live.metrics()
+        if metrics is None:
+            return Response({'enabled': False})
+        return Response({'enabled': True, **metrics})
@@ -0,0 +1,5 @@
+from django.apps import AppConfig
+
+class VoteServiceConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'vote_service'
\ No newline at end of file
@@ -0,0 +1,81 @@
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from polls import globalstats
+from polls.models import Choice, Question, Vote
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнение пропускной способности: N голосов через polls:vote "
+        "(по одному POST на голос) и через пакетный API /api/polls/votes/batch/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--votes', type=int, default=2000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        votes = options['votes']
+        user = User.objects.create_user(username=f'bench-{uuid.uuid4().hex[:8]}')
+        # По одному вопросу на голос: пользователь голосует в вопросе один раз
+        questions = Question.objects.bulk_create([
+            Question(question_text=f'bench_vote_batch {i}', pub_date=timezone.now())
+            for i in range(votes)
+        ])
+        choices = Choice.objects.bulk_create([
+            Choice(question=question, choice_text='Да') for question in questions
+        ])
+        client = Client(SERVER_NAME='localhost')
+        client.force_login(user)
+
+        try:
+            started = time.perf_counter()
+            for choice in choices:
+                client.post(
+                    reverse('polls:vote', args=(choice.question_id,)),
+                    {'choice': choice.id},
+                )
+            single = time.perf_counter() - started
+            self._reset(questions, choices)
+
+            entries = [
+                {
+                    'question_id': choice.question_id,
+                    'choice_id': choice.id,
+                    'client_vote_id': uuid.uuid4().hex,
+                }
+                for choice in choices
+            ]
+            size = options['batch_size']
+            started = time.perf_counter()
+            for offset in range(0, votes, size):
+                client.post(
+                    reverse('votes:batch'),
+                    {'votes': entries[offset:offset + size]},
+                    content_type='application/json',
+                )
+            batched = time.perf_counter() - started
+            counted = sum(Choice.objects.filter(pk__in=[c.id for c in choices]).values_list('votes', flat=True))
+        finally:
+            Question.objects.filter(pk__in=[q.id for q in questions]).delete()
+            user.delete()
+            # bulk_create и сброс счётчиков идут мимо сигналов — глобальные
+            # счётчики пересчитываются по таблицам
+            globalstats.reconcile()
+
+        self.stdout.write(f'per-request: {votes / single:10.0f} votes/s ({single:.2f} s)')
+        self.stdout.write(
+            f'batch x{size:<5}: {votes / batched:10.0f} votes/s ({batched:.2f} s, counted {counted})'
+        )
+
+    def _reset(self, questions, choices):
+        Vote.objects.filter(question__in=questions).delete()
+        Choice.objects.filter(pk__in=[c.id for c in choices]).update(votes=0)
+        Question.objects.filter(pk__in=[q.id for q in questions]).update(total_votes=0)
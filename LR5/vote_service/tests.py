@@ -0,0 +1,148 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
+
+from polls.idempotency import IdempotencyCache
+from polls.models import Choice, Question, Vote
+
+
+class BatchVoteAPITests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='kiosk', password='secret')
+        self.client.force_login(self.user)
+        self.question = Question.objects.create(question_text='Кофе или чай?', pub_date=timezone.now())
+        self.coffee = Choice.objects.create(question=self.question, choice_text='Кофе')
+        self.tea = Choice.objects.create(question=self.question, choice_text='Чай')
+        self.url = reverse('votes:batch')
+        self.idempotency_cache = IdempotencyCache()
+        patcher = mock.patch('polls.voting.get_idempotency_cache', return_value=self.idempotency_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, votes):
+        return self.client.post(self.url, {'votes': votes}, content_type='application/json')
+
+    def test_batch_is_applied_with_per_item_status(self):
+        future = Question.objects.create(
+            question_text='Будущий', pub_date=timezone.now() + timedelta(days=1)
+        )
+        other = Choice.objects.create(question=future, choice_text='Да')
+        response = self.post([
+            {'question_id': self.question.id, 'choice_id': self.coffee.id, 'client_vote_id': 'a'},
+            {'question_id': self.question.id, 'choice_id': self.coffee.id, 'client_vote_id': 'b'},
+            {'question_id': self.question.id, 'choice_id': self.tea.id, 'client_vote_id': 'c'},
+            {'question_id': self.question.id, 'choice_id': self.tea.id, 'client_vote_id': 'a'},
+            {'question_id': self.question.id, 'choice_id': other.id, 'client_vote_id': 'd'},
+            {'question_id': future.id, 'choice_id': other.id, 'client_vote_id': 'e'},
+            {'question_id': self.question.id, 'client_vote_id': 'f'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['applied'], 3)
+        self.assertEqual(
+            [r['status'] for r in response.data['results']],
+            ['applied', 'applied', 'applied', 'duplicate', 'invalid', 'invalid', 'invalid'],
+        )
+        self.coffee.refresh_from_db()
+        self.tea.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual((self.coffee.votes, self.tea.votes, self.question.total_votes), (2, 1, 3))
+        self.assertEqual(Vote.objects.filter(user=None).count(), 3)
+
+    def test_replayed_batch_is_not_counted_twice(self):
+        votes = [{'question_id': self.question.id, 'choice_id': self.tea.id, 'client_vote_id': 'x'}]
+        self.post(votes)
+        response = self.post(votes)
+        self.assertEqual(response.data['results'][0]['status'], 'duplicate')
+        self.tea.refresh_from_db()
+        self.assertEqual(self.tea.votes, 1)
+        # Повтор распознан по кэшу, без запроса к журналу
+        self.assertEqual(self.idempotency_cache.metrics()['hits'], 1)
+
+    def test_duplicate_known_only_to_ledger(self):
+        votes = [{'question_id': self.question.id, 'choice_id': self.tea.id, 'client_vote_id': 'y'}]
+        self.post(votes)
+        self.idempotency_cache = IdempotencyCache()
+        with mock.patch('polls.voting.get_idempotency_cache', return_value=self.idempotency_cache):
+            response = self.post(votes)
+        self.assertEqual(response.data['results'][0]['status'], 'duplicate')
+
+    def test_query_count_does_not_grow_with_batch(self):
+        votes = [
+            {'question_id': self.question.id, 'choice_id': self.coffee.id, 'client_vote_id': str(i)}
+            for i in range(150)
+        ]
+        # сессия и пользователь, три проверки, одна вставка, три UPDATE
+        # (варианты, вопросы, глобальный счётчик) и savepoint'ы
+        # Слот глобального счётчика — уже существующая строка 1: создание
+        # нового слота бывает лишь один раз за жизнь базы
+        with self.assertNumQueries(13), mock.patch('polls.globalstats.random.randint', return_value=1):
+            response = self.post(votes)
+        self.assertEqual(response.data['applied'], 150)
+
+    def test_malformed_ids_are_invalid_per_item(self):
+        response = self.post([
+            {'question_id': self.question.id, 'choice_id': self.tea.id, 'client_vote_id': None},
+            {'question_id': self.question.id, 'choice_id': self.tea.id, 'client_vote_id': None},
+            {'question_id': self.question.id, 'choice_id': self.tea.id, 'client_vote_id': 7},
+            {'question_id': 10 ** 23, 'choice_id': self.tea.id, 'client_vote_id': 'big'},
+            {'question_id': self.question.id, 'choice_id': self.tea.id, 'client_vote_id': 'ok'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [r['status'] for r in response.data['results']],
+            ['invalid', 'invalid', 'invalid', 'invalid', 'applied'],
+        )
+
+    def test_rejects_non_list_payload(self):
+        response = self.post('nope')
+        self.assertEqual(response.status_code, 400)
+
+
+class QuestionListAPITests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='reader', password='secret'))
+        now = timezone.now()
+        self.questions = [
+            Question.objects.create(question_text=f'Вопрос {i}', pub_date=now - timedelta(hours=i))
+            for i in range(5)
+        ]
+        Question.objects.create(question_text='Будущий', pub_date=now + timedelta(days=1))
+        self.url = reverse('votes:questions')
+
+    def test_cursor_walks_all_pages(self):
+        ids, params = [], {'limit': 2}
+        while True:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            ids += [q['id'] for q in response.json()['results']]
+            if response.json()['next_cursor'] is None:
+                break
+            params['cursor'] = response.json()['next_cursor']
+        self.assertEqual(ids, [q.id for q in self.questions])
+
+    def test_bad_parameters(self):
+        for params in ({'limit': 0}, {'limit': 'x'}, {'cursor': 'garbage'}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 400)
+
+
+class QuestionSearchAPITests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='reader', password='secret'))
+        self.question = Question.objects.create(question_text='Кофе или чай?', pub_date=timezone.now())
+        Choice.objects.create(question=self.question, choice_text='Капучино')
+        self.url = reverse('votes:search')
+
+    def test_search(self):
+        response = self.client.get(self.url, {'q': 'капуч'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([q['id'] for q in response.json()['results']], [self.question.id])
+        self.assertEqual(self.client.get(self.url, {'q': 'какао'}).json()['results'], [])
+
+    def test_bad_parameters(self):
+        for params in ({}, {'q': 'чай', 'limit': 0}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400)
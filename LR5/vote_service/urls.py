@@ -0,0 +1,10 @@
+from django.urls import path
+from . import views
+
+app_name = 'votes'
+
+urlpatterns = [
+    path('votes/batch/', views.BatchVoteAPI.as_view(), name='batch'),
+    path('questions/', views.QuestionListAPI.as_view(), name='questions'),
+    path('questions/search/', views.QuestionSearchAPI.as_view(), name='search'),
+]
\ No newline at end of file
@@ -0,0 +1,93 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from django.conf import settings
+from polls.pagination import InvalidCursor, question_page
+from polls.search import search_questions, search_settings
+from polls.voting import cast_votes
+
+
+class BatchVoteAPI(APIView):
+    """API для пакетной загрузки голосов, собранных офлайн (киоски, мобильные клиенты)"""
+
+    def post(self, request):
+        # Принимаем как {"votes": [...]}, так и просто список
+        entries = request.data.get('votes') if isinstance(request.data, dict) else request.data
+        if not isinstance(entries, list):
+            return Response(
+                {'error': 'Ожидается список голосов в поле "votes"'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        max_batch = getattr(settings, 'POLLS_VOTE_BATCH_MAX', 5000)
+        if len(entries) > max_batch:
+            return Response(
+                {'error': f'Слишком много голосов в пакете (максимум {max_batch})'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = cast_votes(entries)
+
+        return Response({
+            'received': len(entries),
+            'applied': sum(1 for r in results if r['status'] == 'applied'),
+            'results': results,
+        })
+
+
+class QuestionListAPI(APIView):
+    """API для постраничного списка опубликованных вопросов (keyset-пагинация по курсору)"""
+
+    def get(self, request):
+        try:
+            limit = min(int(request.GET.get('limit', settings.POLLS_QUESTION_PAGE_SIZE)), 100)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return Response({'error': 'limit должен быть от 1 до 100'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            questions, next_cursor = question_page(request.GET.get('cursor'), size=limit)
+        except InvalidCursor:
+            return Response({'error': 'Неверный курсор'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'results': [
+                {
+                    'id': q.id,
+                    'question_text': q.question_text,
+                    'pub_date': q.pub_date,
+                    'total_votes': q.total_votes,
+                }
+                for q in questions
+            ],
+            'next_cursor': next_cursor,
+        })
+
+
+class QuestionSearchAPI(APIView):
+    """API полнотекстового поиска по вопросам и вариантам ответа (префиксный, с ранжированием)"""
+
+    def get(self, request):
+        query = request.GET.get('q', '').strip()
+        if not query:
+            return Response({'error': 'Не задан параметр q'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.GET.get('limit', search_settings()['LIMIT'])), 100)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return Response({'error': 'limit должен быть от 1 до 100'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'query': query,
+            'results': [
+                {
+                    'id': q.id,
+                    'question_text': q.question_text,
+                    'pub_date': q.pub_date,
+                    'total_votes': q.total_votes,
+                }
+                for q in search_questions(query, limit=limit)
+            ],
+        })